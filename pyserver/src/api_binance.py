@@ -1,11 +1,12 @@
 import os
 import logging
 import asyncio
+from contextlib import closing
 import pandas as pd
 
 from binance import Client
 from constants import BINANCE_DATA_COLS, AppConstants, DomEventChannels
-from db import create_connection
+from db import create_connection, get_column_names
 from log import LogExceptionContext, get_logger
 from query_dataset import DatasetQuery
 
@@ -13,9 +14,13 @@ from query_dataset import DatasetQuery
 APP_DATA_PATH = os.getenv("APP_DATA_PATH", "")
 
 
-async def get_historical_klines(symbol, interval):
+KLINES_DOWNLOAD_START_TIME = "1 Jan, 2017"
+
+
+async def get_historical_klines(
+    symbol, interval, start_time: str | int = KLINES_DOWNLOAD_START_TIME
+):
     client = Client()
-    start_time = "1 Jan, 2017"
     klines = []
 
     while True:
@@ -39,33 +44,102 @@ async def get_historical_klines(symbol, interval):
     return df
 
 
-async def save_historical_klines(symbol, interval):
-    with LogExceptionContext(notification_duration=60000):
-        logger = get_logger()
-        datasets_conn = create_connection(AppConstants.DB_DATASETS)
-        klines = await get_historical_klines(symbol, interval)
-        interval = "1mo" if interval == "1M" else interval
-
-        table_name = symbol.lower() + "_" + interval
-
-        table_exists_query = (
-            f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}'"
+def get_klines_table_name(symbol, interval):
+    interval = "1mo" if interval == "1M" else interval
+    return symbol.lower() + "_" + interval
+
+
+async def append_new_klines(symbol, interval, table_name, datasets_conn):
+    """Fetches the klines from the last stored candle onwards. The last stored
+    candle may have been downloaded before it closed, so its kline columns are
+    updated in place, which leaves the columns added by the user untouched, and
+    only the newer candles are appended. Both writes are one transaction."""
+    cursor = datasets_conn.cursor()
+    cursor.execute(f"SELECT MAX(kline_open_time) FROM {table_name}")
+    last_open_time = cursor.fetchone()[0]
+    if last_open_time is None:
+        return None
+
+    klines = await get_historical_klines(symbol, interval, int(last_open_time))
+    table_columns = get_column_names(datasets_conn, table_name)
+    klines = klines[[col for col in klines.columns if col in table_columns]]
+    last_kline = klines[klines["kline_open_time"] == last_open_time]
+    new_klines = klines[klines["kline_open_time"] > last_open_time]
+
+    update_columns = [col for col in klines.columns if col != "kline_open_time"]
+    set_columns_str = ", ".join(f'"{col}" = ?' for col in update_columns)
+    insert_columns_str = ", ".join(f'"{col}"' for col in klines.columns)
+    placeholders_str = ", ".join("?" for _ in klines.columns)
+
+    try:
+        cursor.execute("BEGIN")
+        cursor.executemany(
+            f"UPDATE {table_name} SET {set_columns_str} WHERE kline_open_time = ?",
+            zip(
+                *[
+                    last_kline[col].tolist()
+                    for col in update_columns + ["kline_open_time"]
+                ]
+            ),
         )
-        cursor = datasets_conn.cursor()
-        cursor.execute(table_exists_query)
-        if cursor.fetchone():
-            logger.log(f"Table {table_name} already exists.", logging.INFO)
-            DatasetQuery.delete_entry_by_dataset_name(table_name)
-
-        klines.to_sql(table_name, datasets_conn, if_exists="replace", index=False)
-        DatasetQuery.create_dataset_entry(table_name, "kline_open_time")
-        logger.log(
-            f"Downloaded klines on {symbol} with {interval} interval",
-            logging.INFO,
-            True,
-            True,
-            DomEventChannels.REFETCH_ALL_DATASETS.value,
+        cursor.executemany(
+            f"INSERT INTO {table_name} ({insert_columns_str}) VALUES ({placeholders_str})",
+            zip(*[new_klines[col].tolist() for col in klines.columns]),
         )
+        datasets_conn.commit()
+    except Exception:
+        datasets_conn.rollback()
+        raise
+
+    DatasetQuery.bump_data_version(table_name)
+    return len(new_klines)
+
+
+async def save_historical_klines(symbol, interval, update_existing=False):
+    with LogExceptionContext(notification_duration=60000):
+        logger = get_logger()
+        with closing(create_connection(AppConstants.DB_DATASETS)) as datasets_conn:
+            table_name = get_klines_table_name(symbol, interval)
+
+            table_exists_query = f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}'"
+            cursor = datasets_conn.cursor()
+            cursor.execute(table_exists_query)
+            table_exists = cursor.fetchone() is not None
+
+            if (
+                update_existing
+                and table_exists
+                and DatasetQuery.fetch_dataset_by_name(table_name) is not None
+            ):
+                new_kline_count = await append_new_klines(
+                    symbol, interval, table_name, datasets_conn
+                )
+                if new_kline_count is not None:
+                    logger.log(
+                        f"Appended {new_kline_count} new klines to {table_name}",
+                        logging.INFO,
+                        True,
+                        True,
+                        DomEventChannels.REFETCH_ALL_DATASETS.value,
+                    )
+                    return
+
+            klines = await get_historical_klines(symbol, interval)
+            interval = "1mo" if interval == "1M" else interval
+
+            if table_exists:
+                logger.log(f"Table {table_name} already exists.", logging.INFO)
+                DatasetQuery.delete_entry_by_dataset_name(table_name)
+
+            klines.to_sql(table_name, datasets_conn, if_exists="replace", index=False)
+            DatasetQuery.create_dataset_entry(table_name, "kline_open_time")
+            logger.log(
+                f"Downloaded klines on {symbol} with {interval} interval",
+                logging.INFO,
+                True,
+                True,
+                DomEventChannels.REFETCH_ALL_DATASETS.value,
+            )
 
 
 def get_all_tickers():
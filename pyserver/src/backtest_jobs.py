@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from constants import Signals
+from log import get_logger
+from query_backtest_job import BacktestJobQuery, BacktestJobStatus
+
+
+MAX_CONCURRENT_BACKTEST_JOBS = 4
+
+
+class BacktestJobCancelled(Exception):
+    def __init__(self, job_id: int) -> None:
+        super().__init__(f"Backtest job {job_id} was cancelled")
+
+
+def reraise_job_cancellation(e: Exception):
+    """LogExceptionContext custom_handler that lets a cancellation through without
+    logging it as an error."""
+    if isinstance(e, BacktestJobCancelled):
+        raise e
+    return False
+
+
+def send_job_progress(
+    job_id: int,
+    status: str,
+    progress_perc: float,
+    backtest_id: Optional[int] = None,
+):
+    logger = get_logger()
+    logger.log(
+        Signals.BACKTEST_PROGRESS.format(
+            JOB_ID=job_id,
+            STATUS=status,
+            PROGRESS_PERC=round(progress_perc, 2),
+            BACKTEST_ID=backtest_id if backtest_id is not None else "",
+        ),
+        logging.DEBUG,
+    )
+
+
+def get_backtest_job_fields(backtest):
+    return {"backtest_id": backtest.id}
+
+
+def get_json_result_job_fields(result):
+    """For jobs that do not create a single backtest, their result is stored on
+    the job as JSON."""
+    return {"result": json.dumps(result)}
+
+
+class BacktestJobQueue:
+    """Runs backtests on a bounded pool of worker threads so that the event loop stays free.
+
+    Jobs report their progress through the log websocket and are cancelled cooperatively:
+    the progress callback handed to the backtest raises BacktestJobCancelled once the job
+    has been cancelled.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="backtest_job"
+        )
+        self.lock = threading.Lock()
+        self.futures: Dict[int, Future] = {}
+        self.cancel_events: Dict[int, threading.Event] = {}
+
+    def submit(
+        self,
+        job_type: str,
+        name: Optional[str],
+        run_backtest: Callable,
+        body,
+        get_job_fields: Callable = get_backtest_job_fields,
+    ):
+        """run_backtest is called as run_backtest(body, progress_callback) and returns
+        the created backtest. get_job_fields turns its return value into the fields
+        stored on the completed job."""
+        job_id = BacktestJobQuery.create_entry(
+            {
+                "job_type": job_type,
+                "name": name,
+                "status": BacktestJobStatus.QUEUED,
+                "progress_perc": 0.0,
+            }
+        )
+        cancel_event = threading.Event()
+
+        with self.lock:
+            self.cancel_events[job_id] = cancel_event
+            self.futures[job_id] = self.executor.submit(
+                self.run_job,
+                job_id,
+                run_backtest,
+                body,
+                get_job_fields,
+                cancel_event,
+            )
+
+        send_job_progress(job_id, BacktestJobStatus.QUEUED, 0.0)
+        return job_id
+
+    def run_job(
+        self,
+        job_id: int,
+        run_backtest: Callable,
+        body,
+        get_job_fields: Callable,
+        cancel_event: threading.Event,
+    ):
+        def on_progress(progress: float):
+            if cancel_event.is_set():
+                raise BacktestJobCancelled(job_id)
+            BacktestJobQuery.update_job(job_id, {"progress_perc": progress * 100})
+            send_job_progress(job_id, BacktestJobStatus.RUNNING, progress * 100)
+
+        try:
+            if cancel_event.is_set():
+                raise BacktestJobCancelled(job_id)
+
+            BacktestJobQuery.update_job(job_id, {"status": BacktestJobStatus.RUNNING})
+            send_job_progress(job_id, BacktestJobStatus.RUNNING, 0.0)
+
+            job_fields = get_job_fields(run_backtest(body, on_progress))
+
+            BacktestJobQuery.update_job(
+                job_id,
+                {
+                    "status": BacktestJobStatus.COMPLETED,
+                    "progress_perc": 100.0,
+                    **job_fields,
+                },
+            )
+            send_job_progress(
+                job_id,
+                BacktestJobStatus.COMPLETED,
+                100.0,
+                job_fields.get("backtest_id"),
+            )
+        except BacktestJobCancelled:
+            BacktestJobQuery.update_job(job_id, {"status": BacktestJobStatus.CANCELLED})
+            send_job_progress(job_id, BacktestJobStatus.CANCELLED, 0.0)
+        except Exception as e:
+            BacktestJobQuery.update_job(
+                job_id, {"status": BacktestJobStatus.FAILED, "error": str(e)}
+            )
+            send_job_progress(job_id, BacktestJobStatus.FAILED, 0.0)
+        finally:
+            with self.lock:
+                self.futures.pop(job_id, None)
+                self.cancel_events.pop(job_id, None)
+
+    def cancel(self, job_id: int):
+        with self.lock:
+            cancel_event = self.cancel_events.get(job_id)
+            future = self.futures.get(job_id)
+
+        if cancel_event is None:
+            return False
+
+        cancel_event.set()
+        if future is not None and future.cancel():
+            # the job never started, so run_job will not record the cancellation
+            with self.lock:
+                self.futures.pop(job_id, None)
+                self.cancel_events.pop(job_id, None)
+            BacktestJobQuery.update_job(job_id, {"status": BacktestJobStatus.CANCELLED})
+            send_job_progress(job_id, BacktestJobStatus.CANCELLED, 0.0)
+        return True
+
+    async def run(self, func: Callable, *args):
+        """Awaits func(*args) on the worker pool."""
+        return await asyncio.wrap_future(self.executor.submit(func, *args))
+
+
+backtest_job_queue = BacktestJobQueue(MAX_CONCURRENT_BACKTEST_JOBS)
+
+
+def get_backtest_job_queue():
+    return backtest_job_queue
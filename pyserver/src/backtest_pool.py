@@ -0,0 +1,178 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+import numpy as np
+
+from backtest_simulation import SimulationConfig, simulate
+
+
+_worker_data: Dict = {}
+
+
+def create_simulation_task(
+    params: Dict,
+    data_range_start: int,
+    data_range_end: int,
+    asset_starting_price: float,
+    asset_closing_price: float,
+    save_balance_history: bool = False,
+    save_trades: bool = False,
+):
+    return {
+        "params": params,
+        "data_range": (data_range_start, data_range_end),
+        "asset_prices": (asset_starting_price, asset_closing_price),
+        "save_balance_history": save_balance_history,
+        "save_trades": save_trades,
+    }
+
+
+def get_task_config(base_config: SimulationConfig, params: Dict):
+    config = copy(base_config)
+    if "trading_fees_perc" in params:
+        config.fees = 1 - (params["trading_fees_perc"] / 100)
+    if "take_profit_threshold_perc" in params:
+        config.take_profit_threshold_perc = params["take_profit_threshold_perc"]
+    if "stop_loss_threshold_perc" in params:
+        config.stop_loss_threshold_perc = params["stop_loss_threshold_perc"]
+    if "klines_until_close" in params:
+        config.max_klines_until_close = (
+            params["klines_until_close"] if params["klines_until_close"] else -1
+        )
+    return config
+
+
+def to_shared_memory(arr: np.ndarray):
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+    return shm
+
+
+def init_simulation_worker(
+    prices_shm_name: str,
+    signals_shm_name: str,
+    row_count: int,
+    kline_open_times: List,
+    base_config: SimulationConfig,
+    high_low_shm_name: Optional[str] = None,
+):
+    prices_shm = shared_memory.SharedMemory(name=prices_shm_name)
+    signals_shm = shared_memory.SharedMemory(name=signals_shm_name)
+
+    _worker_data["shared_memory"] = (prices_shm, signals_shm)
+    _worker_data["prices"] = np.ndarray(
+        (row_count,), dtype=np.float64, buffer=prices_shm.buf
+    )
+    _worker_data["signals"] = np.ndarray(
+        (4, row_count), dtype=bool, buffer=signals_shm.buf
+    )
+    _worker_data["kline_open_times"] = kline_open_times
+    _worker_data["base_config"] = base_config
+    _worker_data["high_low_prices"] = None
+
+    if high_low_shm_name is not None:
+        high_low_shm = shared_memory.SharedMemory(name=high_low_shm_name)
+        _worker_data["shared_memory"] += (high_low_shm,)
+        _worker_data["high_low_prices"] = np.ndarray(
+            (2, row_count), dtype=np.float64, buffer=high_low_shm.buf
+        )
+
+
+def run_simulation_task(task: Dict):
+    data_range = slice(*task["data_range"])
+    high_low_prices = _worker_data["high_low_prices"]
+    high_prices, low_prices = (
+        high_low_prices[:, data_range] if high_low_prices is not None else (None, None)
+    )
+    result = simulate(
+        get_task_config(_worker_data["base_config"], task["params"]),
+        _worker_data["prices"][data_range],
+        _worker_data["kline_open_times"][data_range],
+        *_worker_data["signals"][:, data_range],
+        high_prices=high_prices,
+        low_prices=low_prices,
+    )
+
+    return {
+        "params": task["params"],
+        "data_range": task["data_range"],
+        "summary": result.get_summary(*task["asset_prices"]),
+        "balance_history": result.get_balance_history_columns()
+        if task["save_balance_history"]
+        else None,
+        # without a stored balance history the trades carry their own price series
+        "trades": result.get_trades(include_series=not task["save_balance_history"])
+        if task["save_trades"]
+        else None,
+    }
+
+
+def map_in_process_pool(
+    task_func, tasks: List, initializer, initargs: tuple, progress_callback=None
+):
+    """progress_callback is called with the share of finished tasks. If it raises,
+    the tasks that have not started yet are cancelled."""
+    if len(tasks) == 0:
+        return []
+
+    max_workers = min(os.cpu_count() or 1, len(tasks))
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=initializer, initargs=initargs
+    ) as executor:
+        results = []
+        try:
+            for result in executor.map(
+                task_func,
+                tasks,
+                chunksize=max(1, len(tasks) // (max_workers * 4)),
+            ):
+                results.append(result)
+                if progress_callback is not None:
+                    progress_callback(len(results) / len(tasks))
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+        return results
+
+
+def run_simulation_tasks(
+    tasks: List[Dict],
+    prices: np.ndarray,
+    kline_open_times: List,
+    signals,
+    base_config: SimulationConfig,
+    high_prices: Optional[np.ndarray] = None,
+    low_prices: Optional[np.ndarray] = None,
+):
+    prices_shm = to_shared_memory(np.asarray(prices, dtype=np.float64))
+    signals_shm = to_shared_memory(np.stack(signals))
+    shms = [prices_shm, signals_shm]
+    high_low_shm_name = None
+
+    if high_prices is not None and low_prices is not None:
+        high_low_shm = to_shared_memory(
+            np.stack([high_prices, low_prices]).astype(np.float64)
+        )
+        shms.append(high_low_shm)
+        high_low_shm_name = high_low_shm.name
+
+    try:
+        return map_in_process_pool(
+            run_simulation_task,
+            tasks,
+            init_simulation_worker,
+            (
+                prices_shm.name,
+                signals_shm.name,
+                len(prices),
+                kline_open_times,
+                base_config,
+                high_low_shm_name,
+            ),
+        )
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,623 @@
+from typing import List, Optional
+import numpy as np
+
+from backtest_utils import BacktestMetrics
+from constants import Direction
+
+
+DIRECTION_CODES = {Direction.LONG: 1, Direction.SHORT: -1}
+DIRECTIONS_BY_CODE = {code: direction for direction, code in DIRECTION_CODES.items()}
+THRESHOLD_SEARCH_WINDOW = 64
+PROGRESS_UPDATE_COUNT = 20
+
+
+class SimulationConfig:
+    def __init__(
+        self,
+        start_balance: float,
+        fees: float,
+        slippage: float,
+        short_fee_coeff: float = 1,
+        use_short_selling: bool = True,
+        use_time_based_close: bool = False,
+        max_klines_until_close: int = -1,
+        use_profit_based_close: bool = False,
+        take_profit_threshold_perc: float = 0.0,
+        use_stop_loss_based_close: bool = False,
+        stop_loss_threshold_perc: float = 0.0,
+        candles_time_delta: float = 0.0,
+        use_intra_candle_thresholds: bool = False,
+    ) -> None:
+        self.start_balance = start_balance
+        self.fees = fees
+        self.slippage = slippage
+        self.short_fee_coeff = short_fee_coeff
+        self.use_short_selling = use_short_selling
+        self.use_time_based_close = use_time_based_close
+        self.max_klines_until_close = max_klines_until_close
+        self.use_profit_based_close = use_profit_based_close
+        self.take_profit_threshold_perc = take_profit_threshold_perc
+        self.use_stop_loss_based_close = use_stop_loss_based_close
+        self.stop_loss_threshold_perc = stop_loss_threshold_perc
+        self.candles_time_delta = candles_time_delta
+        self.use_intra_candle_thresholds = use_intra_candle_thresholds
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @staticmethod
+    def from_dict(fields: dict):
+        return SimulationConfig(**fields)
+
+
+class SimulationState:
+    def __init__(self, start_balance: float) -> None:
+        self.cash = start_balance
+        self.position = 0.0
+        self.short_debt = 0.0
+        self.total_positions_value = 0.0
+        self.buy_and_hold_position: Optional[float] = None
+
+        self.enter_trade_price = 0.0
+        self.enter_trade_time = 0
+        self.enter_trade_balance = 0.0
+        self.enter_trade_idx = 0
+
+        self.pos_open_klines = 0
+        self.threshold_close_price: Optional[float] = None
+        self.metrics = BacktestMetrics(start_balance)
+
+    def to_dict(self):
+        return {**self.__dict__, "metrics": self.metrics.to_dict()}
+
+    @staticmethod
+    def from_dict(fields: dict):
+        fields = dict(fields)
+        metrics = fields.pop("metrics")
+        state = SimulationState(fields["cash"])
+        state.__dict__.update(fields)
+        state.metrics = BacktestMetrics.from_dict(metrics)
+        return state
+
+
+class SimulationCheckpoint:
+    def __init__(
+        self, state: SimulationState, kline_idx: int, trade_count: int
+    ) -> None:
+        self.state = state
+        self.kline_idx = kline_idx
+        self.trade_count = trade_count
+
+
+class SimulationResult:
+    def __init__(
+        self,
+        config: SimulationConfig,
+        state: SimulationState,
+        prices: np.ndarray,
+        kline_open_times: List,
+        portfolio_worth: np.ndarray,
+        buy_and_hold_worth: np.ndarray,
+        cash: np.ndarray,
+        position: np.ndarray,
+        short_debt: np.ndarray,
+        trades: dict,
+        checkpoint: Optional[SimulationCheckpoint] = None,
+    ) -> None:
+        self.config = config
+        self.state = state
+        self.prices = prices
+        self.kline_open_times = kline_open_times
+        self.portfolio_worth = portfolio_worth
+        self.buy_and_hold_worth = buy_and_hold_worth
+        self.cash = cash
+        self.position = position
+        self.short_debt = short_debt
+        self.trades = trades
+        self.checkpoint = checkpoint
+
+    def get_summary(self, asset_starting_price=None, asset_closing_price=None):
+        return self.state.metrics.get_summary(asset_starting_price, asset_closing_price)
+
+    def get_balance_history_columns(self, predictions: Optional[List] = None):
+        return {
+            "portfolio_worth": self.portfolio_worth,
+            "buy_and_hold_worth": self.buy_and_hold_worth,
+            "prediction": np.asarray(predictions, dtype=np.float64)
+            if predictions is not None
+            else np.zeros(len(self.prices), dtype=np.int64),
+            "kline_open_time": np.asarray(self.kline_open_times, dtype=np.int64),
+            "position": self.position,
+            "short_debt": self.short_debt,
+            "cash": self.cash,
+            "price": self.prices,
+        }
+
+    def get_balance_history(self, predictions: Optional[List] = None):
+        predictions = predictions if predictions is not None else [0] * len(self.prices)
+        return [
+            {
+                "portfolio_worth": portfolio_worth,
+                "buy_and_hold_worth": buy_and_hold_worth,
+                "prediction": prediction,
+                "kline_open_time": kline_open_time,
+                "position": position,
+                "short_debt": short_debt,
+                "cash": cash,
+                "price": price,
+            }
+            for (
+                portfolio_worth,
+                buy_and_hold_worth,
+                prediction,
+                kline_open_time,
+                position,
+                short_debt,
+                cash,
+                price,
+            ) in zip(
+                self.portfolio_worth.tolist(),
+                self.buy_and_hold_worth.tolist(),
+                predictions,
+                self.kline_open_times,
+                self.position.tolist(),
+                self.short_debt.tolist(),
+                self.cash.tolist(),
+                self.prices.tolist(),
+            )
+        ]
+
+    def get_trades(
+        self,
+        predictions: Optional[List] = None,
+        idx_offset: int = 0,
+        include_series: bool = True,
+    ):
+        """Trades as dicts. open_idx and close_idx point into the balance history, shifted by
+        idx_offset; the per-trade price and prediction lists are only built with include_series.
+        """
+        prices = self.prices.tolist()
+        ret = []
+
+        for (
+            open_idx,
+            close_idx,
+            direction,
+            open_time,
+            close_time,
+            open_price,
+            close_price,
+            net_result,
+            percent_result,
+        ) in zip(
+            self.trades["open_idx"].tolist(),
+            self.trades["close_idx"].tolist(),
+            self.trades["direction"].tolist(),
+            self.trades["open_time"],
+            self.trades["close_time"],
+            self.trades["open_price"].tolist(),
+            self.trades["close_price"].tolist(),
+            self.trades["net_result"].tolist(),
+            self.trades["percent_result"].tolist(),
+        ):
+            trade = {
+                "open_price": open_price,
+                "close_price": close_price,
+                "open_time": open_time,
+                "close_time": close_time,
+                "direction": DIRECTIONS_BY_CODE[direction],
+                "net_result": net_result,
+                "percent_result": percent_result,
+                "open_idx": open_idx + idx_offset,
+                "close_idx": close_idx + idx_offset,
+            }
+            if include_series:
+                trade["predictions"] = (
+                    predictions[max(open_idx, 0) : close_idx + 1]
+                    if predictions is not None
+                    else [0]
+                )
+                trade["prices"] = prices[max(open_idx, 0) : close_idx + 1]
+            ret.append(trade)
+        return ret
+
+
+def get_threshold_prices(
+    config: SimulationConfig, enter_trade_price: float, is_long: bool
+):
+    take_profit = config.take_profit_threshold_perc / 100
+    stop_loss = config.stop_loss_threshold_perc / 100
+    if is_long:
+        return (
+            enter_trade_price * (1 + take_profit)
+            if config.use_profit_based_close
+            else np.inf,
+            enter_trade_price * (1 - stop_loss)
+            if config.use_stop_loss_based_close
+            else -np.inf,
+        )
+    return (
+        enter_trade_price * (1 - take_profit)
+        if config.use_profit_based_close
+        else -np.inf,
+        enter_trade_price * (1 + stop_loss)
+        if config.use_stop_loss_based_close
+        else np.inf,
+    )
+
+
+def get_first_threshold_hit(
+    prices: np.ndarray,
+    high_prices: np.ndarray,
+    low_prices: np.ndarray,
+    start_idx: int,
+    is_long: bool,
+    take_profit_price: float,
+    stop_loss_price: float,
+):
+    """Index of the first kline from start_idx whose high/low range reaches the take profit
+    or stop loss price, and the price the position is closed at.
+
+    The price column is taken as the first traded price of its kline, so a kline that opens
+    past a threshold closes at that price instead. A kline reaching both thresholds is
+    assumed to hit the stop loss first. The search scans windows of doubling size so short
+    trades only touch a few klines. Returns (len(prices), None) when nothing is hit.
+    """
+    n = len(prices)
+    window = THRESHOLD_SEARCH_WINDOW
+
+    while start_idx < n:
+        end_idx = min(start_idx + window, n)
+        if is_long:
+            stop_loss_hits = low_prices[start_idx:end_idx] <= stop_loss_price
+            take_profit_hits = high_prices[start_idx:end_idx] >= take_profit_price
+        else:
+            stop_loss_hits = high_prices[start_idx:end_idx] >= stop_loss_price
+            take_profit_hits = low_prices[start_idx:end_idx] <= take_profit_price
+
+        hits = stop_loss_hits | take_profit_hits
+        if hits.any():
+            offset = int(hits.argmax())
+            price = prices[start_idx + offset]
+            if stop_loss_hits[offset]:
+                close_price = (
+                    min(price, stop_loss_price)
+                    if is_long
+                    else max(price, stop_loss_price)
+                )
+            else:
+                close_price = (
+                    max(price, take_profit_price)
+                    if is_long
+                    else min(price, take_profit_price)
+                )
+            return start_idx + offset, float(close_price)
+
+        start_idx = end_idx
+        window *= 2
+
+    return n, None
+
+
+def simulate(
+    config: SimulationConfig,
+    prices,
+    kline_open_times,
+    should_open_long,
+    should_open_short,
+    should_close_long,
+    should_close_short,
+    state: Optional[SimulationState] = None,
+    checkpoint_idx: Optional[int] = None,
+    high_prices=None,
+    low_prices=None,
+    progress_callback=None,
+):
+    """Runs the position state machine of ManualBacktest.tick over precomputed signal arrays.
+
+    Balances are recorded before the trades of each kline are executed, the same way
+    Positions.update_balance records them. Pass the state of a previous run to continue it.
+    With checkpoint_idx the state before that kline is captured so the run can later be
+    resumed from there.
+
+    With config.use_intra_candle_thresholds the take profit and stop loss are checked
+    against high_prices and low_prices instead of the price column. The kline that closes
+    a position is looked up once when it is opened, see get_first_threshold_hit.
+
+    progress_callback is called with the completed share of the klines
+    PROGRESS_UPDATE_COUNT times during the run.
+    """
+    state = state if state is not None else SimulationState(config.start_balance)
+    prices = np.asarray(prices, dtype=np.float64)
+    kline_open_times = list(kline_open_times)
+    n = len(prices)
+
+    portfolio_worth_arr = np.empty(n, dtype=np.float64)
+    buy_and_hold_worth_arr = np.empty(n, dtype=np.float64)
+    cash_arr = np.empty(n, dtype=np.float64)
+    position_arr = np.empty(n, dtype=np.float64)
+    short_debt_arr = np.empty(n, dtype=np.float64)
+
+    trade_open_idx: List[int] = []
+    trade_close_idx: List[int] = []
+    trade_direction: List[int] = []
+    trade_open_time: List = []
+    trade_close_time: List = []
+    trade_open_price: List[float] = []
+    trade_close_price: List[float] = []
+    trade_net_result: List[float] = []
+    trade_percent_result: List[float] = []
+
+    should_open_long = np.asarray(should_open_long, dtype=bool).tolist()
+    should_open_short = np.asarray(should_open_short, dtype=bool).tolist()
+    should_close_long = np.asarray(should_close_long, dtype=bool).tolist()
+    should_close_short = np.asarray(should_close_short, dtype=bool).tolist()
+
+    fees = config.fees
+    slippage = config.slippage
+    short_fee_coeff = config.short_fee_coeff
+    use_short_selling = config.use_short_selling
+    use_time_based_close = config.use_time_based_close
+    max_klines_until_close = config.max_klines_until_close
+    use_profit_based_close = config.use_profit_based_close
+    use_stop_loss_based_close = config.use_stop_loss_based_close
+    take_profit_long = 1 + (config.take_profit_threshold_perc / 100)
+    take_profit_short = 1 - (config.take_profit_threshold_perc / 100)
+    stop_loss_long = 1 - (config.stop_loss_threshold_perc / 100)
+    stop_loss_short = 1 + (config.stop_loss_threshold_perc / 100)
+    candles_time_delta = config.candles_time_delta
+    use_intra_candle_thresholds = config.use_intra_candle_thresholds and (
+        use_profit_based_close or use_stop_loss_based_close
+    )
+
+    if use_intra_candle_thresholds:
+        assert (
+            high_prices is not None and low_prices is not None
+        ), "Intra candle thresholds need high and low prices"
+        high_prices = np.asarray(high_prices, dtype=np.float64)
+        low_prices = np.asarray(low_prices, dtype=np.float64)
+
+    cash = state.cash
+    position = state.position
+    short_debt = state.short_debt
+    portfolio_worth = state.total_positions_value
+    buy_and_hold_position = state.buy_and_hold_position
+    enter_trade_price = state.enter_trade_price
+    enter_trade_time = state.enter_trade_time
+    enter_trade_balance = state.enter_trade_balance
+    enter_trade_idx = state.enter_trade_idx
+    pos_open_klines = state.pos_open_klines
+    metrics = state.metrics
+
+    price_list = prices.tolist()
+    checkpoint = None
+    progress_step = max(n // PROGRESS_UPDATE_COUNT, 1)
+    progress_idx = progress_step if progress_callback is not None else n
+
+    threshold_hit_idx = n
+    threshold_close_price = state.threshold_close_price
+    if threshold_close_price is not None:
+        threshold_hit_idx = 0
+    elif use_intra_candle_thresholds and (position > 0.0 or short_debt > 0.0):
+        threshold_hit_idx, threshold_close_price = get_first_threshold_hit(
+            prices,
+            high_prices,
+            low_prices,
+            0,
+            position > 0.0,
+            *get_threshold_prices(config, enter_trade_price, position > 0.0),
+        )
+
+    for i in range(n):
+        if i == progress_idx:
+            progress_callback(i / n)
+            progress_idx += progress_step
+
+        if i == checkpoint_idx:
+            checkpoint = SimulationCheckpoint(
+                SimulationState.from_dict(
+                    {
+                        "cash": cash,
+                        "position": position,
+                        "short_debt": short_debt,
+                        "total_positions_value": portfolio_worth,
+                        "buy_and_hold_position": buy_and_hold_position,
+                        "enter_trade_price": enter_trade_price,
+                        "enter_trade_time": enter_trade_time,
+                        "enter_trade_balance": enter_trade_balance,
+                        "enter_trade_idx": enter_trade_idx - i,
+                        "pos_open_klines": pos_open_klines,
+                        "threshold_close_price": threshold_close_price
+                        if i == threshold_hit_idx
+                        else None,
+                        "metrics": metrics.to_dict(),
+                    }
+                ),
+                i,
+                len(trade_open_idx),
+            )
+
+        price = price_list[i]
+        kline_open_time = kline_open_times[i]
+        close_long = should_close_long[i]
+        close_short = should_close_short[i]
+        close_price = price
+
+        if use_time_based_close and pos_open_klines == max_klines_until_close:
+            close_long = True
+            close_short = True
+
+        if use_profit_based_close and not use_intra_candle_thresholds:
+            if position > 0:
+                threshold_hit = price / enter_trade_price > take_profit_long
+            elif short_debt > 0:
+                threshold_hit = price / enter_trade_price < take_profit_short
+            else:
+                threshold_hit = False
+
+            if threshold_hit:
+                close_long = True
+                close_short = True
+
+        if use_stop_loss_based_close and not use_intra_candle_thresholds:
+            if position > 0:
+                threshold_hit = price / enter_trade_price < stop_loss_long
+            elif short_debt > 0:
+                threshold_hit = price / enter_trade_price > stop_loss_short
+            else:
+                threshold_hit = False
+
+            if threshold_hit:
+                close_long = True
+                close_short = True
+
+        if i == threshold_hit_idx and (position > 0.0 or short_debt > 0.0):
+            close_long = True
+            close_short = True
+            close_price = threshold_close_price
+
+        is_in_position = position > 0.0 or short_debt > 0.0
+
+        portfolio_worth = cash
+        if position > 0.0:
+            portfolio_worth += price * position
+        if short_debt > 0.0:
+            portfolio_worth -= price * short_debt
+
+        close_worth = portfolio_worth
+        if close_price != price:
+            close_worth = cash + close_price * position - close_price * short_debt
+
+        if short_debt > 0.0:
+            short_debt *= short_fee_coeff
+
+        metrics.update_balance(portfolio_worth, is_in_position, candles_time_delta)
+
+        if buy_and_hold_position is None:
+            buy_and_hold_position = config.start_balance / price
+
+        portfolio_worth_arr[i] = portfolio_worth
+        buy_and_hold_worth_arr[i] = buy_and_hold_position * price
+        cash_arr[i] = cash
+        position_arr[i] = position
+        short_debt_arr[i] = short_debt
+
+        pos_open_klines += 1
+
+        if position > 0 and close_long:
+            cash += close_price * position
+            position = 0.0
+            cash = cash * slippage * fees
+            trade_open_idx.append(enter_trade_idx)
+            trade_close_idx.append(i)
+            trade_direction.append(DIRECTION_CODES[Direction.LONG])
+            trade_open_time.append(enter_trade_time)
+            trade_close_time.append(kline_open_time)
+            trade_open_price.append(enter_trade_price)
+            trade_close_price.append(close_price)
+            trade_net_result.append(close_worth - enter_trade_balance)
+            trade_percent_result.append((close_worth / enter_trade_balance - 1) * 100)
+            metrics.add_trade(
+                trade_net_result[-1],
+                trade_percent_result[-1],
+                kline_open_time - enter_trade_time,
+            )
+
+        if short_debt > 0 and close_short and use_short_selling:
+            cash -= close_price * short_debt
+            short_debt = 0.0
+            cash = cash * slippage * fees
+            trade_open_idx.append(enter_trade_idx)
+            trade_close_idx.append(i)
+            trade_direction.append(DIRECTION_CODES[Direction.SHORT])
+            trade_open_time.append(enter_trade_time)
+            trade_close_time.append(kline_open_time)
+            trade_open_price.append(enter_trade_price)
+            trade_close_price.append(close_price)
+            trade_net_result.append(close_worth - enter_trade_balance)
+            trade_percent_result.append((close_worth / enter_trade_balance - 1) * 100)
+            metrics.add_trade(
+                trade_net_result[-1],
+                trade_percent_result[-1],
+                kline_open_time - enter_trade_time,
+            )
+            pos_open_klines = 0
+
+        if cash > 0 and should_open_long[i]:
+            cash = cash * slippage * fees
+            position = cash / price
+            cash = 0.0
+            enter_trade_time = kline_open_time
+            enter_trade_price = price
+            enter_trade_balance = close_worth
+            enter_trade_idx = i
+            pos_open_klines = 0
+
+        if short_debt == 0 and should_open_short[i] and use_short_selling:
+            cash = cash * slippage * fees
+            position_size = cash / price
+            short_debt = position_size
+            cash += position_size * price
+            enter_trade_time = kline_open_time
+            enter_trade_price = price
+            enter_trade_balance = close_worth
+            enter_trade_idx = i
+
+        if (
+            use_intra_candle_thresholds
+            and enter_trade_idx == i
+            and (position > 0.0 or short_debt > 0.0)
+        ):
+            threshold_hit_idx, threshold_close_price = get_first_threshold_hit(
+                prices,
+                high_prices,
+                low_prices,
+                i,
+                position > 0.0,
+                *get_threshold_prices(config, enter_trade_price, position > 0.0),
+            )
+            if threshold_hit_idx == i:
+                # hit inside the entry candle, closed on the next kline at the threshold
+                threshold_hit_idx = i + 1
+
+    state.cash = cash
+    state.position = position
+    state.short_debt = short_debt
+    state.total_positions_value = portfolio_worth
+    state.buy_and_hold_position = buy_and_hold_position
+    state.enter_trade_price = enter_trade_price
+    state.enter_trade_time = enter_trade_time
+    state.enter_trade_balance = enter_trade_balance
+    state.enter_trade_idx = enter_trade_idx - n
+    state.pos_open_klines = pos_open_klines
+    state.threshold_close_price = (
+        threshold_close_price
+        if threshold_hit_idx == n and (position > 0.0 or short_debt > 0.0)
+        else None
+    )
+
+    trades = {
+        "open_idx": np.array(trade_open_idx, dtype=np.int64),
+        "close_idx": np.array(trade_close_idx, dtype=np.int64),
+        "direction": np.array(trade_direction, dtype=np.int8),
+        "open_time": trade_open_time,
+        "close_time": trade_close_time,
+        "open_price": np.array(trade_open_price, dtype=np.float64),
+        "close_price": np.array(trade_close_price, dtype=np.float64),
+        "net_result": np.array(trade_net_result, dtype=np.float64),
+        "percent_result": np.array(trade_percent_result, dtype=np.float64),
+    }
+
+    return SimulationResult(
+        config,
+        state,
+        prices,
+        kline_open_times,
+        portfolio_worth_arr,
+        buy_and_hold_worth_arr,
+        cash_arr,
+        position_arr,
+        short_debt_arr,
+        trades,
+        checkpoint,
+    )
@@ -0,0 +1,133 @@
+import itertools
+from typing import Optional
+import numpy as np
+
+from backtest_pool import create_simulation_task, run_simulation_tasks
+from log import LogExceptionContext
+from manual_backtest import get_manual_backtest_fields, prepare_manual_backtest
+from query_backtest import BacktestQuery
+from query_balance_history import BalanceHistoryQuery
+from query_backtest_sweep import BacktestSweepQuery
+from query_trade import TradeQuery
+from request_types import BodyCreateBacktestSweep, BodySweepRange
+
+
+MAX_SWEEP_RUNS = 10000
+SWEEP_RANK_BY_FIELDS = (
+    "result_perc",
+    "end_balance",
+    "profit_factor",
+    "cagr",
+    "risk_adjusted_return",
+    "sharpe_ratio",
+    "sortino_ratio",
+    "calmar_ratio",
+    "max_drawdown_perc",
+    "share_of_winning_trades_perc",
+    "trade_count",
+)
+
+
+def get_sweep_values(sweep_range: Optional[BodySweepRange], default_value):
+    if sweep_range is None:
+        return [default_value]
+
+    assert sweep_range.step > 0, "Sweep range step must be positive"
+    assert sweep_range.end >= sweep_range.start, "Sweep range end is before its start"
+
+    values = np.arange(
+        sweep_range.start, sweep_range.end + sweep_range.step / 2, sweep_range.step
+    )
+    return [round(float(value), 10) for value in values]
+
+
+def get_sweep_params(body: BodyCreateBacktestSweep):
+    backtestInfo = body.backtest
+    fees = get_sweep_values(body.trading_fees_perc, backtestInfo.trading_fees_perc)
+    take_profits = get_sweep_values(
+        body.take_profit_threshold_perc, backtestInfo.take_profit_threshold_perc
+    )
+    stop_losses = get_sweep_values(
+        body.stop_loss_threshold_perc, backtestInfo.stop_loss_threshold_perc
+    )
+    klines_until_close = get_sweep_values(
+        body.klines_until_close, backtestInfo.klines_until_close
+    )
+
+    return [
+        {
+            "trading_fees_perc": fee,
+            "take_profit_threshold_perc": take_profit,
+            "stop_loss_threshold_perc": stop_loss,
+            "klines_until_close": int(klines) if klines is not None else None,
+        }
+        for fee, take_profit, stop_loss, klines in itertools.product(
+            fees, take_profits, stop_losses, klines_until_close
+        )
+    ]
+
+
+def run_backtest_sweep(body: BodyCreateBacktestSweep):
+    with LogExceptionContext():
+        assert (
+            body.rank_by in SWEEP_RANK_BY_FIELDS
+        ), f"Sweep can not be ranked by {body.rank_by}"
+
+        sweep_params = get_sweep_params(body)
+        assert (
+            len(sweep_params) <= MAX_SWEEP_RUNS
+        ), f"Sweep has {len(sweep_params)} runs, the maximum is {MAX_SWEEP_RUNS}"
+
+        prepared = prepare_manual_backtest(body.backtest)
+
+        sweep_results = run_simulation_tasks(
+            [
+                create_simulation_task(
+                    params,
+                    0,
+                    len(prepared.prices),
+                    prepared.asset_starting_price,
+                    prepared.asset_closing_price,
+                    body.save_balance_history,
+                    body.save_trades,
+                )
+                for params in sweep_params
+            ],
+            prepared.prices,
+            prepared.kline_open_times,
+            prepared.signals,
+            prepared.backtest.get_simulation_config(),
+            prepared.high_prices,
+            prepared.low_prices,
+        )
+
+        backtest_sweep_id = BacktestSweepQuery.create_entry(
+            {
+                "name": body.backtest.name,
+                "dataset_id": body.backtest.dataset_id,
+                "rank_by": body.rank_by,
+                "run_count": len(sweep_results),
+            }
+        )
+        base_fields = get_manual_backtest_fields(body.backtest)
+        backtest_ids = BacktestQuery.create_many_entries(
+            [
+                {
+                    **base_fields,
+                    **sweep_result["params"],
+                    **sweep_result["summary"],
+                    "backtest_sweep_id": backtest_sweep_id,
+                }
+                for sweep_result in sweep_results
+            ]
+        )
+
+        for backtest_id, sweep_result in zip(backtest_ids, sweep_results):
+            if sweep_result["balance_history"] is not None:
+                BalanceHistoryQuery.create_entries(
+                    backtest_id, sweep_result["balance_history"]
+                )
+            if sweep_result["trades"] is not None:
+                TradeQuery.create_many_trade_entry(backtest_id, sweep_result["trades"])
+
+        return backtest_sweep_id
@@ -1,79 +1,7 @@
-from constants import ONE_HOUR_IN_MS
-
-
-def get_backtest_profit_factor_comp(trades):
-    gross_profit = 0.0
-    gross_loss = 0.0
-
-    for item in trades:
-        if item["net_result"] >= 0.0:
-            gross_profit += item["net_result"]
-        else:
-            gross_loss += abs(item["net_result"])
-
-    return (
-        gross_profit / gross_loss if gross_loss != 0 else None,
-        gross_profit,
-        gross_loss,
-    )
-
-
-def get_backtest_trade_details(trades):
-    BEST_TRADE_RESULT_START = -100
-    WORST_TRADE_RESULT_START = 100
-
-    best_trade_result_perc = BEST_TRADE_RESULT_START
-    worst_trade_result_perc = WORST_TRADE_RESULT_START
-    total_winning_trades = 0
-    total_losing_trades = 0
-
-    for item in trades:
-        if item["net_result"] > 0.0:
-            total_winning_trades += 1
-
-            if best_trade_result_perc < item["percent_result"]:
-                best_trade_result_perc = item["percent_result"]
-
-        if item["net_result"] < 0.0:
-            total_losing_trades += 1
-
-            if worst_trade_result_perc > item["percent_result"]:
-                worst_trade_result_perc = item["percent_result"]
-
-    total_trades = len(trades) if len(trades) > 0 else 1
-
-    return (
-        (total_winning_trades / total_trades) * 100,
-        (total_losing_trades / total_trades) * 100,
-        best_trade_result_perc
-        if best_trade_result_perc != BEST_TRADE_RESULT_START
-        else None,
-        worst_trade_result_perc
-        if worst_trade_result_perc != WORST_TRADE_RESULT_START
-        else None,
-    )
-
-
-def find_max_drawdown(balances):
-    START_MAX_DRAWDOWN = 1.0
-    max_drawdown = START_MAX_DRAWDOWN
-    last_high_balance = None
-
-    for item in balances:
-        if last_high_balance is None:
-            last_high_balance = item["portfolio_worth"]
-            continue
-
-        if last_high_balance < item["portfolio_worth"]:
-            last_high_balance = item["portfolio_worth"]
-            continue
-
-        curr_drawdown = item["portfolio_worth"] / last_high_balance
-
-        if curr_drawdown < max_drawdown:
-            max_drawdown = curr_drawdown
-
-    return (max_drawdown - 1) * 100 if max_drawdown != START_MAX_DRAWDOWN else None
+import math
+from typing import Dict, Optional
+import numpy as np
+from constants import ONE_HOUR_IN_MS, ONE_YEAR_IN_MS
 
 
 def get_cagr(end_balance, start_balance, years):
@@ -91,3 +19,216 @@ def turn_short_fee_perc_to_coeff(short_fee_hourly_perc: float, candles_time_delt
     elif candles_time_delta < ONE_HOUR_IN_MS:
         exponent = ONE_HOUR_IN_MS / candles_time_delta
         return (1 + (short_fee_hourly_perc / 100)) ** (1 / exponent)
+
+
+def get_lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int):
+    """Largest-triangle-three-buckets: indices of the points that best keep the shape of y."""
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bucket_size = (length - 2) / (threshold - 2)
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = length - 1
+    prev_idx = 0
+
+    for i in range(threshold - 2):
+        bucket_start = int(i * bucket_size) + 1
+        bucket_end = int((i + 1) * bucket_size) + 1
+        next_bucket_end = min(int((i + 2) * bucket_size) + 1, length)
+
+        next_x = x[bucket_end:next_bucket_end].mean()
+        next_y = y[bucket_end:next_bucket_end].mean()
+
+        areas = np.abs(
+            (x[prev_idx] - next_x) * (y[bucket_start:bucket_end] - y[prev_idx])
+            - (x[prev_idx] - x[bucket_start:bucket_end]) * (next_y - y[prev_idx])
+        )
+        prev_idx = bucket_start + int(np.argmax(areas))
+        indices[i + 1] = prev_idx
+
+    return indices
+
+
+class BacktestMetrics:
+    """Accumulates backtest statistics one kline and one trade at a time."""
+
+    def __init__(self, start_balance: float) -> None:
+        self.start_balance = start_balance
+        self.end_balance = start_balance
+
+        self.kline_count = 0
+        self.cumulative_time = 0.0
+        self.positions_held_time = 0.0
+
+        self.peak_balance: Optional[float] = None
+        self.max_drawdown = 1.0
+
+        self.prev_balance: Optional[float] = None
+        self.return_count = 0
+        self.return_mean = 0.0
+        self.return_m2 = 0.0
+        self.downside_return_sq_sum = 0.0
+
+        self.trade_count = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.winning_trades = 0
+        self.losing_trades = 0
+        self.best_trade_result_perc: Optional[float] = None
+        self.worst_trade_result_perc: Optional[float] = None
+        self.total_holding_time = 0.0
+
+    def update_balance(
+        self, portfolio_worth: float, is_in_position: bool, time_delta=0.0
+    ):
+        self.end_balance = portfolio_worth
+        self.kline_count += 1
+        self.cumulative_time += time_delta
+        if is_in_position:
+            self.positions_held_time += time_delta
+
+        if self.peak_balance is None or portfolio_worth > self.peak_balance:
+            self.peak_balance = portfolio_worth
+        drawdown = portfolio_worth / self.peak_balance
+        if drawdown < self.max_drawdown:
+            self.max_drawdown = drawdown
+
+        if self.prev_balance is not None and self.prev_balance != 0:
+            kline_return = portfolio_worth / self.prev_balance - 1
+            self.return_count += 1
+            delta = kline_return - self.return_mean
+            self.return_mean += delta / self.return_count
+            self.return_m2 += delta * (kline_return - self.return_mean)
+            if kline_return < 0:
+                self.downside_return_sq_sum += kline_return**2
+        self.prev_balance = portfolio_worth
+
+    def add_trade(self, net_result: float, percent_result: float, holding_time=0.0):
+        self.trade_count += 1
+        self.total_holding_time += holding_time
+
+        if net_result >= 0.0:
+            self.gross_profit += net_result
+        else:
+            self.gross_loss += abs(net_result)
+
+        if net_result > 0.0:
+            self.winning_trades += 1
+            if (
+                self.best_trade_result_perc is None
+                or self.best_trade_result_perc < percent_result
+            ):
+                self.best_trade_result_perc = percent_result
+
+        if net_result < 0.0:
+            self.losing_trades += 1
+            if (
+                self.worst_trade_result_perc is None
+                or self.worst_trade_result_perc > percent_result
+            ):
+                self.worst_trade_result_perc = percent_result
+
+    def get_max_drawdown_perc(self):
+        return (self.max_drawdown - 1) * 100 if self.max_drawdown < 1.0 else None
+
+    def get_annualized_ratio(self, deviation: float):
+        if self.return_count < 2 or deviation == 0 or self.cumulative_time == 0:
+            return None
+
+        klines_per_year = ONE_YEAR_IN_MS * self.kline_count / self.cumulative_time
+        return self.return_mean / deviation * math.sqrt(klines_per_year)
+
+    def get_sharpe_ratio(self):
+        if self.return_count < 2:
+            return None
+        return self.get_annualized_ratio(
+            math.sqrt(self.return_m2 / (self.return_count - 1))
+        )
+
+    def get_sortino_ratio(self):
+        if self.return_count < 2:
+            return None
+        return self.get_annualized_ratio(
+            math.sqrt(self.downside_return_sq_sum / self.return_count)
+        )
+
+    def get_summary(self, asset_starting_price=None, asset_closing_price=None):
+        years = self.cumulative_time / ONE_YEAR_IN_MS
+        total_trades = self.trade_count if self.trade_count > 0 else 1
+        has_asset_prices = (
+            asset_starting_price is not None and asset_closing_price is not None
+        )
+
+        has_elapsed_time = self.cumulative_time != 0
+
+        cagr = (
+            get_cagr(self.end_balance, self.start_balance, years)
+            if has_elapsed_time
+            else None
+        )
+        market_exposure_time = (
+            self.positions_held_time / self.cumulative_time
+            if has_elapsed_time
+            else None
+        )
+        max_drawdown_perc = self.get_max_drawdown_perc()
+
+        return {
+            "start_balance": self.start_balance,
+            "end_balance": self.end_balance,
+            "profit_factor": self.gross_profit / self.gross_loss
+            if self.gross_loss != 0
+            else None,
+            "gross_profit": self.gross_profit,
+            "gross_loss": self.gross_loss,
+            "trade_count": self.trade_count,
+            "result_perc": (self.end_balance / self.start_balance - 1) * 100,
+            "share_of_winning_trades_perc": (self.winning_trades / total_trades) * 100,
+            "share_of_losing_trades_perc": (self.losing_trades / total_trades) * 100,
+            "best_trade_result_perc": self.best_trade_result_perc,
+            "worst_trade_result_perc": self.worst_trade_result_perc,
+            "buy_and_hold_result_net": (
+                (asset_closing_price / asset_starting_price * self.start_balance)
+                - self.start_balance
+            )
+            if has_asset_prices
+            else None,
+            "buy_and_hold_result_perc": (
+                (asset_closing_price / asset_starting_price - 1) * 100
+            )
+            if has_asset_prices
+            else None,
+            "max_drawdown_perc": max_drawdown_perc,
+            "cagr": cagr,
+            "market_exposure_time": market_exposure_time,
+            "risk_adjusted_return": cagr / market_exposure_time
+            if has_elapsed_time and market_exposure_time != 0
+            else None,
+            "buy_and_hold_cagr": get_cagr(
+                asset_closing_price, asset_starting_price, years
+            )
+            if has_asset_prices and has_elapsed_time
+            else None,
+            "sharpe_ratio": self.get_sharpe_ratio(),
+            "sortino_ratio": self.get_sortino_ratio(),
+            "calmar_ratio": cagr / abs(max_drawdown_perc / 100)
+            if has_elapsed_time and max_drawdown_perc is not None
+            else None,
+            "average_holding_time": self.total_holding_time / self.trade_count
+            if self.trade_count > 0
+            else None,
+        }
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @staticmethod
+    def from_dict(fields: Dict):
+        metrics = BacktestMetrics(fields["start_balance"])
+        metrics.__dict__.update(fields)
+        return metrics
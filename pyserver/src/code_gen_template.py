@@ -150,9 +150,6 @@ train()
 
 BACKTEST_MODEL_TEMPLATE = """
 {ENTER_AND_EXIT_CRITERIA_FUNCS}
-
-enter_trade = get_enter_trade_criteria({PREDICTION}) 
-exit_trade = get_exit_trade_criteria({PREDICTION}) 
 """
 
 BACKTEST_MANUAL_TEMPLATE = """
@@ -160,9 +157,4 @@ BACKTEST_MANUAL_TEMPLATE = """
 {OPEN_SHORT_TRADE_FUNC}
 {CLOSE_LONG_TRADE_FUNC}
 {CLOSE_SHORT_TRADE_FUNC}
-
-should_open_long = open_long_trade(df_row) 
-should_open_short = open_short_trade(df_row) 
-should_close_long = close_long_trade(df_row)
-should_close_short = close_short_trade(df_row)
 """
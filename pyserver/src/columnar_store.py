@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import List
+import numpy as np
+import pandas as pd
+
+from constants import AppConstants
+
+
+COLUMNAR_MANIFEST_FILE = "manifest.json"
+
+manifest_lock = threading.Lock()
+
+
+def get_columnar_dataset_dir(dataset_name: str):
+    return os.path.join(AppConstants.COLUMNAR_DATASETS, dataset_name)
+
+
+def is_columnar_dtype(dtype):
+    return dtype.kind in "biufmM"
+
+
+def remove_columnar_dataset(dataset_name: str):
+    shutil.rmtree(get_columnar_dataset_dir(dataset_name), ignore_errors=True)
+
+
+def read_manifest(store_dir: str):
+    try:
+        with open(os.path.join(store_dir, COLUMNAR_MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(store_dir: str, manifest):
+    tmp_path = os.path.join(store_dir, f"{COLUMNAR_MANIFEST_FILE}.{uuid.uuid4().hex}")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(store_dir, COLUMNAR_MANIFEST_FILE))
+
+
+def write_columnar_dataset(dataset_name: str, fingerprint: str, df: pd.DataFrame):
+    """Stores the columns of df that are not stored yet, each as its own .npy file
+    under a directory keyed by the dataset fingerprint, so that a stale copy is
+    never read after the table changes. Non-numeric columns stay SQLite only."""
+    if df.columns.has_duplicates:
+        return False
+
+    dataset_dir = get_columnar_dataset_dir(dataset_name)
+    store_dir = os.path.join(dataset_dir, fingerprint)
+    manifest = read_manifest(store_dir)
+    if manifest is not None and manifest["row_count"] != len(df):
+        return False
+
+    stored_columns = (
+        {column["name"] for column in manifest["columns"]} if manifest else set()
+    )
+    new_columns = [
+        column
+        for column in df.columns
+        if column not in stored_columns and is_columnar_dtype(df[column].dtype)
+    ]
+    if len(new_columns) == 0:
+        return manifest is not None
+
+    try:
+        os.makedirs(store_dir, exist_ok=True)
+        columns = []
+        for column in new_columns:
+            file_name = f"{uuid.uuid4().hex}.npy"
+            np.save(os.path.join(store_dir, file_name), df[column].to_numpy())
+            columns.append({"name": column, "file": file_name})
+
+        with manifest_lock:
+            manifest = read_manifest(store_dir) or {"row_count": len(df), "columns": []}
+            stored_columns = {column["name"] for column in manifest["columns"]}
+            manifest["columns"] += [
+                column for column in columns if column["name"] not in stored_columns
+            ]
+            write_manifest(store_dir, manifest)
+    except OSError:
+        # the dataset was changed or the disk is full, reads fall back to SQLite
+        return False
+
+    for entry in os.listdir(dataset_dir):
+        if entry != fingerprint:
+            # memory maps of an older version may still be open, skip what can't be removed
+            shutil.rmtree(os.path.join(dataset_dir, entry), ignore_errors=True)
+    return True
+
+
+def read_columnar_dataset(dataset_name: str, fingerprint: str, columns: List[str]):
+    """Memory maps the stored columns without copying them. Pages are loaded
+    lazily on access and writes to the frame stay private to the process.
+    Returns None when any of the columns has no up to date copy."""
+    store_dir = os.path.join(get_columnar_dataset_dir(dataset_name), fingerprint)
+    manifest = read_manifest(store_dir)
+    if manifest is None:
+        return None
+
+    files = {column["name"]: column["file"] for column in manifest["columns"]}
+    if len(set(columns)) != len(columns) or any(
+        column not in files for column in columns
+    ):
+        return None
+
+    try:
+        arrays = {
+            column: np.load(os.path.join(store_dir, files[column]), mmap_mode="c").view(
+                np.ndarray
+            )
+            for column in columns
+        }
+    except (OSError, ValueError):
+        return None
+
+    return pd.DataFrame(arrays, columns=columns, copy=False)
@@ -18,8 +18,10 @@ BINANCE_DATA_COLS = [
 
 LOG_FILE = "logs"
 DB_DATASETS = "datasets.db"
+COLUMNAR_DATASETS = "columnar_datasets"
 
-STREAMING_DEFAULT_CHUNK_SIZE = 1024
+STREAMING_DEFAULT_CHUNK_SIZE = 1024 * 1024
+CSV_IMPORT_CHUNK_ROWS = 100000
 
 DATASET_UTILS_DB_PATH = "datasets_util.db"
 
@@ -31,6 +33,7 @@ class DomEventChannels(Enum):
 
 class AppConstants:
     DB_DATASETS = append_app_data_path(DB_DATASETS)
+    COLUMNAR_DATASETS = append_app_data_path(COLUMNAR_DATASETS)
 
 
 class NullFillStrategy(Enum):
@@ -50,6 +53,18 @@ class Signals:
     OPEN_TRAINING_TOOLBAR = "SIGNAL_OPEN_TRAINING_TOOLBAR"
     CLOSE_TOOLBAR = "SIGNAL_CLOSE_TOOLBAR"
     EPOCH_COMPLETE = "SIGNAL_EPOCH_COMPLETE\n{EPOCHS_RAN}/{MAX_EPOCHS}/{TRAIN_LOSS}/{VAL_LOSS}/{EPOCH_TIME}/{TRAIN_JOB_ID}"
+    BACKTEST_PROGRESS = (
+        "SIGNAL_BACKTEST_PROGRESS\n{JOB_ID}/{STATUS}/{PROGRESS_PERC}/{BACKTEST_ID}"
+    )
+    DATASET_IMPORT_PROGRESS = (
+        "SIGNAL_DATASET_IMPORT_PROGRESS\n{DATASET_NAME}/{PROGRESS_PERC}/{ROW_COUNT}"
+    )
+
+
+class Direction:
+    LONG = "long"
+    SHORT = "short"
+    CASH = "cash"
 
 
 class CandleSize:
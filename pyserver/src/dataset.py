@@ -1,3 +1,4 @@
+import hashlib
 import json
 import sqlite3
 import pandas as pd
@@ -6,13 +7,19 @@ import numpy as np
 from typing import List, Optional
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 
+from columnar_store import (
+    is_columnar_dtype,
+    read_columnar_dataset,
+    write_columnar_dataset,
+)
 from constants import (
     AppConstants,
     NullFillStrategy,
     ScalingStrategy,
 )
+from dataset_cache import dataset_cache
 from log import LogExceptionContext
-from query_dataset import DatasetQuery
+from query_dataset import Dataset, DatasetQuery
 from query_model import ModelQuery
 
 
@@ -45,6 +52,7 @@ def df_fill_nulls_on_all_cols(dataset_name: str, strategy: NullFillStrategy):
 
         with sqlite3.connect(AppConstants.DB_DATASETS) as conn:
             dataset.to_sql(dataset_name, conn, if_exists="replace", index=False)
+        DatasetQuery.bump_data_version(dataset_name)
 
 
 def df_fill_nulls(df: pd.DataFrame, column: str, strategy: NullFillStrategy):
@@ -114,15 +122,153 @@ def combine_datasets(
     return merged_df
 
 
-def read_dataset_to_mem(dataset_name: str):
+def get_table_columns(dataset_name: str):
+    with sqlite3.connect(AppConstants.DB_DATASETS) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"PRAGMA table_info({dataset_name})")
+        return [info[1] for info in cursor.fetchall()]
+
+
+def read_sqlite_dataset_columns_to_mem(dataset_name: str, columns: List[str]):
+    columns_str = ", ".join('"' + column.replace('"', '""') + '"' for column in columns)
+    with sqlite3.connect(AppConstants.DB_DATASETS) as conn:
+        query = f"SELECT {columns_str} FROM {dataset_name} ORDER BY ROWID ASC"
+        df = pd.read_sql_query(query, conn)
+        return df
+
+
+def read_sqlite_dataset_range_to_mem(
+    dataset_name: str, range_start: int, range_end: int, columns: List[str]
+):
+    columns_str = ", ".join('"' + column.replace('"', '""') + '"' for column in columns)
+    limit = max(range_end - range_start, 0)
     with sqlite3.connect(AppConstants.DB_DATASETS) as conn:
-        query = f"SELECT * FROM {dataset_name}"
+        query = f"SELECT {columns_str} FROM {dataset_name} ORDER BY ROWID ASC LIMIT {limit} OFFSET {range_start}"
         df = pd.read_sql_query(query, conn)
         return df
 
 
+def read_stored_dataset_columns(
+    dataset_name: str, fingerprint: str, columns: List[str]
+):
+    df = read_columnar_dataset(dataset_name, fingerprint, columns)
+    if df is None:
+        df = dataset_cache.get(dataset_name, fingerprint, columns)
+    return df
+
+
+def read_dataset_columns_to_mem(dataset_name: str, columns: Optional[List[str]] = None):
+    """Reads only the given columns of the dataset, or all of them when columns is
+    None. Repeat reads are memory mapped from the columnar store, which fills up
+    one column at a time as columns are read. Reads the store can't serve, such as
+    those of text columns, are kept in the dataset cache instead."""
+    if columns is None:
+        columns = get_table_columns(dataset_name)
+    columns = list(dict.fromkeys(columns))
+
+    dataset = DatasetQuery.fetch_dataset_by_name(dataset_name)
+    if dataset is None:
+        return read_sqlite_dataset_columns_to_mem(dataset_name, columns)
+
+    fingerprint = get_dataset_fingerprint(dataset)
+    df = read_stored_dataset_columns(dataset_name, fingerprint, columns)
+    if df is not None:
+        return df
+
+    df = read_sqlite_dataset_columns_to_mem(dataset_name, columns)
+    is_stored = write_columnar_dataset(dataset_name, fingerprint, df)
+    if not is_stored or not all(is_columnar_dtype(dtype) for dtype in df.dtypes):
+        dataset_cache.put(dataset_name, fingerprint, df)
+    return df
+
+
+def read_dataset_to_mem(dataset_name: str):
+    return read_dataset_columns_to_mem(dataset_name)
+
+
+def get_dataset_row_count(dataset_name: str):
+    with sqlite3.connect(AppConstants.DB_DATASETS) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {dataset_name}")
+        return cursor.fetchone()[0]
+
+
+def get_dataset_fingerprint(dataset: Dataset):
+    with sqlite3.connect(AppConstants.DB_DATASETS) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT MAX(ROWID) FROM {dataset.dataset_name}")
+        max_rowid = cursor.fetchone()[0]
+    columns = get_table_columns(dataset.dataset_name)
+
+    fingerprint = json.dumps(
+        [
+            dataset.dataset_name,
+            dataset.timeseries_column,
+            dataset.price_column,
+            dataset.data_version,
+            max_rowid,
+            columns,
+        ]
+    )
+    return hashlib.sha256(fingerprint.encode()).hexdigest()
+
+
+def get_dataset_rows_hash(
+    df: pd.DataFrame, row_offset: int = 0, previous_hash: int = 0
+):
+    """Order dependent hash of the rows, numbered from row_offset. A hash of the
+    rows that come before them can be passed as previous_hash to get the hash of
+    all of the rows, so the hash can be extended as rows are added."""
+    df = df.astype(
+        {
+            column: np.float64
+            for column, dtype in df.dtypes.items()
+            if pd.api.types.is_numeric_dtype(dtype)
+        }
+    )
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
+    row_numbers = np.arange(row_offset + 1, row_offset + len(df) + 1, dtype=np.uint64)
+    rows_hash = int(np.sum(row_hashes * row_numbers, dtype=np.uint64))
+    return (previous_hash + rows_hash) % 2**64
+
+
+def read_dataset_range_to_mem(
+    dataset_name: str,
+    range_start: int,
+    range_end: int,
+    columns: Optional[List[str]] = None,
+):
+    """Slices the range out of the columnar store or the dataset cache. When
+    neither holds the columns, only the range rows are read from SQLite. The store
+    is left to be filled by full reads, so a cold range read never costs a read of
+    the whole table."""
+    if columns is None:
+        columns = get_table_columns(dataset_name)
+    columns = list(dict.fromkeys(columns))
+
+    dataset = DatasetQuery.fetch_dataset_by_name(dataset_name)
+    df = (
+        read_stored_dataset_columns(
+            dataset_name, get_dataset_fingerprint(dataset), columns
+        )
+        if dataset is not None
+        else None
+    )
+    if df is None:
+        return read_sqlite_dataset_range_to_mem(
+            dataset_name, range_start, range_end, columns
+        )
+
+    return df.iloc[range_start : max(range_start, range_end)].reset_index(drop=True)
+
+
 def read_columns_to_mem(db_path: str, dataset_name: str, columns: List[str | None]):
     try:
+        if db_path == AppConstants.DB_DATASETS:
+            return read_dataset_columns_to_mem(
+                dataset_name, [item for item in columns if item is not None]
+            )
+
         columns_str = get_select_columns_str(columns)
         with sqlite3.connect(db_path) as conn:
             query = f"SELECT {columns_str} FROM {dataset_name}"
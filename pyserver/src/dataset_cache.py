@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+from typing import List
+import pandas as pd
+
+
+DATASET_CACHE_MAX_BYTES = 1024**3
+
+
+class DatasetCache:
+    """Process wide LRU cache of dataset frames with a memory budget.
+
+    Entries are keyed on the dataset name and its fingerprint, so a frame read
+    before a write is never served after it. Each entry holds the columns of the
+    dataset read so far. Frames are copied in and out, which leaves callers free
+    to modify what they get.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries: OrderedDict = OrderedDict()
+        self.size_bytes = 0
+
+    def get(self, dataset_name: str, fingerprint: str, columns: List[str]):
+        with self.lock:
+            entry = self.entries.get(dataset_name)
+            if entry is None:
+                return None
+            if entry["fingerprint"] != fingerprint:
+                self.remove_entry(dataset_name)
+                return None
+            df = entry["df"]
+            if any(column not in df.columns for column in columns):
+                return None
+            self.entries.move_to_end(dataset_name)
+
+        return df[columns].copy()
+
+    def put(self, dataset_name: str, fingerprint: str, df: pd.DataFrame):
+        """Adds the columns of df to the cached frame of the dataset."""
+        with self.lock:
+            entry = self.entries.get(dataset_name)
+            if (
+                entry is not None
+                and entry["fingerprint"] == fingerprint
+                and len(entry["df"]) == len(df)
+            ):
+                new_columns = [
+                    column for column in df.columns if column not in entry["df"].columns
+                ]
+                df = pd.concat([entry["df"], df[new_columns]], axis=1)
+            else:
+                df = df.copy()
+
+            self.remove_entry(dataset_name)
+            size_bytes = int(df.memory_usage(index=True, deep=True).sum())
+            if size_bytes > self.max_bytes:
+                return
+
+            self.entries[dataset_name] = {
+                "fingerprint": fingerprint,
+                "df": df,
+                "size_bytes": size_bytes,
+            }
+            self.size_bytes += size_bytes
+
+            while self.size_bytes > self.max_bytes:
+                self.remove_entry(next(iter(self.entries)))
+
+    def invalidate(self, dataset_name: str):
+        with self.lock:
+            self.remove_entry(dataset_name)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size_bytes = 0
+
+    def remove_entry(self, dataset_name: str):
+        entry = self.entries.pop(dataset_name, None)
+        if entry is not None:
+            self.size_bytes -= entry["size_bytes"]
+
+
+dataset_cache = DatasetCache(DATASET_CACHE_MAX_BYTES)
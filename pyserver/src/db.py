@@ -11,6 +11,7 @@ from typing import List
 from io import BytesIO
 
 
+from columnar_store import remove_columnar_dataset
 from constants import (
     ONE_YEAR_IN_MS,
     AppConstants,
@@ -18,6 +19,7 @@ from constants import (
     DomEventChannels,
     NullFillStrategy,
 )
+from dataset_cache import dataset_cache
 from dataset import (
     combine_datasets,
     df_fill_nulls,
@@ -98,6 +100,8 @@ def rename_table(db_path, old_name, new_name):
             cursor = conn.cursor()
             cursor.execute(f"ALTER TABLE {old_name} RENAME TO {new_name}")
             conn.commit()
+        remove_columnar_dataset(old_name)
+        dataset_cache.invalidate(old_name)
 
 
 def get_table_row_count(cursor: sqlite3.Cursor, table_name: str) -> int:
@@ -199,14 +203,74 @@ def get_first_last_five_rows(cursor: sqlite3.Cursor, table_name: str):
     return first_five, last_five
 
 
+def get_sqlite_column_type(series: pd.Series):
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(series):
+        return "REAL"
+    return "TEXT"
+
+
+def append_columns_to_table(
+    conn: sqlite3.Connection, table_name: str, df: pd.DataFrame
+):
+    """Adds the columns of df to the table, matching the rows by their order. The
+    columns and their values are written in one transaction."""
+    # sqlite column names are case insensitive
+    table_columns = {column.lower() for column in get_column_names(conn, table_name)}
+    new_columns = [column.lower() for column in df.columns]
+    duplicate_columns = [
+        column
+        for i, column in enumerate(df.columns)
+        if new_columns[i] in table_columns or new_columns[i] in new_columns[:i]
+    ]
+    assert (
+        len(duplicate_columns) == 0
+    ), f"Columns already exist in {table_name}: {', '.join(duplicate_columns)}"
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN")
+        cursor.execute(f"SELECT ROWID FROM {table_name} ORDER BY ROWID ASC")
+        rowids = [row[0] for row in cursor.fetchall()]
+        assert len(rowids) == len(df), f"Row count of {table_name} has changed"
+
+        for column in df.columns:
+            cursor.execute(
+                f'ALTER TABLE {table_name} ADD COLUMN "{column}" {get_sqlite_column_type(df[column])}'
+            )
+
+        values = [
+            df[column].astype(object).where(df[column].notna(), None).tolist()
+            for column in df.columns
+        ]
+        set_columns_str = ", ".join(f'"{column}" = ?' for column in df.columns)
+        cursor.executemany(
+            f"UPDATE {table_name} SET {set_columns_str} WHERE ROWID = ?",
+            zip(*values, rowids),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
 async def add_columns_to_table(
     db_path: str, dataset_name: str, new_cols_arr, null_fill_strat: NullFillStrategy
 ):
     with LogExceptionContext(notification_duration=60000):
-        base_df = read_dataset_to_mem(dataset_name)
+        base_df_timeseries_col = DatasetQuery.get_timeseries_col(dataset_name)
+        assert (
+            base_df_timeseries_col is not None
+        ), f"Timeseries column has not been set for {dataset_name}"
+
+        # only the join column is read, the new columns are written next to the existing ones
+        base_df = read_columns_to_mem(db_path, dataset_name, [base_df_timeseries_col])
         if base_df is None:
             return False
-        base_df_timeseries_col = DatasetQuery.get_timeseries_col(dataset_name)
+        base_row_count = len(base_df)
+        new_columns = []
+
         with sqlite3.connect(db_path) as conn:
             for item in new_cols_arr:
                 timeseries_col = DatasetQuery.get_timeseries_col(item.table_name)
@@ -223,13 +287,18 @@ async def add_columns_to_table(
                         base_df_timeseries_col,
                         timeseries_col,
                     )
+                    assert (
+                        len(base_df) == base_row_count
+                    ), f"{item.table_name} has duplicate values in {timeseries_col}"
 
                     col_prefix = get_col_prefix(item.table_name)
                     for col in item.columns:
                         col_prefixed = col_prefix + col
                         df_fill_nulls(base_df, col_prefixed, null_fill_strat)
+                        new_columns.append(col_prefixed)
 
-            base_df.to_sql(dataset_name, conn, if_exists="replace", index=False)
+            append_columns_to_table(conn, dataset_name, base_df[new_columns])
+            DatasetQuery.bump_data_version(dataset_name)
             logger = get_logger()
             logger.log(
                 message=f"Succesfully added new columns to dataset {dataset_name}",
@@ -293,6 +362,7 @@ def delete_dataset_cols(table_name: str, delete_cols):
             cursor.execute(f"DROP TABLE {table_name}")
             cursor.execute(f"ALTER TABLE {new_table_name} RENAME TO {table_name}")
             conn.commit()
+        DatasetQuery.bump_data_version(table_name)
 
 
 def get_column_from_dataset(table_name: str, column_name: str):
@@ -361,6 +431,8 @@ def remove_table(table_name):
         cursor = conn.cursor()
         cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
         conn.commit()
+    remove_columnar_dataset(table_name)
+    dataset_cache.invalidate(table_name)
 
 
 def safe_float_convert(value):
@@ -383,18 +455,10 @@ def exec_sql(db_path: str, sql_statement: str):
         db.close()
 
 
-def fetch_column_and_safe_float_convert(col_name: str | None, table_name: str):
+def safe_float_convert_column(df: pd.DataFrame, col_name: str | None):
     if col_name is None:
         return None
-
-    with sqlite3.connect(AppConstants.DB_DATASETS) as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute(f"SELECT {col_name} from {table_name}")
-        except Exception as e:
-            print(f"Database Error: {e}")
-            return None
-        return [safe_float_convert(row[0]) for row in cursor.fetchall()]
+    return [safe_float_convert(value) for value in df[col_name].tolist()]
 
 
 def timedelta_to_candlesize(seconds):
@@ -583,31 +647,26 @@ def get_column_detailed_info(
         with sqlite3.connect(AppConstants.DB_DATASETS) as conn:
             cursor = conn.cursor()
 
-            rows = fetch_column_and_safe_float_convert(col_name, table_name)
             null_count = get_col_null_count(cursor, table_name, col_name)
             stats = get_col_stats(cursor, table_name, col_name)
 
-            kline_open_time = fetch_column_and_safe_float_convert(
-                timeseries_col_name, table_name
-            )
-            target_data = fetch_column_and_safe_float_convert(target_col, table_name)
-
-            price_data = fetch_column_and_safe_float_convert(price_col, table_name)
-
             df = read_columns_to_mem(
                 AppConstants.DB_DATASETS,
                 table_name,
-                [col_name, timeseries_col_name, target_col],
+                [col_name, timeseries_col_name, target_col, price_col],
             )
 
             assert df is not None, "Could not read DF to the memory"
 
+            rows = safe_float_convert_column(df, col_name)
+            kline_open_time = safe_float_convert_column(df, timeseries_col_name)
+            target_data = safe_float_convert_column(df, target_col)
+            price_data = safe_float_convert_column(df, price_col)
+
             corr_to_price, corrs_to_shifted_prices = get_correlation_data(
                 df, col_name, timeseries_col_name, target_col
             )
 
-            get_linear_regression_analysis(table_name, col_name, target_col)
-
             return {
                 "rows": rows,
                 "null_count": null_count,
@@ -628,6 +687,7 @@ def rename_column(path: str, table_name: str, old_col_name: str, new_col_name: s
                 f"ALTER TABLE {table_name} RENAME COLUMN {old_col_name} TO {new_col_name}"
             )
             conn.commit()
+        DatasetQuery.bump_data_version(table_name)
 
 
 def get_column_names(conn: sqlite3.Connection, table_name: str) -> List[str]:
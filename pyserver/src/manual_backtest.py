@@ -1,172 +1,640 @@
+import ast
+import hashlib
 import json
 import math
-from typing import Dict, List
-from backtest_utils import (
-    find_max_drawdown,
-    get_backtest_profit_factor_comp,
-    get_backtest_trade_details,
-    get_cagr,
-    turn_short_fee_perc_to_coeff,
+from functools import lru_cache
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from backtest_jobs import reraise_job_cancellation
+from backtest_simulation import (
+    PROGRESS_UPDATE_COUNT,
+    SimulationCheckpoint,
+    SimulationConfig,
+    SimulationState,
+    simulate,
 )
+from backtest_utils import turn_short_fee_perc_to_coeff
 from code_gen_template import BACKTEST_MANUAL_TEMPLATE
-from dataset import read_dataset_to_mem
-from db import get_df_candle_size, ms_to_years
+from dataset import (
+    get_dataset_fingerprint,
+    get_dataset_row_count,
+    get_dataset_rows_hash,
+    get_table_columns,
+    read_dataset_columns_to_mem,
+    read_dataset_range_to_mem,
+)
+from db import get_df_candle_size
 from log import LogExceptionContext
 from model_backtest import Positions
 from query_backtest import BacktestQuery
-from query_dataset import DatasetQuery
+from query_backtest_cache import BacktestCacheQuery
+from query_balance_history import BalanceHistoryQuery
+from query_dataset import Dataset, DatasetQuery
 from query_trade import TradeQuery
 from request_types import BodyCreateManualBacktest
 
 
 START_BALANCE = 10000
+OPEN_PRICE_COLUMN = "open_price"
+HIGH_PRICE_COLUMN = "high_price"
+LOW_PRICE_COLUMN = "low_price"
+COMPILED_TRADE_FUNCS_CACHE_SIZE = 32
+ROW_SIGNALS_PROGRESS_SHARE = 0.5
+TRADE_FUNC_NAMES = (
+    "open_long_trade",
+    "open_short_trade",
+    "close_long_trade",
+    "close_short_trade",
+)
 
 
-def run_manual_backtest(backtestInfo: BodyCreateManualBacktest):
-    with LogExceptionContext():
-        dataset = DatasetQuery.fetch_dataset_by_id(backtestInfo.dataset_id)
-        dataset_df = read_dataset_to_mem(dataset.dataset_name)
+@lru_cache(maxsize=COMPILED_TRADE_FUNCS_CACHE_SIZE)
+def get_compiled_trade_funcs(code: str):
+    trade_funcs: Dict = {}
+    exec(compile(code, "<manual_backtest>", "exec"), globals(), trade_funcs)
+    return (
+        trade_funcs["open_long_trade"],
+        trade_funcs["open_short_trade"],
+        trade_funcs["close_long_trade"],
+        trade_funcs["close_short_trade"],
+    )
+
+
+@lru_cache(maxsize=COMPILED_TRADE_FUNCS_CACHE_SIZE)
+def get_trade_funcs_columns(code: str):
+    """Columns the trade functions read from the row or frame they are given, or
+    None when it is used in some other way than indexing it with a string."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+
+    arg_names = set()
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name in TRADE_FUNC_NAMES:
+            if node.args.vararg is not None or node.args.kwarg is not None:
+                return None
+            arg_names.update(
+                arg.arg
+                for arg in node.args.posonlyargs + node.args.args + node.args.kwonlyargs
+            )
 
-        candles_time_delta = get_df_candle_size(
-            dataset_df, dataset.timeseries_column, formatted=False
-        )
+    columns = []
+    indexed_names = set()
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Subscript)
+            and isinstance(node.ctx, ast.Load)
+            and isinstance(node.value, ast.Name)
+            and node.value.id in arg_names
+            and isinstance(node.slice, ast.Constant)
+            and isinstance(node.slice.value, str)
+        ):
+            columns.append(node.slice.value)
+            indexed_names.add(node.value)
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in arg_names:
+            if node not in indexed_names:
+                return None
+
+    return tuple(dict.fromkeys(columns))
+
+
+def get_trade_funcs_code(enter_and_exit_criteria_placeholders: Dict):
+    code = BACKTEST_MANUAL_TEMPLATE
+    for key, value in enter_and_exit_criteria_placeholders.items():
+        code = code.replace(key, str(value))
+    return code
+
+
+def get_backtest_dataset_columns(
+    dataset: Dataset,
+    enter_and_exit_criteria_placeholders: Dict,
+    use_intra_candle_thresholds: bool = False,
+):
+    """Dataset columns a backtest reads, None meaning every column."""
+    condition_columns = get_trade_funcs_columns(
+        get_trade_funcs_code(enter_and_exit_criteria_placeholders)
+    )
+    if condition_columns is None:
+        return None
+
+    required_columns = {
+        dataset.timeseries_column,
+        dataset.price_column,
+        *condition_columns,
+    }
+    if use_intra_candle_thresholds:
+        required_columns.update((HIGH_PRICE_COLUMN, LOW_PRICE_COLUMN))
+
+    return [
+        column
+        for column in get_table_columns(dataset.dataset_name)
+        if column in required_columns
+    ]
+
+
+def get_manual_backtest_replacements(backtestInfo: BodyCreateManualBacktest):
+    return {
+        "{OPEN_LONG_TRADE_FUNC}": backtestInfo.open_long_trade_cond,
+        "{OPEN_SHORT_TRADE_FUNC}": backtestInfo.open_short_trade_cond,
+        "{CLOSE_LONG_TRADE_FUNC}": backtestInfo.close_long_trade_cond,
+        "{CLOSE_SHORT_TRADE_FUNC}": backtestInfo.close_short_trade_cond,
+    }
+
+
+def create_manual_backtest(
+    backtestInfo: BodyCreateManualBacktest, candles_time_delta
+) -> "ManualBacktest":
+    return ManualBacktest(
+        START_BALANCE,
+        backtestInfo.trading_fees_perc,
+        backtestInfo.slippage_perc,
+        backtestInfo.short_fee_hourly,
+        get_manual_backtest_replacements(backtestInfo),
+        backtestInfo.use_short_selling,
+        backtestInfo.use_time_based_close,
+        backtestInfo.use_profit_based_close,
+        backtestInfo.use_stop_loss_based_close,
+        backtestInfo.take_profit_threshold_perc,
+        backtestInfo.stop_loss_threshold_perc,
+        backtestInfo.klines_until_close if backtestInfo.klines_until_close else -1,
+        candles_time_delta,
+        backtestInfo.use_intra_candle_thresholds,
+    )
 
-        replacements = {
-            "{OPEN_LONG_TRADE_FUNC}": backtestInfo.open_long_trade_cond,
-            "{OPEN_SHORT_TRADE_FUNC}": backtestInfo.open_short_trade_cond,
-            "{CLOSE_LONG_TRADE_FUNC}": backtestInfo.close_long_trade_cond,
-            "{CLOSE_SHORT_TRADE_FUNC}": backtestInfo.close_short_trade_cond,
-        }
 
-        backtest = ManualBacktest(
-            START_BALANCE,
-            backtestInfo.trading_fees_perc,
-            backtestInfo.slippage_perc,
-            backtestInfo.short_fee_hourly,
-            replacements,
-            backtestInfo.use_short_selling,
-            backtestInfo.use_time_based_close,
-            backtestInfo.use_profit_based_close,
-            backtestInfo.use_stop_loss_based_close,
-            backtestInfo.take_profit_threshold_perc,
-            backtestInfo.stop_loss_threshold_perc,
-            backtestInfo.klines_until_close if backtestInfo.klines_until_close else -1,
-            candles_time_delta,
-        )
+def get_candle_high_and_low_prices(
+    backtestInfo: BodyCreateManualBacktest, range_df: pd.DataFrame, price_column: str
+):
+    if not backtestInfo.use_intra_candle_thresholds:
+        return None, None
 
-        backtest_data_range_start, backtest_data_range_end = (
-            backtestInfo.backtest_data_range + [None, None]
-        )[:2]
+    # trades are entered at the price column, so the candle range must come after it
+    assert (
+        price_column == OPEN_PRICE_COLUMN
+    ), f"Intra candle thresholds need {OPEN_PRICE_COLUMN} as the price column"
 
+    for column in (HIGH_PRICE_COLUMN, LOW_PRICE_COLUMN):
         assert (
-            backtest_data_range_start is not None
-        ), "Backtest data range start is missing"
-        assert backtest_data_range_end is not None, "Backtest data range end is missing"
-        assert (
-            dataset.timeseries_column is not None
-        ), "Timeseries column has not been set"
-        assert dataset.price_column is not None, "Price column has not been set"
-
-        asset_starting_price = None
-        asset_closing_price = None
-
-        backtest_data_range_start = math.floor(
-            len(dataset_df) * (backtest_data_range_start / 100)
-        )
-        backtest_data_range_end = math.floor(
-            len(dataset_df) * (backtest_data_range_end / 100)
+            column in range_df.columns
+        ), f"Intra candle thresholds need the {column} column in the dataset"
+
+    return (
+        range_df[HIGH_PRICE_COLUMN].to_numpy(dtype=np.float64),
+        range_df[LOW_PRICE_COLUMN].to_numpy(dtype=np.float64),
+    )
+
+
+def get_backtest_data_range(backtestInfo: BodyCreateManualBacktest, row_count: int):
+    backtest_data_range_start, backtest_data_range_end = (
+        backtestInfo.backtest_data_range + [None, None]
+    )[:2]
+
+    assert backtest_data_range_start is not None, "Backtest data range start is missing"
+    assert backtest_data_range_end is not None, "Backtest data range end is missing"
+
+    return (
+        math.floor(row_count * (backtest_data_range_start / 100)),
+        math.floor(row_count * (backtest_data_range_end / 100)),
+    )
+
+
+def get_manual_backtest_fields(backtestInfo: BodyCreateManualBacktest):
+    return {
+        "open_long_trade_cond": backtestInfo.open_long_trade_cond,
+        "open_short_trade_cond": backtestInfo.open_short_trade_cond,
+        "close_long_trade_cond": backtestInfo.close_long_trade_cond,
+        "close_short_trade_cond": backtestInfo.close_short_trade_cond,
+        "dataset_id": backtestInfo.dataset_id,
+        "name": backtestInfo.name,
+        "klines_until_close": backtestInfo.klines_until_close,
+        "use_time_based_close": backtestInfo.use_time_based_close,
+        "use_profit_based_close": backtestInfo.use_profit_based_close,
+        "use_stop_loss_based_close": backtestInfo.use_stop_loss_based_close,
+        "stop_loss_threshold_perc": backtestInfo.stop_loss_threshold_perc,
+        "take_profit_threshold_perc": backtestInfo.take_profit_threshold_perc,
+        "use_short_selling": backtestInfo.use_short_selling,
+        "trading_fees_perc": backtestInfo.trading_fees_perc,
+        "use_intra_candle_thresholds": backtestInfo.use_intra_candle_thresholds,
+    }
+
+
+class PreparedManualBacktest:
+    def __init__(
+        self,
+        backtest: "ManualBacktest",
+        prices: np.ndarray,
+        kline_open_times: List,
+        signals,
+        asset_starting_price: float,
+        asset_closing_price: float,
+        data_range_start: int,
+        data_range_end: int,
+        row_count: int,
+        high_prices: Optional[np.ndarray] = None,
+        low_prices: Optional[np.ndarray] = None,
+        data_version: Optional[int] = None,
+        checkpoint_rows_hash: Optional[int] = None,
+    ) -> None:
+        self.backtest = backtest
+        self.prices = prices
+        self.kline_open_times = kline_open_times
+        self.signals = signals
+        self.asset_starting_price = asset_starting_price
+        self.asset_closing_price = asset_closing_price
+        self.data_range_start = data_range_start
+        self.data_range_end = data_range_end
+        self.row_count = row_count
+        self.high_prices = high_prices
+        self.low_prices = low_prices
+        self.data_version = data_version
+        # hash of the rows before the checkpoint, set when the range reaches the end
+        self.checkpoint_rows_hash = checkpoint_rows_hash
+
+
+def get_first_and_last_price(prices: np.ndarray):
+    """Buy and hold start and close prices, None where the price is missing."""
+    return tuple(
+        None if np.isnan(price) else float(price) for price in (prices[0], prices[-1])
+    )
+
+
+def get_backtest_candle_size(dataset: Dataset, range_df: pd.DataFrame):
+    """A range of less than two candles takes the candle size from the dataset."""
+    if range_df[dataset.timeseries_column].notnull().sum() < 2:
+        range_df = read_dataset_columns_to_mem(
+            dataset.dataset_name, [dataset.timeseries_column]
         )
-        idx = 0
+    assert (
+        range_df[dataset.timeseries_column].notnull().sum() >= 2
+    ), "Dataset needs at least two candles to backtest"
+    return get_df_candle_size(range_df, dataset.timeseries_column, formatted=False)
+
+
+def prepare_manual_backtest(
+    backtestInfo: BodyCreateManualBacktest, progress_callback=None
+):
+    dataset = DatasetQuery.fetch_dataset_by_id(backtestInfo.dataset_id)
+
+    assert dataset.timeseries_column is not None, "Timeseries column has not been set"
+    assert dataset.price_column is not None, "Price column has not been set"
+
+    row_count = get_dataset_row_count(dataset.dataset_name)
+    backtest_data_range_start, backtest_data_range_end = get_backtest_data_range(
+        backtestInfo, row_count
+    )
+    range_df = read_dataset_range_to_mem(
+        dataset.dataset_name,
+        backtest_data_range_start,
+        backtest_data_range_end,
+        get_backtest_dataset_columns(
+            dataset,
+            get_manual_backtest_replacements(backtestInfo),
+            backtestInfo.use_intra_candle_thresholds,
+        ),
+    )
+    assert len(range_df) > 0, "Backtest data range is empty"
+    prices = range_df[dataset.price_column].to_numpy(dtype=np.float64)
+    asset_starting_price, asset_closing_price = get_first_and_last_price(prices)
+
+    candles_time_delta = get_backtest_candle_size(dataset, range_df)
+    backtest = create_manual_backtest(backtestInfo, candles_time_delta)
+
+    signals = get_backtest_range_signals(
+        backtest,
+        range_df,
+        backtestInfo.use_vectorized_conditions,
+        backtest_data_range_end >= row_count,
+        progress_callback,
+    )
+
+    high_prices, low_prices = get_candle_high_and_low_prices(
+        backtestInfo, range_df, dataset.price_column
+    )
+    checkpoint_rows_hash = (
+        get_dataset_rows_hash(range_df.iloc[:-1])
+        if backtest_data_range_end >= row_count
+        else None
+    )
+
+    return PreparedManualBacktest(
+        backtest,
+        prices,
+        range_df[dataset.timeseries_column].tolist(),
+        signals,
+        asset_starting_price,
+        asset_closing_price,
+        backtest_data_range_start,
+        min(backtest_data_range_end, row_count),
+        row_count,
+        high_prices,
+        low_prices,
+        dataset.data_version,
+        checkpoint_rows_hash,
+    )
+
+
+def get_simulation_checkpoint_json(
+    backtestInfo: BodyCreateManualBacktest,
+    checkpoint: Optional[SimulationCheckpoint],
+    checkpoint_row_idx: int,
+    trade_count_before: int,
+    candles_time_delta,
+    data_version: Optional[int],
+    rows_hash: Optional[int],
+):
+    """rows_hash is the get_dataset_rows_hash of the dataset rows from the start of
+    the backtest range up to the checkpoint row, which is simulated again when the
+    backtest is extended."""
+    if checkpoint is None:
+        return None
+
+    return json.dumps(
+        {
+            "backtest_info": backtestInfo.model_dump(),
+            "state": checkpoint.state.to_dict(),
+            "row_idx": checkpoint_row_idx + checkpoint.kline_idx,
+            "trade_count": trade_count_before + checkpoint.trade_count,
+            "candles_time_delta": float(candles_time_delta),
+            "data_version": data_version,
+            "rows_hash": rows_hash,
+        }
+    )
 
-        for i, row in dataset_df.iterrows():
-            is_last_row = i == len(dataset_df) - 1 or idx == backtest_data_range_end
 
-            if i == 0:
-                asset_starting_price = row[dataset.price_column]
-            if is_last_row:
-                asset_closing_price = row[dataset.price_column]
+def get_backtest_request_hash(backtestInfo: BodyCreateManualBacktest):
+    request = json.dumps(backtestInfo.model_dump(), sort_keys=True)
+    return hashlib.sha256(request.encode()).hexdigest()
 
-            idx += 1
-            if idx <= backtest_data_range_start or idx > backtest_data_range_end:
-                continue
 
-            backtest.process_df_row(
-                row, dataset.price_column, dataset.timeseries_column, is_last_row
-            )
+def fetch_cached_manual_backtest(request_hash: str, dataset_fingerprint: str):
+    cache_entry = BacktestCacheQuery.fetch_entry(request_hash)
+    if cache_entry is None or cache_entry.dataset_fingerprint != dataset_fingerprint:
+        return None
+    return BacktestQuery.fetch_backtest_by_id(cache_entry.backtest_id)
 
-        end_balance = backtest.positions.total_positions_value
 
-        profit_factor, gross_profit, gross_loss = get_backtest_profit_factor_comp(
-            backtest.positions.trades
+def run_manual_backtest(backtestInfo: BodyCreateManualBacktest, progress_callback=None):
+    with LogExceptionContext(custom_handler=reraise_job_cancellation):
+        request_hash = get_backtest_request_hash(backtestInfo)
+        dataset_fingerprint = get_dataset_fingerprint(
+            DatasetQuery.fetch_dataset_by_id(backtestInfo.dataset_id)
         )
-        (
-            share_of_winning_trades_perc,
-            share_of_losing_trades_perc,
-            best_trade_result_perc,
-            worst_trade_result_perc,
-        ) = get_backtest_trade_details(backtest.positions.trades)
-
-        max_drawdown_perc = find_max_drawdown(backtest.positions.balance_history)
-        cagr = get_cagr(
-            end_balance, START_BALANCE, ms_to_years(backtest.cumulative_time)
+        cached_backtest = fetch_cached_manual_backtest(
+            request_hash, dataset_fingerprint
+        )
+        if cached_backtest is not None:
+            return cached_backtest
+
+        signals_progress_share = get_signals_progress_share(
+            backtestInfo.use_vectorized_conditions
+        )
+        prepared = prepare_manual_backtest(
+            backtestInfo,
+            get_phase_progress_callback(progress_callback, 0.0, signals_progress_share),
         )
-        market_exposure_time = backtest.positions_held_time / backtest.cumulative_time
-        buy_and_hold_cagr = get_cagr(
-            asset_closing_price,
-            asset_starting_price,
-            ms_to_years(backtest.cumulative_time),
+        backtest = prepared.backtest
+        reaches_dataset_end = prepared.data_range_end == prepared.row_count
+
+        result = backtest.simulate(
+            prepared.prices,
+            prepared.kline_open_times,
+            *prepared.signals,
+            checkpoint_idx=len(prepared.prices) - 1 if reaches_dataset_end else None,
+            high_prices=prepared.high_prices,
+            low_prices=prepared.low_prices,
+            progress_callback=get_phase_progress_callback(
+                progress_callback, signals_progress_share, 1.0
+            ),
         )
 
         backtest_id = BacktestQuery.create_entry(
             {
-                "open_long_trade_cond": backtestInfo.open_long_trade_cond,
-                "open_short_trade_cond": backtestInfo.open_short_trade_cond,
-                "close_long_trade_cond": backtestInfo.close_long_trade_cond,
-                "close_short_trade_cond": backtestInfo.close_short_trade_cond,
-                "data": json.dumps(backtest.positions.balance_history),
-                "dataset_id": dataset.id,
-                "start_balance": START_BALANCE,
-                "end_balance": end_balance,
-                "profit_factor": profit_factor,
-                "gross_profit": gross_profit,
-                "gross_loss": gross_loss,
-                "trade_count": len(backtest.positions.trades),
-                "name": backtestInfo.name,
-                "klines_until_close": backtestInfo.klines_until_close,
-                "result_perc": (end_balance / START_BALANCE - 1) * 100,
-                "share_of_winning_trades_perc": share_of_winning_trades_perc,
-                "share_of_losing_trades_perc": share_of_losing_trades_perc,
-                "best_trade_result_perc": best_trade_result_perc,
-                "worst_trade_result_perc": worst_trade_result_perc,
-                "buy_and_hold_result_net": (
-                    (asset_closing_price / asset_starting_price * START_BALANCE)
-                    - START_BALANCE
-                )
-                if asset_starting_price is not None and asset_closing_price is not None
-                else None,
-                "buy_and_hold_result_perc": (
-                    (asset_closing_price / asset_starting_price - 1) * 100
-                )
-                if asset_starting_price is not None and asset_closing_price is not None
-                else None,
-                "max_drawdown_perc": max_drawdown_perc,
-                "cagr": cagr,
-                "market_exposure_time": market_exposure_time,
-                "risk_adjusted_return": cagr / market_exposure_time,
-                "buy_and_hold_cagr": buy_and_hold_cagr,
-                "use_time_based_close": backtestInfo.use_time_based_close,
-                "use_profit_based_close": backtestInfo.use_profit_based_close,
-                "use_stop_loss_based_close": backtestInfo.use_stop_loss_based_close,
-                "stop_loss_threshold_perc": backtestInfo.stop_loss_threshold_perc,
-                "take_profit_threshold_perc": backtestInfo.take_profit_threshold_perc,
-                "use_short_selling": backtestInfo.use_short_selling,
+                **get_manual_backtest_fields(backtestInfo),
+                **result.get_summary(
+                    prepared.asset_starting_price, prepared.asset_closing_price
+                ),
+                "backtest_range_start": prepared.data_range_start,
+                "backtest_range_end": prepared.data_range_end,
+                "simulation_checkpoint": get_simulation_checkpoint_json(
+                    backtestInfo,
+                    result.checkpoint,
+                    prepared.data_range_start,
+                    0,
+                    backtest.candles_time_delta,
+                    prepared.data_version,
+                    prepared.checkpoint_rows_hash,
+                ),
             }
         )
 
-        backtest_from_db = BacktestQuery.fetch_backtest_by_id(backtest_id)
+        BalanceHistoryQuery.create_entries(
+            backtest_id, result.get_balance_history_columns()
+        )
         TradeQuery.create_many_trade_entry(backtest_id, backtest.positions.trades)
+        BacktestCacheQuery.create_or_update_entry(
+            request_hash, dataset_fingerprint, backtest_id
+        )
+
+        return BacktestQuery.fetch_backtest_by_id(backtest_id)
+
+
+def extend_manual_backtest(backtest_id: int):
+    with LogExceptionContext():
+        backtest_from_db = BacktestQuery.fetch_backtest_by_id(
+            backtest_id, balance_history_columns=[]
+        )
+        balance_history = BalanceHistoryQuery.fetch_columns(backtest_id)
+
+        assert (
+            backtest_from_db.simulation_checkpoint is not None
+        ), "Backtest does not reach the end of its dataset and can not be extended"
+        assert len(balance_history) > 0, "Backtest has no balance history"
+
+        checkpoint = json.loads(backtest_from_db.simulation_checkpoint)
+        backtestInfo = BodyCreateManualBacktest(**checkpoint["backtest_info"])
+        dataset = DatasetQuery.fetch_dataset_by_id(backtest_from_db.dataset_id)
+        row_count = get_dataset_row_count(dataset.dataset_name)
+
+        if row_count <= backtest_from_db.backtest_range_end:
+            return BacktestQuery.fetch_backtest_by_id(backtest_id)
+
+        columns = get_backtest_dataset_columns(
+            dataset,
+            get_manual_backtest_replacements(backtestInfo),
+            backtestInfo.use_intra_candle_thresholds,
+        )
+        if dataset.data_version != checkpoint.get("data_version"):
+            # the dataset was written to, the rows already simulated must be unchanged
+            simulated_df = read_dataset_range_to_mem(
+                dataset.dataset_name,
+                backtest_from_db.backtest_range_start,
+                checkpoint["row_idx"],
+                columns,
+            )
+            assert get_dataset_rows_hash(simulated_df) == checkpoint.get(
+                "rows_hash"
+            ), "Dataset rows the backtest has simulated have changed since it was run, run the backtest again instead of extending it"
+
+        range_df = read_dataset_range_to_mem(
+            dataset.dataset_name, checkpoint["row_idx"], row_count, columns
+        )
+        prices = range_df[dataset.price_column].to_numpy(dtype=np.float64)
+        range_start_df = read_dataset_range_to_mem(
+            dataset.dataset_name,
+            backtest_from_db.backtest_range_start,
+            backtest_from_db.backtest_range_start + 1,
+            [dataset.price_column],
+        )
+        asset_starting_price, _ = get_first_and_last_price(
+            range_start_df[dataset.price_column].to_numpy(dtype=np.float64)
+        )
+        _, asset_closing_price = get_first_and_last_price(prices)
+        backtest = create_manual_backtest(
+            backtestInfo, checkpoint["candles_time_delta"]
+        )
+        signals = get_backtest_range_signals(
+            backtest, range_df, backtestInfo.use_vectorized_conditions, True
+        )
+        high_prices, low_prices = get_candle_high_and_low_prices(
+            backtestInfo, range_df, dataset.price_column
+        )
+
+        result = simulate(
+            backtest.get_simulation_config(),
+            prices,
+            range_df[dataset.timeseries_column].tolist(),
+            *signals,
+            state=SimulationState.from_dict(checkpoint["state"]),
+            checkpoint_idx=len(range_df) - 1,
+            high_prices=high_prices,
+            low_prices=low_prices,
+        )
 
-        return backtest_from_db
+        kept_row_count = checkpoint["row_idx"] - backtest_from_db.backtest_range_start
+        new_balance_history = result.get_balance_history_columns()
+        balance_history = {
+            column_name: np.concatenate(
+                [values[:kept_row_count], new_balance_history[column_name]]
+            )
+            for column_name, values in balance_history.items()
+        }
+        new_trades = result.get_trades(idx_offset=kept_row_count, include_series=False)
+
+        TradeQuery.delete_trades_by_backtest_id(
+            backtest_id, offset=checkpoint["trade_count"]
+        )
+        TradeQuery.create_many_trade_entry(backtest_id, new_trades)
+        BalanceHistoryQuery.delete_entries_by_backtest_ids([backtest_id])
+        BalanceHistoryQuery.create_entries(backtest_id, balance_history)
+
+        BacktestQuery.update_backtest(
+            backtest_id,
+            {
+                **result.get_summary(asset_starting_price, asset_closing_price),
+                "backtest_range_end": row_count,
+                "simulation_checkpoint": get_simulation_checkpoint_json(
+                    backtestInfo,
+                    result.checkpoint,
+                    checkpoint["row_idx"],
+                    checkpoint["trade_count"],
+                    checkpoint["candles_time_delta"],
+                    dataset.data_version,
+                    get_dataset_rows_hash(
+                        range_df.iloc[:-1],
+                        kept_row_count,
+                        checkpoint["rows_hash"],
+                    ),
+                ),
+            },
+        )
+
+        return BacktestQuery.fetch_backtest_by_id(backtest_id)
+
+
+def get_signals_progress_share(use_vectorized_conditions: bool):
+    """Share of a backtest's progress taken by computing its signals. Vectorized
+    signals are near instant next to the simulation."""
+    return 0.0 if use_vectorized_conditions else ROW_SIGNALS_PROGRESS_SHARE
+
+
+def get_phase_progress_callback(progress_callback, start: float, end: float):
+    """Maps the progress of one phase of a backtest onto [start, end] of the
+    progress reported to progress_callback."""
+    if progress_callback is None:
+        return None
+    return lambda progress: progress_callback(start + progress * (end - start))
+
+
+def get_backtest_range_signals(
+    backtest: "ManualBacktest",
+    range_df: pd.DataFrame,
+    use_vectorized_conditions: bool,
+    range_includes_last_row: bool,
+    progress_callback=None,
+):
+    """progress_callback is called like in backtest_simulation.simulate, which
+    lets a cancelled job stop before its simulation starts."""
+    (
+        should_open_long,
+        should_open_short,
+        should_close_long,
+        should_close_short,
+    ) = (
+        backtest.get_vectorized_signals(range_df)
+        if use_vectorized_conditions
+        else backtest.get_row_signals(range_df, progress_callback)
+    )
+    if progress_callback is not None:
+        progress_callback(1.0)
+
+    if range_includes_last_row and len(range_df) > 0:
+        ## Force close trades on last row to make accounting easier
+        should_open_long[-1] = False
+        should_open_short[-1] = False
+        should_close_long[-1] = True
+        should_close_short[-1] = True
+
+    return should_open_long, should_open_short, should_close_long, should_close_short
+
+
+def is_short_signal(value):
+    """Short signals are only acted on when the condition returns True itself,
+    a truthy value such as 1 or a non-empty Series does not open or close one."""
+    return value is True or value is np.True_
+
+
+def get_vectorized_signal(trade_func, dataset_df: pd.DataFrame):
+    signal = np.array(trade_func(dataset_df), dtype=bool)
+
+    if signal.ndim == 0:
+        return np.full(len(dataset_df), bool(signal))
+
+    assert len(signal) == len(
+        dataset_df
+    ), f"{trade_func.__name__} returned {len(signal)} values for {len(dataset_df)} rows"
+    return signal
+
+
+def get_vectorized_short_signal(trade_func, dataset_df: pd.DataFrame):
+    signal = trade_func(dataset_df)
+
+    if (
+        isinstance(signal, (pd.Series, np.ndarray))
+        and signal.dtype == bool
+        and signal.shape == (len(dataset_df),)
+    ):
+        return np.array(signal, dtype=bool)
+
+    # anything else is evaluated row by row so that it follows is_short_signal
+    return np.fromiter(
+        (is_short_signal(trade_func(df_row)) for _, df_row in dataset_df.iterrows()),
+        dtype=bool,
+        count=len(dataset_df),
+    )
 
 
 class ManualBacktest:
@@ -185,20 +653,25 @@ class ManualBacktest:
         stop_loss_threshold_perc,
         max_klines_until_close: int,
         candles_time_delta,
+        use_intra_candle_thresholds: bool = False,
     ) -> None:
         short_fee_hourly_coeff = turn_short_fee_perc_to_coeff(
             short_fee_hourly_perc, candles_time_delta
         )
-        print(short_fee_hourly_coeff)
 
         self.enter_and_exit_criteria_placeholders = enter_and_exit_criteria_placeholders
+        (
+            self.open_long_trade,
+            self.open_short_trade,
+            self.close_long_trade,
+            self.close_short_trade,
+        ) = get_compiled_trade_funcs(self.get_trade_funcs_code())
         self.positions = Positions(
             start_balance,
             1 - (fees_perc / 100),
             1 - (slippage_perc / 100),
             short_fee_hourly_coeff,
         )
-        self.history: List = []
         self.use_short_selling = use_short_selling
         self.use_time_based_close = use_time_based_close
         self.max_klines_until_close = max_klines_until_close
@@ -212,101 +685,90 @@ class ManualBacktest:
         self.use_stop_loss_based_close = use_stop_loss_based_close
         self.take_profit_threshold_perc = take_profit_threshold_perc
         self.stop_loss_threshold_perc = stop_loss_threshold_perc
+        self.use_intra_candle_thresholds = use_intra_candle_thresholds
 
-    def process_df_row(self, df_row, price_col, timeseries_col, is_last_row):
-        code = BACKTEST_MANUAL_TEMPLATE
-        for key, value in self.enter_and_exit_criteria_placeholders.items():
-            code = code.replace(key, str(value))
-
-        results_dict = {"df_row": df_row}
-        exec(code, globals(), results_dict)
+    def get_trade_funcs_code(self):
+        return get_trade_funcs_code(self.enter_and_exit_criteria_placeholders)
 
-        ## Force close trades on last row to make accounting easier
-        should_open_long = (
-            results_dict["should_open_long"] if is_last_row is False else False
-        )
-        should_open_short = (
-            results_dict["should_open_short"] if is_last_row is False else False
-        )
-        should_close_long = (
-            results_dict["should_close_long"] if is_last_row is False else True
+    def get_vectorized_signals(self, dataset_df: pd.DataFrame):
+        return (
+            get_vectorized_signal(self.open_long_trade, dataset_df),
+            get_vectorized_short_signal(self.open_short_trade, dataset_df),
+            get_vectorized_signal(self.close_long_trade, dataset_df),
+            get_vectorized_short_signal(self.close_short_trade, dataset_df),
         )
-        should_close_short = (
-            results_dict["should_close_short"] if is_last_row is False else True
-        )
-
-        kline_open_time = df_row[timeseries_col]
-        price = df_row[price_col]
 
-        if (
-            self.pos_open_klines == self.max_klines_until_close
-            and self.use_time_based_close
-        ):
-            # auto close positions if time threshold is met
-            should_close_short = True
-            should_close_long = True
-
-        if self.use_profit_based_close and self.positions.take_profit_threshold_hit(
-            price, self.take_profit_threshold_perc
-        ):
-            should_close_long = True
-            should_close_short = True
-
-        if self.use_stop_loss_based_close and self.positions.stop_loss_threshold_hit(
-            price, self.stop_loss_threshold_perc
-        ):
-            should_close_long = True
-            should_close_short = True
-
-        self.tick(
-            price,
-            kline_open_time,
+    def get_row_signals(self, dataset_df: pd.DataFrame, progress_callback=None):
+        row_count = len(dataset_df)
+        progress_step = max(row_count // PROGRESS_UPDATE_COUNT, 1)
+        progress_idx = progress_step if progress_callback is not None else row_count
+        should_open_long = np.zeros(row_count, dtype=bool)
+        should_open_short = np.zeros(row_count, dtype=bool)
+        should_close_long = np.zeros(row_count, dtype=bool)
+        should_close_short = np.zeros(row_count, dtype=bool)
+
+        for i, (_, df_row) in enumerate(dataset_df.iterrows()):
+            if i == progress_idx:
+                progress_callback(i / row_count)
+                progress_idx += progress_step
+
+            should_open_long[i] = bool(self.open_long_trade(df_row))
+            should_open_short[i] = is_short_signal(self.open_short_trade(df_row))
+            should_close_long[i] = bool(self.close_long_trade(df_row))
+            should_close_short[i] = is_short_signal(self.close_short_trade(df_row))
+
+        return (
             should_open_long,
             should_open_short,
             should_close_long,
             should_close_short,
         )
 
-    def close_trade_cleanup(self):
-        self.pos_open_klines = 0
-
-    def update_data(self, price: float, kline_open_time: int):
-        if self.positions.position > 0.0 or self.positions.short_debt > 0.0:
-            self.positions_held_time += self.candles_time_delta
-
-        self.positions.update_balance(price, 0, kline_open_time)
-        self.pos_open_klines += 1
-        self.cumulative_time += self.candles_time_delta
+    def get_simulation_config(self):
+        return SimulationConfig(
+            self.positions.start_balance,
+            self.positions.fees,
+            self.positions.slippage,
+            self.positions.short_fee_coeff,
+            self.use_short_selling,
+            self.use_time_based_close,
+            self.max_klines_until_close,
+            self.use_profit_based_close,
+            self.take_profit_threshold_perc,
+            self.use_stop_loss_based_close,
+            self.stop_loss_threshold_perc,
+            self.candles_time_delta,
+            self.use_intra_candle_thresholds,
+        )
 
-    def tick(
+    def simulate(
         self,
-        price: float,
-        kline_open_time: int,
-        should_long: bool,
-        should_short: bool,
-        should_close_long: bool,
-        should_close_short: bool,
+        prices,
+        kline_open_times,
+        should_open_long,
+        should_open_short,
+        should_close_long,
+        should_close_short,
+        checkpoint_idx: Optional[int] = None,
+        high_prices=None,
+        low_prices=None,
+        progress_callback=None,
     ):
-        self.update_data(price, kline_open_time)
-
-        if self.positions.position > 0 and should_close_long:
-            self.positions.close_long(price, kline_open_time)
-
-        if (
-            self.positions.short_debt > 0
-            and should_close_short is True
-            and self.use_short_selling is True
-        ):
-            self.positions.close_short(price, kline_open_time)
-            self.close_trade_cleanup()
-
-        if self.positions.cash > 0 and should_long:
-            self.positions.go_long(price, 0, kline_open_time)
-            self.close_trade_cleanup()
-
-        if (
-            self.positions.short_debt == 0
-            and should_short is True
-            and self.use_short_selling is True
-        ):
-            self.positions.go_short(price, 0, kline_open_time)
+        result = simulate(
+            self.get_simulation_config(),
+            prices,
+            kline_open_times,
+            should_open_long,
+            should_open_short,
+            should_close_long,
+            should_close_short,
+            checkpoint_idx=checkpoint_idx,
+            high_prices=high_prices,
+            low_prices=low_prices,
+            progress_callback=progress_callback,
+        )
+        self.positions.apply_simulation_result(result)
+        self.pos_open_klines = result.state.pos_open_klines
+        self.cumulative_time = result.state.metrics.cumulative_time
+        self.positions_held_time = result.state.metrics.positions_held_time
+        return result
@@ -1,21 +1,168 @@
 import json
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, Optional
+import numpy as np
 
 from pandas.core.array_algos import take
 
 from log import LogExceptionContext
+from orm import engine
 from query_trade import TradeQuery
-from query_weights import ModelWeights
+from query_weights import ModelWeights, ModelWeightsQuery
 from query_trainjob import TrainJob, TrainJobQuery
 from query_backtest import BacktestQuery
-from request_types import BodyRunBacktest
+from query_balance_history import BalanceHistoryQuery
+from request_types import BodyRunBacktest, BodyRunEpochBacktests
 from code_gen_template import BACKTEST_MODEL_TEMPLATE
+from constants import Direction
+from backtest_jobs import reraise_job_cancellation
+from backtest_pool import map_in_process_pool
+from backtest_simulation import SimulationConfig, SimulationResult, simulate
+from backtest_utils import BacktestMetrics
+
+
+START_BALANCE = 10000
+FEES_PERC = 0.1
+SLIPPAGE_PERC = 0.1
+COMPILED_CRITERIA_FUNCS_CACHE_SIZE = 32
+EPOCH_COMPARISON_FIELDS = (
+    "end_balance",
+    "result_perc",
+    "max_drawdown_perc",
+    "trade_count",
+    "profit_factor",
+    "sharpe_ratio",
+)
+
+_epoch_worker_data: Dict = {}
+
+
+@lru_cache(maxsize=COMPILED_CRITERIA_FUNCS_CACHE_SIZE)
+def get_compiled_criteria_funcs(code: str):
+    criteria_funcs: Dict = {}
+    exec(compile(code, "<model_backtest>", "exec"), globals(), criteria_funcs)
+    return (
+        criteria_funcs["get_enter_trade_criteria"],
+        criteria_funcs["get_exit_trade_criteria"],
+    )
+
+
+def get_true_and_false_masks(values):
+    """Like tick, only True opens a position and only False closes one. Any other
+    value, such as None, leaves the position as it is."""
+    return (
+        np.fromiter(
+            (value is True or value is np.True_ for value in values),
+            dtype=bool,
+            count=len(values),
+        ),
+        np.fromiter(
+            (value is False or value is np.False_ for value in values),
+            dtype=bool,
+            count=len(values),
+        ),
+    )
+
+
+def get_prediction_signal(criteria_func, predictions: np.ndarray):
+    """Masks of the predictions the criteria returns True and False for."""
+    try:
+        signal = np.asarray(criteria_func(predictions))
+        if signal.shape == predictions.shape:
+            if signal.dtype == bool:
+                return signal, ~signal
+            return get_true_and_false_masks(signal.tolist())
+    except (TypeError, ValueError):
+        # the criteria branches on or converts its argument, which an array does not allow
+        pass
+
+    # criteria that can not take the whole array are called once per prediction
+    return get_true_and_false_masks(
+        [criteria_func(prediction) for prediction in predictions.tolist()]
+    )
+
+
+def get_model_backtest_replacements(enter_trade_cond: str, exit_trade_cond: str):
+    return {
+        "{ENTER_AND_EXIT_CRITERIA_FUNCS}": enter_trade_cond + "\n" + exit_trade_cond,
+    }
+
+
+def init_epoch_backtest_worker(
+    prices: List[float], kline_open_times: List[int], replacements: Dict
+):
+    # connections inherited from the parent process must not be reused here
+    engine.dispose(close=False)
+    _epoch_worker_data["prices"] = prices
+    _epoch_worker_data["kline_open_times"] = kline_open_times
+    _epoch_worker_data["replacements"] = replacements
+
+
+def run_epoch_backtest_task(task: Dict):
+    prices = _epoch_worker_data["prices"]
+    predictions = [
+        prediction[0]
+        for prediction in json.loads(
+            ModelWeightsQuery.fetch_val_predictions_by_id(task["model_weights_id"])
+        )
+    ]
+    assert len(prices) == len(predictions)
+
+    backtest_v2 = BacktestV2(
+        START_BALANCE, FEES_PERC, SLIPPAGE_PERC, _epoch_worker_data["replacements"]
+    )
+    result = backtest_v2.run_simulation(
+        prices,
+        _epoch_worker_data["kline_open_times"],
+        *backtest_v2.get_signals(predictions),
+    )
+    summary = result.get_summary()
+
+    return {
+        "epoch": task["epoch"],
+        "model_weights_id": task["model_weights_id"],
+        **{field: summary[field] for field in EPOCH_COMPARISON_FIELDS},
+    }
+
+
+def run_epoch_backtests(
+    train_job_id: int, body: BodyRunEpochBacktests, progress_callback=None
+):
+    """progress_callback is called with the share of epochs that have been
+    backtested, like in backtest_simulation.simulate."""
+    with LogExceptionContext(custom_handler=reraise_job_cancellation):
+        train_job: TrainJob = TrainJobQuery.get_train_job(train_job_id)
+        epochs = [
+            epoch
+            for epoch in ModelWeightsQuery.fetch_epochs_by_train_job_id(train_job_id)
+            if body.epoch_nrs is None or epoch["epoch"] in body.epoch_nrs
+        ]
+
+        results = map_in_process_pool(
+            run_epoch_backtest_task,
+            [
+                {"epoch": epoch["epoch"], "model_weights_id": epoch["id"]}
+                for epoch in epochs
+            ],
+            init_epoch_backtest_worker,
+            (
+                json.loads(train_job.backtest_prices),
+                json.loads(train_job.backtest_kline_open_times),
+                get_model_backtest_replacements(
+                    body.enter_trade_cond, body.exit_trade_cond
+                ),
+            ),
+            progress_callback,
+        )
 
-
-class Direction:
-    LONG = "long"
-    SHORT = "short"
-    CASH = "cash"
+        return [
+            {
+                **result,
+                "train_loss": epoch["train_loss"],
+                "val_loss": epoch["val_loss"],
+            }
+            for epoch, result in zip(epochs, results)
+        ]
 
 
 def run_model_backtest(train_job_id: int, backtestInfo: BodyRunBacktest):
@@ -30,20 +177,18 @@ def run_model_backtest(train_job_id: int, backtestInfo: BodyRunBacktest):
 
         assert len(prices) == len(predictions)
 
-        replacements = {
-            "{ENTER_AND_EXIT_CRITERIA_FUNCS}": backtestInfo.enter_trade_cond
-            + "\n"
-            + backtestInfo.exit_trade_cond,
-            "{PREDICTION}": None,
-        }
-
-        START_BALANCE = 10000
+        replacements = get_model_backtest_replacements(
+            backtestInfo.enter_trade_cond, backtestInfo.exit_trade_cond
+        )
 
-        backtest_v2 = BacktestV2(START_BALANCE, 0.1, 0.1, replacements)
-        for idx in range(len(prices)):
-            price = prices[idx]
-            prediction = predictions[idx]
-            backtest_v2.enter_kline(price, prediction[0], kline_open_time[idx])
+        backtest_v2 = BacktestV2(START_BALANCE, FEES_PERC, SLIPPAGE_PERC, replacements)
+        predictions = [prediction[0] for prediction in predictions]
+        result = backtest_v2.simulate(
+            prices,
+            predictions,
+            kline_open_time,
+            *backtest_v2.get_signals(predictions),
+        )
 
         end_balance = backtest_v2.positions.total_positions_value
 
@@ -51,7 +196,6 @@ def run_model_backtest(train_job_id: int, backtestInfo: BodyRunBacktest):
             {
                 "open_long_trade_cond": backtestInfo.enter_trade_cond,
                 "open_short_trade_cond": backtestInfo.exit_trade_cond,
-                "data": json.dumps(backtest_v2.positions.balance_history),
                 "model_weights_id": epochs[backtestInfo.epoch_nr]["id"],
                 "train_job_id": train_job.id,
                 "start_balance": START_BALANCE,
@@ -59,6 +203,9 @@ def run_model_backtest(train_job_id: int, backtestInfo: BodyRunBacktest):
             }
         )
 
+        BalanceHistoryQuery.create_entries(
+            backtest_id, result.get_balance_history_columns(predictions)
+        )
         TradeQuery.create_many_trade_entry(backtest_id, backtest_v2.positions.trades)
 
         backtest_from_db = BacktestQuery.fetch_backtest_by_id(backtest_id)
@@ -86,12 +233,13 @@ class Positions:
         self.balance_history = []
         self.trade_prices = []
         self.trade_predictions = []
+        self.metrics = BacktestMetrics(start_balance)
 
     def close_long(self, price: float, kline_open_time: int):
         self.cash += price * self.position
         self.position = 0.0
         self.cash = self.cash * self.slippage * self.fees
-        self.add_trade(price, kline_open_time, Direction.SHORT)
+        self.add_trade(price, kline_open_time, Direction.LONG)
 
     def reset_trade_track_data(self):
         self.trade_prices = []
@@ -102,6 +250,9 @@ class Positions:
         percent_result = (
             self.total_positions_value / self.enter_trade_balance - 1
         ) * 100
+        self.metrics.add_trade(
+            net_profit, percent_result, kline_open_time - self.enter_trade_time
+        )
 
         self.trades.append(
             {
@@ -179,6 +330,22 @@ class Positions:
 
         self.init_trade_track_data(price, prediction, kline_open_time)
 
+    def apply_simulation_result(
+        self, result: SimulationResult, predictions: Optional[List] = None
+    ):
+        state = result.state
+        self.cash = state.cash
+        self.position = state.position
+        self.short_debt = state.short_debt
+        self.total_positions_value = state.total_positions_value
+        self.buy_and_hold_position = state.buy_and_hold_position
+        self.enter_trade_price = state.enter_trade_price
+        self.enter_trade_time = state.enter_trade_time
+        self.enter_trade_balance = state.enter_trade_balance
+        self.metrics = state.metrics
+
+        self.trades = result.get_trades(predictions, include_series=False)
+
     def update_balance(self, price: float, prediction: float, kline_open_time: int):
         portfolio_worth = self.cash
         if self.position > 0.0:
@@ -188,6 +355,9 @@ class Positions:
             self.short_debt *= self.short_fee_coeff
         self.total_positions_value = portfolio_worth
         self.trade_prices.append(price)
+        self.metrics.update_balance(
+            portfolio_worth, self.position > 0.0 or self.short_debt > 0.0
+        )
 
         if self.buy_and_hold_position is None:
             self.buy_and_hold_position = self.start_balance / price
@@ -219,23 +389,88 @@ class BacktestV2:
             start_balance, 1 - (fees_perc / 100), 1 - (slippage_perc / 100)
         )
         self.history: List = []
+        (
+            self.get_enter_trade_criteria,
+            self.get_exit_trade_criteria,
+        ) = get_compiled_criteria_funcs(self.get_criteria_funcs_code())
 
-    def enter_kline(self, price: float, prediction: float, kline_open_time: int):
+    def get_criteria_funcs_code(self):
         code = BACKTEST_MODEL_TEMPLATE
         for key, value in self.enter_and_exit_criteria_placeholders.items():
-            if key == "{PREDICTION}":
-                code = code.replace(key, str(prediction))
-            else:
-                code = code.replace(key, str(value))
-        results_dict: Dict[str, bool] = {}
-        exec(code, globals(), results_dict)
-
-        should_enter_trade = results_dict["enter_trade"]
-        should_exit_trade = results_dict["exit_trade"]
+            code = code.replace(key, str(value))
+        return code
+
+    def get_trade_signals(self, prediction: float):
+        return (
+            self.get_enter_trade_criteria(prediction),
+            self.get_exit_trade_criteria(prediction),
+        )
+
+    def get_signals(self, predictions: List[float]):
+        """Go long, go short, close long and close short signals of the predictions."""
+        predictions = np.asarray(predictions, dtype=np.float64)
+        should_long, should_close_long = get_prediction_signal(
+            self.get_enter_trade_criteria, predictions
+        )
+        should_short, should_close_short = get_prediction_signal(
+            self.get_exit_trade_criteria, predictions
+        )
+        return should_long, should_short, should_close_long, should_close_short
+
+    def enter_kline(self, price: float, prediction: float, kline_open_time: int):
+        should_enter_trade, should_exit_trade = self.get_trade_signals(prediction)
         self.tick(
             price, prediction, kline_open_time, should_enter_trade, should_exit_trade
         )
 
+    def run_simulation(
+        self,
+        prices: List[float],
+        kline_open_times: List[int],
+        should_long,
+        should_short,
+        should_close_long,
+        should_close_short,
+    ):
+        return simulate(
+            SimulationConfig(
+                self.positions.start_balance,
+                self.positions.fees,
+                self.positions.slippage,
+                self.positions.short_fee_coeff,
+                candles_time_delta=kline_open_times[1] - kline_open_times[0]
+                if len(kline_open_times) > 1
+                else 0.0,
+            ),
+            prices,
+            kline_open_times,
+            np.asarray(should_long, dtype=bool),
+            np.asarray(should_short, dtype=bool),
+            np.asarray(should_close_long, dtype=bool),
+            np.asarray(should_close_short, dtype=bool),
+        )
+
+    def simulate(
+        self,
+        prices: List[float],
+        predictions: List[float],
+        kline_open_times: List[int],
+        should_long,
+        should_short,
+        should_close_long,
+        should_close_short,
+    ):
+        result = self.run_simulation(
+            prices,
+            kline_open_times,
+            should_long,
+            should_short,
+            should_close_long,
+            should_close_short,
+        )
+        self.positions.apply_simulation_result(result, predictions)
+        return result
+
     def update_data(self, price: float, prediction: float, kline_open_time: int):
         if self.positions.position > 0.0 or self.positions.short_debt > 0.0:
             self.positions.trade_predictions.append(prediction)
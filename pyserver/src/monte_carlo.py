@@ -0,0 +1,112 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from typing import Optional
+import numpy as np
+
+from log import LogExceptionContext
+from query_backtest import BacktestQuery
+from query_trade import TradeQuery
+
+
+MONTE_CARLO_METHODS = ("bootstrap", "shuffle")
+MONTE_CARLO_PERCENTILES = (5, 25, 50, 75, 95)
+MAX_MONTE_CARLO_ITERATIONS = 100000
+MONTE_CARLO_CHUNK_SIZE = 2_000_000
+
+
+def simulate_trade_paths(
+    trade_returns: np.ndarray,
+    iterations: int,
+    method: str,
+    seed_sequence: np.random.SeedSequence,
+):
+    """Final balance and max drawdown multipliers of resampled trade sequences.
+
+    trade_returns are per trade balance multipliers. Bootstrap draws trades with
+    replacement, shuffle reorders the same trades.
+    """
+    rng = np.random.default_rng(seed_sequence)
+    if method == "bootstrap":
+        paths = rng.choice(trade_returns, size=(iterations, len(trade_returns)))
+    else:
+        paths = rng.permuted(
+            np.broadcast_to(trade_returns, (iterations, len(trade_returns))), axis=1
+        )
+
+    np.cumprod(paths, axis=1, out=paths)
+    peaks = np.maximum.accumulate(paths, axis=1)
+    np.maximum(peaks, 1.0, out=peaks)
+    max_drawdowns = np.min(np.divide(paths, peaks, out=peaks), axis=1)
+    return paths[:, -1], max_drawdowns
+
+
+def get_percentiles(values: np.ndarray):
+    return {
+        str(percentile): float(value)
+        for percentile, value in zip(
+            MONTE_CARLO_PERCENTILES, np.percentile(values, MONTE_CARLO_PERCENTILES)
+        )
+    }
+
+
+def run_monte_carlo_analysis(
+    backtest_id: int,
+    iterations: int = 10000,
+    method: str = "bootstrap",
+    seed: Optional[int] = None,
+):
+    with LogExceptionContext():
+        assert method in MONTE_CARLO_METHODS, f"Unknown resampling method {method}"
+        assert (
+            0 < iterations <= MAX_MONTE_CARLO_ITERATIONS
+        ), f"Iterations must be between 1 and {MAX_MONTE_CARLO_ITERATIONS}"
+
+        backtest = BacktestQuery.fetch_backtest_by_id(
+            backtest_id, balance_history_columns=[]
+        )
+        assert backtest is not None, f"No backtest found for {backtest_id}"
+        # sleeve trades overlap and return a share of the portfolio, compounding them misstates it
+        assert (
+            backtest.portfolio_assets is None
+        ), "Monte Carlo analysis is not supported for portfolio backtests"
+
+        trade_returns = 1 + TradeQuery.fetch_percent_results(backtest_id) / 100
+        assert len(trade_returns) > 0, "Backtest has no trades to resample"
+
+        chunk_iterations = max(MONTE_CARLO_CHUNK_SIZE // len(trade_returns), 1)
+        chunk_sizes = [
+            min(chunk_iterations, iterations - start)
+            for start in range(0, iterations, chunk_iterations)
+        ]
+        seed_sequences = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+        # numpy releases the GIL in the array operations, so the chunks run in parallel
+        with ThreadPoolExecutor(
+            max_workers=min(os.cpu_count() or 1, len(chunk_sizes))
+        ) as executor:
+            chunk_results = list(
+                executor.map(
+                    simulate_trade_paths,
+                    repeat(trade_returns),
+                    chunk_sizes,
+                    repeat(method),
+                    seed_sequences,
+                )
+            )
+
+        final_multipliers = np.concatenate([result[0] for result in chunk_results])
+        max_drawdowns = np.concatenate([result[1] for result in chunk_results])
+        start_balance = backtest.start_balance
+
+        return {
+            "backtest_id": backtest_id,
+            "method": method,
+            "iterations": iterations,
+            "trade_count": len(trade_returns),
+            "start_balance": start_balance,
+            "end_balance": get_percentiles(final_multipliers * start_balance),
+            "result_perc": get_percentiles((final_multipliers - 1) * 100),
+            "max_drawdown_perc": get_percentiles((max_drawdowns - 1) * 100),
+            "probability_of_loss": float(np.mean(final_multipliers < 1)),
+        }
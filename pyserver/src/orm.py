@@ -24,5 +24,29 @@ def drop_tables():
     Base.metadata.drop_all(engine)
 
 
-def create_tables():
-    Base.metadata.create_all(engine)
+def add_missing_columns(bind=engine):
+    """create_all only creates missing tables, so columns and indexes added to the
+    models after their tables were created are added here. Expects every table to
+    exist and is safe to run again."""
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            table_columns = {
+                row[1]
+                for row in conn.exec_driver_sql(f'PRAGMA table_info("{table.name}")')
+            }
+            for column in table.columns:
+                if column.name in table_columns:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                conn.exec_driver_sql(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                )
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def create_tables(bind=engine):
+    Base.metadata.create_all(bind)
+    add_missing_columns(bind)
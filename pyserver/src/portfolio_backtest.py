@@ -0,0 +1,383 @@
+import json
+from typing import List
+import numpy as np
+
+from backtest_jobs import reraise_job_cancellation
+from backtest_simulation import PROGRESS_UPDATE_COUNT
+from backtest_utils import BacktestMetrics, turn_short_fee_perc_to_coeff
+from constants import Direction
+from dataset import read_dataset_columns_to_mem
+from db import get_df_candle_size
+from log import LogExceptionContext
+from manual_backtest import (
+    START_BALANCE,
+    ManualBacktest,
+    get_backtest_dataset_columns,
+    get_backtest_range_signals,
+    get_manual_backtest_replacements,
+    get_phase_progress_callback,
+    get_signals_progress_share,
+)
+from query_backtest import BacktestQuery
+from query_balance_history import BalanceHistoryQuery
+from query_dataset import DatasetQuery
+from query_trade import TradeQuery
+from request_types import BodyCreatePortfolioBacktest, BodyPortfolioAsset
+
+
+MAX_PORTFOLIO_ASSETS = 200
+
+
+class PortfolioAsset:
+    def __init__(
+        self,
+        dataset_id: int,
+        kline_open_times: np.ndarray,
+        prices: np.ndarray,
+        signals,
+    ) -> None:
+        self.dataset_id = dataset_id
+        self.kline_open_times = kline_open_times
+        self.prices = prices
+        self.signals = signals
+
+
+class PortfolioData:
+    """Asset prices and signals aligned on the union of their kline open times.
+
+    Arrays are shaped (kline, asset). Prices are forward filled and are NaN before an
+    asset's first kline, has_kline marks the klines where the asset has a row of its own.
+    Signals are False wherever the asset has no row.
+    """
+
+    def __init__(self, assets: List[PortfolioAsset]) -> None:
+        self.dataset_ids = [asset.dataset_id for asset in assets]
+        self.kline_open_times = np.unique(
+            np.concatenate([asset.kline_open_times for asset in assets])
+        )
+
+        shape = (len(self.kline_open_times), len(assets))
+        self.prices = np.full(shape, np.nan, dtype=np.float64)
+        self.has_kline = np.zeros(shape, dtype=bool)
+        self.signals = tuple(np.zeros(shape, dtype=bool) for _ in range(4))
+
+        for asset_idx, asset in enumerate(assets):
+            rows = np.searchsorted(self.kline_open_times, asset.kline_open_times)
+            self.prices[rows, asset_idx] = asset.prices
+            self.has_kline[rows, asset_idx] = True
+            for aligned_signal, signal in zip(self.signals, asset.signals):
+                aligned_signal[rows, asset_idx] = signal
+
+        self.prices = forward_fill_columns(self.prices)
+
+    def get_candles_time_delta(self):
+        if len(self.kline_open_times) < 2:
+            return 0.0
+        return float(np.median(np.diff(self.kline_open_times)))
+
+
+def forward_fill_columns(values: np.ndarray):
+    row_idx = np.where(~np.isnan(values), np.arange(len(values))[:, None], 0)
+    np.maximum.accumulate(row_idx, axis=0, out=row_idx)
+    return values[row_idx, np.arange(values.shape[1])]
+
+
+def get_portfolio_weights(assets: List[BodyPortfolioAsset]):
+    weights = np.array([asset.weight for asset in assets], dtype=np.float64)
+    assert np.all(weights >= 0), "Portfolio asset weights can not be negative"
+    assert weights.sum() > 0, "Portfolio asset weights must sum to a positive value"
+    return weights / weights.sum()
+
+
+def read_portfolio_asset(
+    asset: BodyPortfolioAsset,
+    backtestInfo: BodyCreatePortfolioBacktest,
+    progress_callback=None,
+):
+    dataset = DatasetQuery.fetch_dataset_by_id(asset.dataset_id)
+
+    assert dataset is not None, f"No dataset found for {asset.dataset_id}"
+    assert (
+        dataset.timeseries_column is not None
+    ), f"Timeseries column has not been set for {dataset.dataset_name}"
+    assert (
+        dataset.price_column is not None
+    ), f"Price column has not been set for {dataset.dataset_name}"
+
+    df = read_dataset_columns_to_mem(
+        dataset.dataset_name,
+        get_backtest_dataset_columns(dataset, get_manual_backtest_replacements(asset)),
+    )
+    assert len(df) > 0, f"Dataset {dataset.dataset_name} has no rows"
+    # only the signal functions are used, the simulation runs over the whole portfolio
+    backtest = ManualBacktest(
+        START_BALANCE,
+        backtestInfo.trading_fees_perc,
+        backtestInfo.slippage_perc,
+        backtestInfo.short_fee_hourly,
+        get_manual_backtest_replacements(asset),
+        backtestInfo.use_short_selling,
+        False,
+        False,
+        False,
+        0.0,
+        0.0,
+        -1,
+        get_df_candle_size(df, dataset.timeseries_column, formatted=False),
+    )
+    signals = get_backtest_range_signals(
+        backtest, df, backtestInfo.use_vectorized_conditions, True, progress_callback
+    )
+
+    return PortfolioAsset(
+        asset.dataset_id,
+        df[dataset.timeseries_column].to_numpy(dtype=np.int64),
+        df[dataset.price_column].to_numpy(dtype=np.float64),
+        signals,
+    )
+
+
+def simulate_portfolio(
+    data: PortfolioData,
+    weights: np.ndarray,
+    fees: float,
+    slippage: float,
+    short_fee_coeff: float = 1,
+    use_short_selling: bool = True,
+    rebalance_interval: int = 0,
+    candles_time_delta: float = 0.0,
+    progress_callback=None,
+):
+    """Runs the position state machine of backtest_simulation.simulate on one capital
+    sleeve per asset, with the state of every sleeve held in arrays.
+
+    The total worth is recorded before the trades of each kline are executed. Every
+    rebalance_interval klines the sleeves are scaled back to their target weights and
+    fees are paid on the traded notional of sleeves that hold a position.
+    progress_callback is called like in backtest_simulation.simulate.
+    """
+    prices = data.prices
+    kline_open_times = data.kline_open_times.tolist()
+    open_long, open_short, close_long, close_short = data.signals
+    kline_count, asset_count = prices.shape
+
+    cash = weights * START_BALANCE
+    position = np.zeros(asset_count, dtype=np.float64)
+    short_debt = np.zeros(asset_count, dtype=np.float64)
+    enter_trade_price = np.zeros(asset_count, dtype=np.float64)
+    enter_trade_time = np.zeros(asset_count, dtype=np.int64)
+    enter_trade_balance = np.zeros(asset_count, dtype=np.float64)
+    enter_trade_idx = np.zeros(asset_count, dtype=np.int64)
+    trade_costs = slippage * fees
+    metrics = BacktestMetrics(START_BALANCE)
+
+    portfolio_worth_arr = np.empty(kline_count, dtype=np.float64)
+    cash_arr = np.empty(kline_count, dtype=np.float64)
+    trades: List[dict] = []
+    progress_step = max(kline_count // PROGRESS_UPDATE_COUNT, 1)
+    progress_idx = progress_step if progress_callback is not None else kline_count
+
+    def close_trades(mask, direction, i, price, sleeve_worth):
+        for asset_idx in np.flatnonzero(mask).tolist():
+            net_result = float(sleeve_worth[asset_idx] - enter_trade_balance[asset_idx])
+            percent_result = float(
+                (sleeve_worth[asset_idx] / enter_trade_balance[asset_idx] - 1) * 100
+            )
+            open_time = int(enter_trade_time[asset_idx])
+            trades.append(
+                {
+                    "dataset_id": data.dataset_ids[asset_idx],
+                    "open_price": float(enter_trade_price[asset_idx]),
+                    "close_price": float(price[asset_idx]),
+                    "open_time": open_time,
+                    "close_time": kline_open_times[i],
+                    "direction": direction,
+                    "net_result": net_result,
+                    "percent_result": percent_result,
+                    "open_idx": int(enter_trade_idx[asset_idx]),
+                    "close_idx": i,
+                }
+            )
+            metrics.add_trade(
+                net_result, percent_result, kline_open_times[i] - open_time
+            )
+
+    def open_trades(mask, i, price, sleeve_worth):
+        enter_trade_price[mask] = price[mask]
+        enter_trade_time[mask] = kline_open_times[i]
+        enter_trade_balance[mask] = sleeve_worth[mask]
+        enter_trade_idx[mask] = i
+
+    for i in range(kline_count):
+        if i == progress_idx:
+            progress_callback(i / kline_count)
+            progress_idx += progress_step
+
+        price = np.nan_to_num(prices[i])
+        has_kline = data.has_kline[i]
+
+        sleeve_worth = cash + (position - short_debt) * price
+        short_debt *= short_fee_coeff
+        portfolio_worth = float(sleeve_worth.sum())
+        is_in_position = bool(np.any(position > 0) or np.any(short_debt > 0))
+        metrics.update_balance(portfolio_worth, is_in_position, candles_time_delta)
+
+        portfolio_worth_arr[i] = portfolio_worth
+        cash_arr[i] = cash.sum()
+
+        closing_longs = (position > 0) & close_long[i]
+        if closing_longs.any():
+            cash[closing_longs] += position[closing_longs] * price[closing_longs]
+            position[closing_longs] = 0.0
+            cash[closing_longs] *= trade_costs
+            close_trades(closing_longs, Direction.LONG, i, price, sleeve_worth)
+
+        if use_short_selling:
+            closing_shorts = (short_debt > 0) & close_short[i]
+            if closing_shorts.any():
+                cash[closing_shorts] -= (
+                    short_debt[closing_shorts] * price[closing_shorts]
+                )
+                short_debt[closing_shorts] = 0.0
+                cash[closing_shorts] *= trade_costs
+                close_trades(closing_shorts, Direction.SHORT, i, price, sleeve_worth)
+
+        is_flat = (position == 0) & (short_debt == 0) & (cash > 0) & has_kline
+
+        opening_longs = is_flat & open_long[i]
+        if opening_longs.any():
+            position[opening_longs] = (
+                cash[opening_longs] * trade_costs / price[opening_longs]
+            )
+            cash[opening_longs] = 0.0
+            open_trades(opening_longs, i, price, sleeve_worth)
+
+        if use_short_selling:
+            opening_shorts = is_flat & ~opening_longs & open_short[i]
+            if opening_shorts.any():
+                cash[opening_shorts] *= trade_costs
+                short_debt[opening_shorts] = (
+                    cash[opening_shorts] / price[opening_shorts]
+                )
+                cash[opening_shorts] *= 2
+                open_trades(opening_shorts, i, price, sleeve_worth)
+
+        if rebalance_interval and i > 0 and i % rebalance_interval == 0:
+            sleeve_worth = cash + (position - short_debt) * price
+            solvent = sleeve_worth > 0
+            if not solvent.any():
+                continue
+            target_worth = np.where(
+                solvent,
+                weights * sleeve_worth[solvent].sum() / weights[solvent].sum(),
+                sleeve_worth,
+            )
+            scale = np.divide(
+                target_worth, sleeve_worth, out=np.ones(asset_count), where=solvent
+            )
+            rebalance_costs = np.where(
+                (position > 0) | (short_debt > 0),
+                np.abs(target_worth - sleeve_worth) * (1 - trade_costs),
+                0.0,
+            )
+
+            cash *= scale
+            position *= scale
+            short_debt *= scale
+            enter_trade_balance *= scale
+            cash -= rebalance_costs
+
+    buy_and_hold_worth_arr = get_buy_and_hold_worth(prices, weights)
+
+    return (
+        metrics,
+        {
+            "portfolio_worth": portfolio_worth_arr,
+            "buy_and_hold_worth": buy_and_hold_worth_arr,
+            "kline_open_time": data.kline_open_times,
+            "cash": cash_arr,
+        },
+        trades,
+    )
+
+
+def get_buy_and_hold_worth(prices: np.ndarray, weights: np.ndarray):
+    sleeve_balances = weights * START_BALANCE
+    first_prices = prices[np.argmax(~np.isnan(prices), axis=0), np.arange(len(weights))]
+    held_worth = sleeve_balances * prices / first_prices
+    return np.where(np.isnan(prices), sleeve_balances, held_worth).sum(axis=1)
+
+
+def get_portfolio_backtest_fields(backtestInfo: BodyCreatePortfolioBacktest):
+    return {
+        "name": backtestInfo.name,
+        "use_short_selling": backtestInfo.use_short_selling,
+        "trading_fees_perc": backtestInfo.trading_fees_perc,
+        "rebalance_interval": backtestInfo.rebalance_interval,
+        "portfolio_assets": json.dumps(
+            [asset.model_dump() for asset in backtestInfo.assets]
+        ),
+    }
+
+
+def run_portfolio_backtest(
+    backtestInfo: BodyCreatePortfolioBacktest, progress_callback=None
+):
+    with LogExceptionContext(custom_handler=reraise_job_cancellation):
+        assert len(backtestInfo.assets) > 0, "Portfolio has no assets"
+        assert (
+            len(backtestInfo.assets) <= MAX_PORTFOLIO_ASSETS
+        ), f"Portfolio has {len(backtestInfo.assets)} assets, the maximum is {MAX_PORTFOLIO_ASSETS}"
+        assert (
+            backtestInfo.rebalance_interval is None
+            or backtestInfo.rebalance_interval > 0
+        ), "Rebalance interval must be positive"
+
+        weights = get_portfolio_weights(backtestInfo.assets)
+        asset_count = len(backtestInfo.assets)
+        signals_progress_share = get_signals_progress_share(
+            backtestInfo.use_vectorized_conditions
+        )
+        data = PortfolioData(
+            [
+                read_portfolio_asset(
+                    asset,
+                    backtestInfo,
+                    get_phase_progress_callback(
+                        progress_callback,
+                        signals_progress_share * i / asset_count,
+                        signals_progress_share * (i + 1) / asset_count,
+                    ),
+                )
+                for i, asset in enumerate(backtestInfo.assets)
+            ]
+        )
+        candles_time_delta = data.get_candles_time_delta()
+
+        metrics, balance_history, trades = simulate_portfolio(
+            data,
+            weights,
+            1 - (backtestInfo.trading_fees_perc / 100),
+            1 - (backtestInfo.slippage_perc / 100),
+            turn_short_fee_perc_to_coeff(
+                backtestInfo.short_fee_hourly, candles_time_delta
+            )
+            if candles_time_delta > 0
+            else 1,
+            backtestInfo.use_short_selling,
+            backtestInfo.rebalance_interval or 0,
+            candles_time_delta,
+            get_phase_progress_callback(progress_callback, signals_progress_share, 1.0),
+        )
+
+        buy_and_hold_worth = balance_history["buy_and_hold_worth"]
+        backtest_id = BacktestQuery.create_entry(
+            {
+                **get_portfolio_backtest_fields(backtestInfo),
+                **metrics.get_summary(buy_and_hold_worth[0], buy_and_hold_worth[-1]),
+            }
+        )
+        BalanceHistoryQuery.create_entries(backtest_id, balance_history)
+        TradeQuery.create_many_trade_entry(backtest_id, trades)
+
+        return BacktestQuery.fetch_backtest_by_id(backtest_id)
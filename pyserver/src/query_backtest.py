@@ -1,9 +1,11 @@
 import json
-from typing import Dict, List
-from sqlalchemy import Boolean, Column, Float, ForeignKey, Integer, String
+from typing import Dict, List, Optional
+from sqlalchemy import Boolean, Column, Float, ForeignKey, Integer, String, func
+from sqlalchemy.orm import defer
 
 from log import LogExceptionContext
 from orm import Base, Session
+from query_balance_history import BalanceHistoryQuery
 
 
 class Backtest(Base):
@@ -17,6 +19,7 @@ class Backtest(Base):
     use_profit_based_close = Column(Boolean)
     use_stop_loss_based_close = Column(Boolean)
     use_short_selling = Column(Boolean)
+    use_intra_candle_thresholds = Column(Boolean)
     klines_until_close = Column(Integer)
     name = Column(String)
     data = Column(String)
@@ -25,8 +28,8 @@ class Backtest(Base):
     gross_profit = Column(Float)
     gross_loss = Column(Float)
     model_weights_id = Column(Integer, ForeignKey("model_weights.id"))
-    train_job_id = Column(Integer, ForeignKey("train_job.id"))
-    dataset_id = Column(Integer, ForeignKey("dataset.id"))
+    train_job_id = Column(Integer, ForeignKey("train_job.id"), index=True)
+    dataset_id = Column(Integer, ForeignKey("dataset.id"), index=True)
     start_balance = Column(Float)
     end_balance = Column(Float)
     result_perc = Column(Float)
@@ -45,11 +48,43 @@ class Backtest(Base):
     market_exposure_time = Column(Float)
     risk_adjusted_return = Column(Float)
     buy_and_hold_cagr = Column(Float)
+    sharpe_ratio = Column(Float)
+    sortino_ratio = Column(Float)
+    calmar_ratio = Column(Float)
+    average_holding_time = Column(Float)
+    trading_fees_perc = Column(Float)
+    backtest_sweep_id = Column(Integer, ForeignKey("backtest_sweep.id"))
+    simulation_checkpoint = Column(String)
+    portfolio_assets = Column(String)
+    rebalance_interval = Column(Integer)
 
     def serialize_data(self, backtest_data):
         self.data = json.dumps(backtest_data)
 
 
+BACKTEST_SUMMARY_EXCLUDED_COLUMNS = (
+    "data",
+    "simulation_checkpoint",
+    "open_long_trade_cond",
+    "open_short_trade_cond",
+    "close_long_trade_cond",
+    "close_short_trade_cond",
+    "portfolio_assets",
+)
+BACKTEST_SUMMARY_COLUMNS = tuple(
+    column.name
+    for column in Backtest.__table__.columns
+    if column.name not in BACKTEST_SUMMARY_EXCLUDED_COLUMNS
+)
+BACKTEST_SUMMARY_METRIC_COLUMNS = tuple(
+    column.name
+    for column in Backtest.__table__.columns
+    if column.name in BACKTEST_SUMMARY_COLUMNS
+    and isinstance(column.type, (Float, Integer))
+    and not column.foreign_keys
+)
+
+
 class BacktestQuery:
     @staticmethod
     def deserialize_data(backtest: Backtest):
@@ -67,13 +102,36 @@ class BacktestQuery:
                 return entry.id
 
     @staticmethod
-    def fetch_backtest_by_id(backtest_id: int):
+    def create_many_entries(fields_list: List[Dict]):
+        with LogExceptionContext():
+            with Session() as session:
+                entries = [Backtest(**fields) for fields in fields_list]
+                session.add_all(entries)
+                session.commit()
+                return [entry.id for entry in entries]
+
+    @staticmethod
+    def list_query(session):
+        return session.query(Backtest).options(
+            defer(Backtest.data), defer(Backtest.simulation_checkpoint)
+        )
+
+    @staticmethod
+    def fetch_backtest_by_id(
+        backtest_id: int, balance_history_columns: Optional[List[str]] = None
+    ):
         with LogExceptionContext():
             with Session() as session:
                 backtest_data = (
                     session.query(Backtest).filter(Backtest.id == backtest_id).first()
                 )
-                return BacktestQuery.deserialize_data(backtest_data)
+                backtest_data = BacktestQuery.deserialize_data(backtest_data)
+
+            if backtest_data is not None and backtest_data.data is None:
+                backtest_data.data = BalanceHistoryQuery.fetch_balance_history(
+                    backtest_data.id, balance_history_columns
+                )
+            return backtest_data
 
     @staticmethod
     def update_backtest_data(backtest_id: int, new_data: dict):
@@ -84,27 +142,101 @@ class BacktestQuery:
                 )
                 session.commit()
 
+    @staticmethod
+    def update_backtest(backtest_id: int, fields: Dict):
+        with LogExceptionContext():
+            with Session() as session:
+                session.query(Backtest).filter(Backtest.id == backtest_id).update(
+                    fields
+                )
+                session.commit()
+
     @staticmethod
     def fetch_backtests_by_train_job_id(train_job_id: int):
         with LogExceptionContext():
             with Session() as session:
                 backtests = (
-                    session.query(Backtest)
+                    BacktestQuery.list_query(session)
                     .filter(Backtest.train_job_id == train_job_id)
                     .all()
                 )
-                return [BacktestQuery.deserialize_data(bt) for bt in backtests]
+                return backtests
 
     @staticmethod
     def fetch_backtests_by_dataset_id(dataset_id: int):
         with LogExceptionContext():
             with Session() as session:
                 backtests = (
-                    session.query(Backtest)
+                    BacktestQuery.list_query(session)
                     .filter(Backtest.dataset_id == dataset_id)
+                    .filter(Backtest.backtest_sweep_id.is_(None))
                     .all()
                 )
-                return [BacktestQuery.deserialize_data(bt) for bt in backtests]
+                return backtests
+
+    @staticmethod
+    def fetch_backtests_by_sweep_id(backtest_sweep_id: int, rank_by: str):
+        with LogExceptionContext():
+            with Session() as session:
+                backtests = (
+                    BacktestQuery.list_query(session)
+                    .filter(Backtest.backtest_sweep_id == backtest_sweep_id)
+                    .order_by(getattr(Backtest, rank_by).desc())
+                    .all()
+                )
+                return backtests
+
+    @staticmethod
+    def fetch_backtest_summaries(
+        dataset_id: Optional[int] = None,
+        train_job_id: Optional[int] = None,
+        sort_by: str = "id",
+        descending: bool = True,
+        metric_ranges: Optional[Dict[str, List]] = None,
+        page: int = 1,
+        page_size: int = 100,
+    ):
+        assert (
+            sort_by in BACKTEST_SUMMARY_METRIC_COLUMNS
+        ), f"Backtests can not be sorted by {sort_by}"
+        metric_ranges = metric_ranges if metric_ranges is not None else {}
+        for metric in metric_ranges:
+            assert (
+                metric in BACKTEST_SUMMARY_METRIC_COLUMNS
+            ), f"Backtests can not be filtered by {metric}"
+
+        with LogExceptionContext():
+            with Session() as session:
+                query = session.query(
+                    *[getattr(Backtest, column) for column in BACKTEST_SUMMARY_COLUMNS]
+                )
+
+                if dataset_id is not None:
+                    query = query.filter(
+                        Backtest.dataset_id == dataset_id,
+                        Backtest.backtest_sweep_id.is_(None),
+                    )
+                if train_job_id is not None:
+                    query = query.filter(Backtest.train_job_id == train_job_id)
+
+                for metric, (min_value, max_value) in metric_ranges.items():
+                    if min_value is not None:
+                        query = query.filter(getattr(Backtest, metric) >= min_value)
+                    if max_value is not None:
+                        query = query.filter(getattr(Backtest, metric) <= max_value)
+
+                total_count = query.with_entities(func.count(Backtest.id)).scalar()
+
+                sort_column = getattr(Backtest, sort_by)
+                query = query.order_by(
+                    sort_column.desc() if descending else sort_column, Backtest.id
+                )
+                rows = query.limit(page_size).offset((page - 1) * page_size).all()
+
+                return {
+                    "data": [dict(row._mapping) for row in rows],
+                    "total_count": total_count,
+                }
 
     @staticmethod
     def delete_backtests_by_ids(ids: List[int]):
@@ -0,0 +1,52 @@
+from typing import List
+from sqlalchemy import Column, ForeignKey, Integer, String
+
+from log import LogExceptionContext
+from orm import Base, Session
+
+
+class BacktestCache(Base):
+    __tablename__ = "backtest_cache"
+    id = Column(Integer, primary_key=True)
+    request_hash = Column(String, unique=True, index=True)
+    dataset_fingerprint = Column(String)
+    backtest_id = Column(Integer, ForeignKey("backtest.id"))
+
+
+class BacktestCacheQuery:
+    @staticmethod
+    def fetch_entry(request_hash: str):
+        with LogExceptionContext():
+            with Session() as session:
+                return (
+                    session.query(BacktestCache)
+                    .filter(BacktestCache.request_hash == request_hash)
+                    .first()
+                )
+
+    @staticmethod
+    def create_or_update_entry(
+        request_hash: str, dataset_fingerprint: str, backtest_id: int
+    ):
+        with LogExceptionContext():
+            with Session() as session:
+                entry = (
+                    session.query(BacktestCache)
+                    .filter(BacktestCache.request_hash == request_hash)
+                    .first()
+                )
+                if entry is None:
+                    entry = BacktestCache(request_hash=request_hash)
+                    session.add(entry)
+                entry.dataset_fingerprint = dataset_fingerprint
+                entry.backtest_id = backtest_id
+                session.commit()
+
+    @staticmethod
+    def delete_entries_by_backtest_ids(backtest_ids: List[int]):
+        with LogExceptionContext():
+            with Session() as session:
+                session.query(BacktestCache).filter(
+                    BacktestCache.backtest_id.in_(backtest_ids)
+                ).delete(synchronize_session=False)
+                session.commit()
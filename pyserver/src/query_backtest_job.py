@@ -0,0 +1,79 @@
+from typing import Dict
+from sqlalchemy import Column, Float, ForeignKey, Integer, String
+
+from log import LogExceptionContext
+from orm import Base, Session
+
+
+class BacktestJobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+BACKTEST_JOB_ACTIVE_STATUSES = (BacktestJobStatus.QUEUED, BacktestJobStatus.RUNNING)
+
+
+class BacktestJob(Base):
+    __tablename__ = "backtest_job"
+    id = Column(Integer, primary_key=True)
+    job_type = Column(String)
+    name = Column(String)
+    status = Column(String, default=BacktestJobStatus.QUEUED)
+    progress_perc = Column(Float, default=0.0)
+    backtest_id = Column(Integer, ForeignKey("backtest.id"))
+    error = Column(String)
+    result = Column(String)
+
+
+class BacktestJobQuery:
+    @staticmethod
+    def create_entry(fields: Dict):
+        with LogExceptionContext():
+            with Session() as session:
+                entry = BacktestJob(**fields)
+                session.add(entry)
+                session.commit()
+                return entry.id
+
+    @staticmethod
+    def fetch_job_by_id(job_id: int):
+        with LogExceptionContext():
+            with Session() as session:
+                return (
+                    session.query(BacktestJob).filter(BacktestJob.id == job_id).first()
+                )
+
+    @staticmethod
+    def fetch_active_jobs():
+        with LogExceptionContext():
+            with Session() as session:
+                return (
+                    session.query(BacktestJob)
+                    .filter(BacktestJob.status.in_(BACKTEST_JOB_ACTIVE_STATUSES))
+                    .order_by(BacktestJob.id)
+                    .all()
+                )
+
+    @staticmethod
+    def update_job(job_id: int, fields: Dict):
+        with LogExceptionContext():
+            with Session() as session:
+                session.query(BacktestJob).filter(BacktestJob.id == job_id).update(
+                    fields
+                )
+                session.commit()
+
+    @staticmethod
+    def on_shutdown_cleanup():
+        with LogExceptionContext():
+            with Session() as session:
+                session.query(BacktestJob).filter(
+                    BacktestJob.status.in_(BACKTEST_JOB_ACTIVE_STATUSES)
+                ).update(
+                    {"status": BacktestJobStatus.CANCELLED},
+                    synchronize_session=False,
+                )
+                session.commit()
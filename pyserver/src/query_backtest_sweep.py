@@ -0,0 +1,35 @@
+from typing import Dict
+from sqlalchemy import Column, ForeignKey, Integer, String
+
+from log import LogExceptionContext
+from orm import Base, Session
+
+
+class BacktestSweep(Base):
+    __tablename__ = "backtest_sweep"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    dataset_id = Column(Integer, ForeignKey("dataset.id"))
+    rank_by = Column(String)
+    run_count = Column(Integer)
+
+
+class BacktestSweepQuery:
+    @staticmethod
+    def create_entry(fields: Dict):
+        with LogExceptionContext():
+            with Session() as session:
+                entry = BacktestSweep(**fields)
+                session.add(entry)
+                session.commit()
+                return entry.id
+
+    @staticmethod
+    def fetch_sweep_by_id(backtest_sweep_id: int):
+        with LogExceptionContext():
+            with Session() as session:
+                return (
+                    session.query(BacktestSweep)
+                    .filter(BacktestSweep.id == backtest_sweep_id)
+                    .first()
+                )
@@ -0,0 +1,224 @@
+import zlib
+from typing import Dict, List, Optional
+import numpy as np
+from sqlalchemy import Column, ForeignKey, Integer, LargeBinary, String
+
+from backtest_utils import get_lttb_indices
+from log import LogExceptionContext
+from orm import Base, Session
+
+
+BALANCE_HISTORY_COLUMNS = (
+    "portfolio_worth",
+    "buy_and_hold_worth",
+    "prediction",
+    "kline_open_time",
+    "position",
+    "short_debt",
+    "cash",
+    "price",
+)
+
+DOWNSAMPLE_LEVELS = (256, 1024, 4096)
+DOWNSAMPLE_X_COLUMN = "kline_open_time"
+DOWNSAMPLE_Y_COLUMN = "portfolio_worth"
+
+
+class BalanceHistoryColumn(Base):
+    __tablename__ = "balance_history_column"
+    id = Column(Integer, primary_key=True)
+    backtest_id = Column(Integer, ForeignKey("backtest.id"), index=True)
+    column_name = Column(String)
+    level = Column(Integer)
+    dtype = Column(String)
+    length = Column(Integer)
+    data = Column(LargeBinary)
+
+    def decode(self):
+        return np.frombuffer(zlib.decompress(self.data), dtype=np.dtype(self.dtype))
+
+
+def encode_column(
+    backtest_id: int, column_name: str, values: np.ndarray, level: Optional[int] = None
+):
+    values = np.ascontiguousarray(values)
+    return BalanceHistoryColumn(
+        backtest_id=backtest_id,
+        column_name=column_name,
+        level=level,
+        dtype=values.dtype.str,
+        length=len(values),
+        data=zlib.compress(values.tobytes()),
+    )
+
+
+def downsample_columns(columns: Dict[str, np.ndarray], point_count: int):
+    if DOWNSAMPLE_X_COLUMN not in columns or DOWNSAMPLE_Y_COLUMN not in columns:
+        return columns
+
+    indices = get_lttb_indices(
+        columns[DOWNSAMPLE_X_COLUMN], columns[DOWNSAMPLE_Y_COLUMN], point_count
+    )
+    return {column_name: values[indices] for column_name, values in columns.items()}
+
+
+def get_downsampled_levels(columns: Dict[str, np.ndarray]):
+    length = len(next(iter(columns.values()), []))
+    return {
+        level: downsample_columns(columns, level)
+        for level in DOWNSAMPLE_LEVELS
+        if level < length
+    }
+
+
+def slice_columns_by_time(
+    columns: Dict[str, np.ndarray],
+    start_time: Optional[int] = None,
+    end_time: Optional[int] = None,
+):
+    kline_open_times = columns[DOWNSAMPLE_X_COLUMN]
+    start_idx = (
+        np.searchsorted(kline_open_times, start_time, side="left")
+        if start_time is not None
+        else 0
+    )
+    end_idx = (
+        np.searchsorted(kline_open_times, end_time, side="right")
+        if end_time is not None
+        else len(kline_open_times)
+    )
+    return {
+        column_name: values[start_idx:end_idx]
+        for column_name, values in columns.items()
+    }
+
+
+def balance_history_to_records(columns: Dict[str, np.ndarray]):
+    column_names = list(columns.keys())
+    return [
+        dict(zip(column_names, row))
+        for row in zip(*[columns[name].tolist() for name in column_names])
+    ]
+
+
+class BalanceHistoryQuery:
+    @staticmethod
+    def create_entries(backtest_id: int, columns: Dict[str, np.ndarray]):
+        with LogExceptionContext():
+            with Session() as session:
+                entries = [
+                    encode_column(backtest_id, column_name, values)
+                    for column_name, values in columns.items()
+                ]
+                for level, level_columns in get_downsampled_levels(columns).items():
+                    entries += [
+                        encode_column(backtest_id, column_name, values, level)
+                        for column_name, values in level_columns.items()
+                    ]
+                session.add_all(entries)
+                session.commit()
+
+    @staticmethod
+    def fetch_columns(
+        backtest_id: int,
+        column_names: Optional[List[str]] = None,
+        level: Optional[int] = None,
+    ):
+        with LogExceptionContext():
+            with Session() as session:
+                query = session.query(BalanceHistoryColumn).filter(
+                    BalanceHistoryColumn.backtest_id == backtest_id,
+                    BalanceHistoryColumn.level == level
+                    if level is not None
+                    else BalanceHistoryColumn.level.is_(None),
+                )
+                if column_names is not None:
+                    query = query.filter(
+                        BalanceHistoryColumn.column_name.in_(column_names)
+                    )
+
+                columns = {
+                    column.column_name: column.decode() for column in query.all()
+                }
+                return {
+                    column_name: columns[column_name]
+                    for column_name in BALANCE_HISTORY_COLUMNS
+                    if column_name in columns
+                }
+
+    @staticmethod
+    def fetch_balance_history(
+        backtest_id: int, column_names: Optional[List[str]] = None
+    ):
+        columns = BalanceHistoryQuery.fetch_columns(backtest_id, column_names)
+        if len(columns) == 0:
+            return None
+        return balance_history_to_records(columns)
+
+    @staticmethod
+    def fetch_levels(backtest_id: int):
+        with LogExceptionContext():
+            with Session() as session:
+                levels = (
+                    session.query(BalanceHistoryColumn.level)
+                    .filter(
+                        BalanceHistoryColumn.backtest_id == backtest_id,
+                        BalanceHistoryColumn.level.isnot(None),
+                    )
+                    .distinct()
+                    .all()
+                )
+                return sorted(level for (level,) in levels)
+
+    @staticmethod
+    def fetch_downsampled_balance_history(
+        backtest_id: int,
+        point_count: int,
+        start_time: Optional[int] = None,
+        end_time: Optional[int] = None,
+        column_names: Optional[List[str]] = None,
+    ):
+        requested_column_names = column_names
+        if column_names is not None:
+            column_names = list(
+                set(column_names) | {DOWNSAMPLE_X_COLUMN, DOWNSAMPLE_Y_COLUMN}
+            )
+
+        columns = None
+        for level in BalanceHistoryQuery.fetch_levels(backtest_id):
+            if level < point_count:
+                continue
+
+            level_columns = slice_columns_by_time(
+                BalanceHistoryQuery.fetch_columns(backtest_id, column_names, level),
+                start_time,
+                end_time,
+            )
+            if len(level_columns[DOWNSAMPLE_X_COLUMN]) >= point_count:
+                columns = level_columns
+                break
+
+        if columns is None:
+            columns = BalanceHistoryQuery.fetch_columns(backtest_id, column_names)
+            if len(columns) == 0:
+                return None
+            columns = slice_columns_by_time(columns, start_time, end_time)
+
+        columns = downsample_columns(columns, point_count)
+        if requested_column_names is not None:
+            columns = {
+                column_name: values
+                for column_name, values in columns.items()
+                if column_name in requested_column_names
+                or column_name == DOWNSAMPLE_X_COLUMN
+            }
+        return balance_history_to_records(columns)
+
+    @staticmethod
+    def delete_entries_by_backtest_ids(backtest_ids: List[int]):
+        with LogExceptionContext():
+            with Session() as session:
+                session.query(BalanceHistoryColumn).filter(
+                    BalanceHistoryColumn.backtest_id.in_(backtest_ids)
+                ).delete(synchronize_session=False)
+                session.commit()
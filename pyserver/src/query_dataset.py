@@ -1,5 +1,7 @@
+import time
 from pydantic import BaseModel
 from sqlalchemy import Column, Integer, String, update
+from dataset_cache import dataset_cache
 from log import LogExceptionContext
 from orm import Base, Session
 
@@ -20,6 +22,7 @@ class Dataset(Base):
     timeseries_column = Column(String)
     price_column = Column(String)
     target_column = Column(String)
+    data_version = Column(Integer, default=time.time_ns)
 
     def to_dict(self):
         return {
@@ -175,3 +178,15 @@ class DatasetQuery:
                     .values(price_column=new_price_column)
                 )
                 session.commit()
+
+    @staticmethod
+    def bump_data_version(dataset_name: str):
+        with LogExceptionContext():
+            with Session() as session:
+                session.execute(
+                    update(Dataset)
+                    .where(Dataset.dataset_name == dataset_name)
+                    .values(data_version=time.time_ns())
+                )
+                session.commit()
+        dataset_cache.invalidate(dataset_name)
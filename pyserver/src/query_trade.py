@@ -1,13 +1,45 @@
 import json
-from typing import List
-from sqlalchemy import Column, Float, ForeignKey, Integer, String
+from typing import List, Optional
+import numpy as np
+from sqlalchemy import (
+    Column,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    and_,
+    insert,
+    or_,
+)
 from log import LogExceptionContext
 
 from orm import Base, Session
+from query_balance_history import BalanceHistoryQuery
+
+
+TRADE_LIST_COLUMNS = (
+    "id",
+    "open_price",
+    "close_price",
+    "open_time",
+    "close_time",
+    "direction",
+    "net_result",
+    "percent_result",
+    "open_idx",
+    "close_idx",
+    "dataset_id",
+)
+TRADE_SERIES_COLUMNS = ("prices", "predictions")
+TRADE_SORT_FIELDS = ("close_time", "open_time", "net_result", "percent_result")
 
 
 class Trade(Base):
     __tablename__ = "trade"
+    __table_args__ = (
+        Index("ix_trade_backtest_id_close_time", "backtest_id", "close_time"),
+    )
     id = Column(Integer, primary_key=True)
     open_price = Column(Float)
     close_price = Column(Float)
@@ -16,9 +48,12 @@ class Trade(Base):
     direction = Column(String)
     net_result = Column(Float)
     percent_result = Column(Float)
-    backtest_id = Column(Integer, ForeignKey("backtest.id"))
+    backtest_id = Column(Integer, ForeignKey("backtest.id"), index=True)
     predictions = Column(String)
     prices = Column(String)
+    open_idx = Column(Integer)
+    close_idx = Column(Integer)
+    dataset_id = Column(Integer, ForeignKey("dataset.id"))
 
     def serialize(self, prices, predictions):
         self.prices = json.dumps(prices)
@@ -30,6 +65,14 @@ class Trade(Base):
         return self
 
 
+def get_trade_series(prices, predictions, open_idx: int, close_idx: int):
+    series = slice(open_idx, close_idx + 1)
+    return (
+        prices[series].tolist(),
+        predictions[series].tolist() if predictions is not None else [0],
+    )
+
+
 class TradeQuery:
     @staticmethod
     def create_many_trade_entry(backtest_id: int, trade_data: List[dict]):
@@ -38,21 +81,31 @@ class TradeQuery:
 
         with LogExceptionContext():
             with Session() as session:
-                trades = []
-                for item in trade_data:
-                    trade = Trade(
-                        backtest_id=backtest_id,
-                        open_price=item["open_price"],
-                        close_price=item["close_price"],
-                        open_time=item["open_time"],
-                        close_time=item["close_time"],
-                        direction=item["direction"],
-                        net_result=item["net_result"],
-                        percent_result=item["percent_result"],
-                    )
-                    trade.serialize(item.get("prices"), item.get("predictions"))
-                    trades.append(trade)
-                session.bulk_save_objects(trades)
+                session.execute(
+                    insert(Trade),
+                    [
+                        {
+                            "backtest_id": backtest_id,
+                            "open_price": item["open_price"],
+                            "close_price": item["close_price"],
+                            "open_time": item["open_time"],
+                            "close_time": item["close_time"],
+                            "direction": item["direction"],
+                            "net_result": item["net_result"],
+                            "percent_result": item["percent_result"],
+                            "open_idx": item.get("open_idx"),
+                            "close_idx": item.get("close_idx"),
+                            "dataset_id": item.get("dataset_id"),
+                            "prices": json.dumps(item["prices"])
+                            if "prices" in item
+                            else None,
+                            "predictions": json.dumps(item["predictions"])
+                            if "predictions" in item
+                            else None,
+                        }
+                        for item in trade_data
+                    ],
+                )
                 session.commit()
 
     @staticmethod
@@ -82,8 +135,144 @@ class TradeQuery:
                     session.query(Trade).filter(Trade.backtest_id == backtest_id).all()
                 )
 
-                trades = [Trade.deserialize(item) for item in trades]
-                return trades
+            return TradeQuery.attach_series(backtest_id, trades)
+
+    @staticmethod
+    def fetch_percent_results(backtest_id: int):
+        with LogExceptionContext():
+            with Session() as session:
+                rows = (
+                    session.query(Trade.percent_result)
+                    .filter(Trade.backtest_id == backtest_id)
+                    .order_by(Trade.close_time, Trade.id)
+                    .all()
+                )
+                return np.array([row[0] for row in rows], dtype=np.float64)
+
+    @staticmethod
+    def fetch_series_columns(backtest_id: int):
+        columns = BalanceHistoryQuery.fetch_columns(
+            backtest_id, ["price", "prediction"]
+        )
+        prices = columns.get("price")
+        predictions = columns.get("prediction")
+        if predictions is not None and predictions.dtype.kind != "f":
+            # backtests without model predictions store a column of zeros
+            predictions = None
+        return prices, predictions
+
+    @staticmethod
+    def attach_series(backtest_id: int, trades: List[Trade]):
+        prices = predictions = None
+        if any(trade.prices is None for trade in trades):
+            prices, predictions = TradeQuery.fetch_series_columns(backtest_id)
+
+        for trade in trades:
+            if trade.prices is None and prices is not None:
+                trade.prices, trade.predictions = get_trade_series(
+                    prices, predictions, trade.open_idx, trade.close_idx
+                )
+            elif isinstance(trade.prices, str):
+                trade.deserialize()
+
+        return trades
+
+    @staticmethod
+    def fetch_trades_page(
+        backtest_id: int,
+        sort_by: str = "close_time",
+        descending: bool = False,
+        direction: Optional[str] = None,
+        cursor: Optional[List] = None,
+        page_size: int = 100,
+        columns: Optional[List[str]] = None,
+    ):
+        columns = list(columns) if columns is not None else list(TRADE_LIST_COLUMNS)
+        assert sort_by in TRADE_SORT_FIELDS, f"Trades can not be sorted by {sort_by}"
+        for column in columns:
+            assert (
+                column in TRADE_LIST_COLUMNS or column in TRADE_SERIES_COLUMNS
+            ), f"Unknown trade column {column}"
+
+        include_series = any(column in TRADE_SERIES_COLUMNS for column in columns)
+        selected_columns = set(columns) | {"id", sort_by}
+        if include_series:
+            selected_columns |= {"open_idx", "close_idx", *TRADE_SERIES_COLUMNS}
+
+        sort_column = getattr(Trade, sort_by)
+
+        with LogExceptionContext():
+            with Session() as session:
+                query = session.query(
+                    *[getattr(Trade, column) for column in selected_columns]
+                ).filter(Trade.backtest_id == backtest_id)
+
+                if direction is not None:
+                    query = query.filter(Trade.direction == direction)
+
+                if cursor is not None:
+                    cursor_value, cursor_id = cursor
+                    if descending:
+                        query = query.filter(
+                            or_(
+                                sort_column < cursor_value,
+                                and_(sort_column == cursor_value, Trade.id < cursor_id),
+                            )
+                        )
+                    else:
+                        query = query.filter(
+                            or_(
+                                sort_column > cursor_value,
+                                and_(sort_column == cursor_value, Trade.id > cursor_id),
+                            )
+                        )
+
+                if descending:
+                    query = query.order_by(sort_column.desc(), Trade.id.desc())
+                else:
+                    query = query.order_by(sort_column, Trade.id)
+
+                rows = [dict(row._mapping) for row in query.limit(page_size + 1).all()]
+
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = [rows[-1][sort_by], rows[-1]["id"]]
+
+        if include_series:
+            prices = predictions = None
+            if any(row["prices"] is None for row in rows):
+                prices, predictions = TradeQuery.fetch_series_columns(backtest_id)
+
+            for row in rows:
+                if row["prices"] is not None:
+                    row["prices"] = json.loads(row["prices"])
+                    row["predictions"] = json.loads(row["predictions"])
+                elif prices is not None:
+                    row["prices"], row["predictions"] = get_trade_series(
+                        prices, predictions, row["open_idx"], row["close_idx"]
+                    )
+
+        return {
+            "data": [{column: row[column] for column in columns} for row in rows],
+            "next_cursor": next_cursor,
+        }
+
+    @staticmethod
+    def delete_trades_by_backtest_id(backtest_id: int, offset: int = 0):
+        with LogExceptionContext():
+            with Session() as session:
+                trade_ids = [
+                    trade_id
+                    for (trade_id,) in session.query(Trade.id)
+                    .filter(Trade.backtest_id == backtest_id)
+                    .order_by(Trade.id)
+                    .all()[offset:]
+                ]
+                session.query(Trade).filter(Trade.id.in_(trade_ids)).delete(
+                    synchronize_session=False
+                )
+                session.commit()
 
     @staticmethod
     def update_trade(trade_id: int, updated_data: dict):
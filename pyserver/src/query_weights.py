@@ -104,3 +104,38 @@ class ModelWeightsQuery:
                 ]
 
                 return weights_metadata_dict
+
+    @staticmethod
+    def fetch_epochs_by_train_job_id(train_job_id: int):
+        with LogExceptionContext():
+            with Session() as session:
+                epochs = (
+                    session.query(
+                        ModelWeights.id,
+                        ModelWeights.epoch,
+                        ModelWeights.train_loss,
+                        ModelWeights.val_loss,
+                    )
+                    .filter(ModelWeights.train_job_id == train_job_id)
+                    .order_by(ModelWeights.epoch)
+                    .all()
+                )
+                return [
+                    {
+                        "id": epoch.id,
+                        "epoch": epoch.epoch,
+                        "train_loss": epoch.train_loss,
+                        "val_loss": epoch.val_loss,
+                    }
+                    for epoch in epochs
+                ]
+
+    @staticmethod
+    def fetch_val_predictions_by_id(model_weights_id: int):
+        with LogExceptionContext():
+            with Session() as session:
+                return (
+                    session.query(ModelWeights.val_predictions)
+                    .filter(ModelWeights.id == model_weights_id)
+                    .scalar()
+                )
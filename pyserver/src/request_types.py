@@ -48,6 +48,14 @@ class BodyRunBacktest(BaseModel):
     price_col: str
 
 
+class BodyRunEpochBacktests(BaseModel):
+    dataset_name: str
+    enter_trade_cond: str
+    exit_trade_cond: str
+    price_col: str
+    epoch_nrs: Optional[List[int]] = None
+
+
 class BodyDeleteDatasets(BaseModel):
     dataset_names: List[str]
 
@@ -76,6 +84,51 @@ class BodyCreateManualBacktest(BaseModel):
     stop_loss_threshold_perc: float
     name: Optional[str] = None
     klines_until_close: Optional[int] = None
+    use_vectorized_conditions: bool = False
+    use_intra_candle_thresholds: bool = False
+
+
+class BodyPortfolioAsset(BaseModel):
+    dataset_id: int
+    open_long_trade_cond: str
+    close_long_trade_cond: str
+    open_short_trade_cond: str
+    close_short_trade_cond: str
+    weight: float = 1.0
+
+
+class BodyCreatePortfolioBacktest(BaseModel):
+    assets: List[BodyPortfolioAsset]
+    use_short_selling: bool
+    trading_fees_perc: float
+    slippage_perc: float
+    short_fee_hourly: float
+    name: Optional[str] = None
+    rebalance_interval: Optional[int] = None
+    use_vectorized_conditions: bool = True
+
+
+class BodySweepRange(BaseModel):
+    start: float
+    end: float
+    step: float
+
+
+class BodyCreateBacktestSweep(BaseModel):
+    backtest: BodyCreateManualBacktest
+    trading_fees_perc: Optional[BodySweepRange] = None
+    take_profit_threshold_perc: Optional[BodySweepRange] = None
+    stop_loss_threshold_perc: Optional[BodySweepRange] = None
+    klines_until_close: Optional[BodySweepRange] = None
+    rank_by: str = "result_perc"
+    save_balance_history: bool = False
+    save_trades: bool = False
+
+
+class BodyCreateWalkForwardBacktest(BaseModel):
+    backtest: BodyCreateManualBacktest
+    window_count: int
+    anchored: bool = False
 
 
 class BodyDeleteManyBacktestsById:
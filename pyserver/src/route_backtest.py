@@ -3,27 +3,156 @@ from typing import List
 from fastapi import APIRouter, HTTPException, Query, status
 from fastapi.responses import Response
 
+from backtest_jobs import get_backtest_job_queue
+from backtest_sweep import run_backtest_sweep
 from context import HttpResponseContext
-from manual_backtest import run_manual_backtest
+from manual_backtest import extend_manual_backtest, run_manual_backtest
+from monte_carlo import run_monte_carlo_analysis
+from portfolio_backtest import run_portfolio_backtest
 from query_backtest import BacktestQuery
+from query_backtest_cache import BacktestCacheQuery
+from query_backtest_job import BacktestJobQuery
+from query_balance_history import BalanceHistoryQuery
+from query_backtest_sweep import BacktestSweepQuery
 from query_trade import TradeQuery
-from request_types import BodyCreateManualBacktest, BodyDeleteManyBacktestsById
+from request_types import (
+    BodyCreateBacktestSweep,
+    BodyCreateManualBacktest,
+    BodyCreatePortfolioBacktest,
+    BodyCreateWalkForwardBacktest,
+    BodyDeleteManyBacktestsById,
+)
+from walk_forward import run_walk_forward_backtest
 
 
 router = APIRouter()
+backtest_job_queue = get_backtest_job_queue()
 
 
 class RoutePaths:
     BACKTEST = "/"
     DELETE_MANY = "/delete-many"
+    SWEEP = "/sweep"
+    SWEEP_BY_ID = "/sweep/{sweep_id}"
+    WALK_FORWARD = "/walk-forward"
+    PORTFOLIO = "/portfolio"
+    JOB = "/job"
+    PORTFOLIO_JOB = "/portfolio/job"
+    JOB_BY_ID = "/job/{job_id}"
+    CANCEL_JOB = "/job/{job_id}/cancel"
+    SUMMARY = "/summary"
     BACKTEST_BY_ID = "/{backtest_id}"
+    EXTEND_BACKTEST = "/{backtest_id}/extend"
+    BALANCE_HISTORY = "/{backtest_id}/balance-history"
+    TRADES = "/{backtest_id}/trades"
+    MONTE_CARLO = "/{backtest_id}/monte-carlo"
     FETCH_BY_DATASET_ID = "/dataset/{dataset_id}"
 
 
+@router.post(RoutePaths.SWEEP)
+async def route_create_backtest_sweep(body: BodyCreateBacktestSweep):
+    with HttpResponseContext():
+        sweep_id = await backtest_job_queue.run(run_backtest_sweep, body)
+        return {"data": sweep_id}
+
+
+@router.post(RoutePaths.WALK_FORWARD)
+async def route_create_walk_forward_backtest(body: BodyCreateWalkForwardBacktest):
+    with HttpResponseContext():
+        walk_forward_result = await backtest_job_queue.run(
+            run_walk_forward_backtest, body
+        )
+        return {"data": walk_forward_result}
+
+
+@router.post(RoutePaths.PORTFOLIO)
+async def route_create_portfolio_backtest(body: BodyCreatePortfolioBacktest):
+    with HttpResponseContext():
+        backtest = await backtest_job_queue.run(run_portfolio_backtest, body)
+        return {"data": backtest}
+
+
+@router.post(RoutePaths.JOB)
+async def route_submit_manual_backtest_job(body: BodyCreateManualBacktest):
+    with HttpResponseContext():
+        job_id = backtest_job_queue.submit(
+            "manual", body.name, run_manual_backtest, body
+        )
+        return {"id": job_id}
+
+
+@router.post(RoutePaths.PORTFOLIO_JOB)
+async def route_submit_portfolio_backtest_job(body: BodyCreatePortfolioBacktest):
+    with HttpResponseContext():
+        job_id = backtest_job_queue.submit(
+            "portfolio", body.name, run_portfolio_backtest, body
+        )
+        return {"id": job_id}
+
+
+@router.get(RoutePaths.JOB_BY_ID)
+async def route_get_backtest_job(job_id: int):
+    with HttpResponseContext():
+        job = BacktestJobQuery.fetch_job_by_id(job_id)
+        if job is None:
+            raise HTTPException(
+                detail=f"No backtest job found for {job_id}", status_code=400
+            )
+        return {"data": job}
+
+
+@router.post(RoutePaths.CANCEL_JOB)
+async def route_cancel_backtest_job(job_id: int):
+    with HttpResponseContext():
+        if not backtest_job_queue.cancel(job_id):
+            raise HTTPException(
+                detail=f"Backtest job {job_id} is not queued or running",
+                status_code=400,
+            )
+        return {"data": job_id}
+
+
+@router.get(RoutePaths.SWEEP_BY_ID)
+async def route_get_backtest_sweep(sweep_id):
+    with HttpResponseContext():
+        sweep = BacktestSweepQuery.fetch_sweep_by_id(sweep_id)
+        if sweep is None:
+            raise HTTPException(
+                detail=f"No backtest sweep found for {sweep_id}", status_code=400
+            )
+
+        backtests = BacktestQuery.fetch_backtests_by_sweep_id(sweep.id, sweep.rank_by)
+        return {"data": sweep, "backtests": backtests}
+
+
+@router.get(RoutePaths.SUMMARY)
+async def route_get_backtest_summaries(
+    dataset_id: int = Query(None),
+    train_job_id: int = Query(None),
+    sort_by: str = Query("id"),
+    descending: bool = Query(True),
+    metric_ranges: str = Query(None),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(100, ge=1, le=1000),
+):
+    with HttpResponseContext():
+        return BacktestQuery.fetch_backtest_summaries(
+            dataset_id,
+            train_job_id,
+            sort_by,
+            descending,
+            json.loads(metric_ranges) if metric_ranges is not None else None,
+            page,
+            page_size,
+        )
+
+
 @router.get(RoutePaths.BACKTEST_BY_ID)
-async def route_get_backtest_by_id(backtest_id):
+async def route_get_backtest_by_id(backtest_id, columns: str = Query(None)):
     with HttpResponseContext():
-        backtest = BacktestQuery.fetch_backtest_by_id(backtest_id)
+        backtest = BacktestQuery.fetch_backtest_by_id(
+            backtest_id, json.loads(columns) if columns is not None else None
+        )
         if backtest is None:
             raise HTTPException(
                 detail=f"No backtest found for {backtest_id}", status_code=400
@@ -33,10 +162,77 @@ async def route_get_backtest_by_id(backtest_id):
         return {"data": backtest, "trades": trades}
 
 
+@router.get(RoutePaths.BALANCE_HISTORY)
+async def route_get_balance_history(
+    backtest_id: int,
+    points: int = Query(1000, ge=3),
+    start_time: int = Query(None),
+    end_time: int = Query(None),
+    columns: str = Query(None),
+):
+    with HttpResponseContext():
+        balance_history = BalanceHistoryQuery.fetch_downsampled_balance_history(
+            backtest_id,
+            points,
+            start_time,
+            end_time,
+            json.loads(columns) if columns is not None else None,
+        )
+        if balance_history is None:
+            raise HTTPException(
+                detail=f"No balance history found for {backtest_id}", status_code=400
+            )
+
+        return {"data": balance_history}
+
+
+@router.get(RoutePaths.TRADES)
+async def route_get_trades(
+    backtest_id: int,
+    sort_by: str = Query("close_time"),
+    descending: bool = Query(False),
+    direction: str = Query(None),
+    cursor: str = Query(None),
+    page_size: int = Query(100, ge=1, le=1000),
+    columns: str = Query(None),
+):
+    with HttpResponseContext():
+        return TradeQuery.fetch_trades_page(
+            backtest_id,
+            sort_by,
+            descending,
+            direction,
+            json.loads(cursor) if cursor is not None else None,
+            page_size,
+            json.loads(columns) if columns is not None else None,
+        )
+
+
+@router.get(RoutePaths.MONTE_CARLO)
+async def route_get_monte_carlo_analysis(
+    backtest_id: int,
+    iterations: int = Query(10000),
+    method: str = Query("bootstrap"),
+    seed: int = Query(None),
+):
+    with HttpResponseContext():
+        analysis = await backtest_job_queue.run(
+            run_monte_carlo_analysis, backtest_id, iterations, method, seed
+        )
+        return {"data": analysis}
+
+
 @router.post(RoutePaths.BACKTEST)
 async def route_create_manual_backtest(body: BodyCreateManualBacktest):
     with HttpResponseContext():
-        backtest = run_manual_backtest(body)
+        backtest = await backtest_job_queue.run(run_manual_backtest, body)
+        return {"data": backtest}
+
+
+@router.post(RoutePaths.EXTEND_BACKTEST)
+async def route_extend_manual_backtest(backtest_id: int):
+    with HttpResponseContext():
+        backtest = await backtest_job_queue.run(extend_manual_backtest, backtest_id)
         return {"data": backtest}
 
 
@@ -50,7 +246,10 @@ async def route_fetch_by_dataset_id(dataset_id):
 @router.delete(RoutePaths.DELETE_MANY)
 async def route_delete_many(list_of_ids: str = Query(...)):
     with HttpResponseContext():
-        BacktestQuery.delete_backtests_by_ids(json.loads(list_of_ids))
+        backtest_ids = json.loads(list_of_ids)
+        BalanceHistoryQuery.delete_entries_by_backtest_ids(backtest_ids)
+        BacktestCacheQuery.delete_entries_by_backtest_ids(backtest_ids)
+        BacktestQuery.delete_backtests_by_ids(backtest_ids)
         return Response(
             content="OK", status_code=status.HTTP_200_OK, media_type="text/plain"
         )
@@ -2,6 +2,7 @@ import os
 import asyncio
 import base64
 
+from functools import partial
 from typing import List
 
 from fastapi.responses import FileResponse
@@ -38,9 +39,11 @@ from request_types import (
 )
 from utils import (
     PythonCode,
-    add_to_datasets_db,
-    read_file_to_dataframe,
+    import_csv_to_datasets_db,
     remove_all_csv_files,
+    rm_file,
+    send_dataset_import_progress,
+    spool_upload_to_disk,
 )
 
 
@@ -78,6 +81,7 @@ async def route_exec_python_on_column(
     with HttpResponseContext():
         python_program = PythonCode.on_column(dataset_name, column_name, body.code)
         exec_python(python_program)
+        DatasetQuery.bump_data_version(dataset_name)
         return {"message": "OK"}
 
 
@@ -90,6 +94,7 @@ async def route_exec_python_on_dataset(
         null_fill_strat = NullFillStrategy[body.null_fill_strategy]
         python_program = PythonCode.on_dataset(dataset_name, body.code)
         exec_python(python_program)
+        DatasetQuery.bump_data_version(dataset_name)
         df_fill_nulls_on_all_cols(dataset_name, null_fill_strat)
         return {"message": "OK"}
 
@@ -223,10 +228,18 @@ async def route_upload_timeseries_data(
     file: UploadFile, dataset_name: str, timeseries_col: str
 ):
     with HttpResponseContext():
-        df = await read_file_to_dataframe(file, STREAMING_DEFAULT_CHUNK_SIZE)
-        add_to_datasets_db(df, dataset_name)
+        csv_path = await spool_upload_to_disk(file, STREAMING_DEFAULT_CHUNK_SIZE)
+        try:
+            row_count, column_count = await asyncio.to_thread(
+                import_csv_to_datasets_db,
+                csv_path,
+                dataset_name,
+                partial(send_dataset_import_progress, dataset_name),
+            )
+        finally:
+            rm_file(csv_path)
         DatasetQuery.create_dataset_entry(dataset_name, timeseries_col)
-        return {"message": "OK", "shape": df.shape}
+        return {"message": "OK", "shape": (row_count, column_count)}
 
 
 @router.post(RoutePaths.CREATE_MODEL)
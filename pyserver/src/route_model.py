@@ -1,7 +1,9 @@
 import asyncio
+from functools import partial
 from fastapi import APIRouter, Response, status
-from model_backtest import run_model_backtest
+from model_backtest import run_epoch_backtests, run_model_backtest
 
+from backtest_jobs import backtest_job_queue, get_json_result_job_fields
 from context import HttpResponseContext
 from db import get_dataset_columns
 from query_backtest import BacktestQuery
@@ -10,7 +12,7 @@ from query_model import ModelQuery
 from query_trainjob import TrainJobQuery
 from code_gen import start_train_loop
 from config import is_testing
-from request_types import BodyCreateTrain, BodyRunBacktest
+from request_types import BodyCreateTrain, BodyRunBacktest, BodyRunEpochBacktests
 
 
 router = APIRouter()
@@ -24,6 +26,7 @@ class RoutePaths:
     STOP_TRAIN = "/train/stop/{train_job_id}"
     TRAIN_JOB_AND_ALL_WEIGHT_METADATA_BY_ID = "/train/{train_job_id}/detailed"
     RUN_BACKTEST = "/backtest/{train_job_id}/run"
+    RUN_EPOCH_BACKTESTS = "/backtest/{train_job_id}/run-epochs"
     BACKTESTS = "/backtest/{train_job_id}"
 
 
@@ -99,6 +102,25 @@ async def route_run_backtest(train_job_id: int, body: BodyRunBacktest):
         return {"data": res}
 
 
+@router.post(RoutePaths.RUN_EPOCH_BACKTESTS)
+async def route_run_epoch_backtests(train_job_id: int, body: BodyRunEpochBacktests):
+    with HttpResponseContext():
+        price_col = DatasetQuery.get_price_col(body.dataset_name)
+        if price_col is None:
+            DatasetQuery.update_price_column(body.dataset_name, body.price_col)
+            TrainJobQuery.set_backtest_prices(
+                train_job_id, body.dataset_name, body.price_col
+            )
+        job_id = backtest_job_queue.submit(
+            "epochs",
+            None,
+            partial(run_epoch_backtests, train_job_id),
+            body,
+            get_json_result_job_fields,
+        )
+        return {"id": job_id}
+
+
 @router.get(RoutePaths.BACKTESTS)
 async def route_get_backtests(train_job_id: int):
     with HttpResponseContext():
@@ -1,19 +1,29 @@
+import logging
+import tempfile
 import threading
-from io import BytesIO
+import uuid
 import os
+from typing import Callable, Dict, Optional
 from fastapi import UploadFile
 import pandas as pd
 import sqlite3
 
 from constants import (
+    CSV_IMPORT_CHUNK_ROWS,
     DB_DATASETS,
     STREAMING_DEFAULT_CHUNK_SIZE,
+    Signals,
 )
 from config import append_app_data_path
-from log import LogExceptionContext
+from log import get_logger
+from query_backtest_job import BacktestJobQuery
+from query_dataset import DatasetQuery
 from query_trainjob import TrainJobQuery
 
 
+CSV_DTYPE_WIDENINGS = {"boolean": "object", "Int64": "float64", "float64": "object"}
+
+
 def convert_val_split_str_to_arr(val_split_str: str):
     parts = val_split_str.split(",")
     return [int(parts[0]), int(parts[1])]
@@ -24,31 +34,106 @@ def rm_file(path):
         os.remove(path)
 
 
-def add_to_datasets_db(df: pd.DataFrame, table_name: str):
-    with sqlite3.connect(append_app_data_path(DB_DATASETS)) as conn:
-        df.to_sql(table_name, conn, if_exists="replace", index=False)
-
-
 def remove_all_csv_files(directory):
     for file in os.listdir(directory):
         if file.endswith(".csv"):
             os.remove(os.path.join(directory, file))
 
 
-async def read_file_to_dataframe(
+async def spool_upload_to_disk(
     file: UploadFile, chunk_size: int = STREAMING_DEFAULT_CHUNK_SIZE
-) -> pd.DataFrame:
-    with LogExceptionContext():
-        chunks = []
-
+):
+    fd, path = tempfile.mkstemp(suffix=".upload", dir=append_app_data_path(""))
+    with os.fdopen(fd, "wb") as f:
         while True:
             chunk = await file.read(chunk_size)
             if not chunk:
                 break
-            chunks.append(chunk)
+            f.write(chunk)
+    return path
+
+
+def send_dataset_import_progress(dataset_name: str, progress: float, row_count: int):
+    logger = get_logger()
+    logger.log(
+        Signals.DATASET_IMPORT_PROGRESS.format(
+            DATASET_NAME=dataset_name,
+            PROGRESS_PERC=round(progress * 100, 2),
+            ROW_COUNT=row_count,
+        ),
+        logging.DEBUG,
+    )
+
+
+def get_csv_dtype_schema(sample_df: pd.DataFrame):
+    schema = {}
+    for column, dtype in sample_df.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            schema[column] = "boolean"
+        elif pd.api.types.is_integer_dtype(dtype):
+            schema[column] = "Int64"
+        elif pd.api.types.is_float_dtype(dtype):
+            schema[column] = "float64"
+        else:
+            schema[column] = "object"
+    return schema
+
+
+def apply_csv_dtype_schema(chunk: pd.DataFrame, schema: Dict):
+    """Casts the chunk to the schema. A column that does not fit its dtype, such as
+    an integer column holding a fraction further down the file, is widened for
+    this and every following chunk."""
+    for column, dtype in schema.items():
+        while True:
+            try:
+                chunk[column] = chunk[column].astype(dtype)
+                break
+            except (TypeError, ValueError):
+                dtype = CSV_DTYPE_WIDENINGS[dtype]
+                schema[column] = dtype
+    return chunk
+
+
+def import_csv_to_datasets_db(
+    csv_path: str, table_name: str, progress_callback: Optional[Callable] = None
+):
+    """Parses the CSV in chunks cast to the dtypes inferred from its first rows and
+    appends every chunk to a staging table in its own transaction, so memory use
+    does not grow with the file. The staging table replaces table_name once the
+    whole file has been imported."""
+    sample_df = pd.read_csv(csv_path, nrows=CSV_IMPORT_CHUNK_ROWS)
+    schema = get_csv_dtype_schema(sample_df)
+    staging_table_name = f"{table_name}_import_{uuid.uuid4().hex}"
+    file_size = os.path.getsize(csv_path)
+    row_count = 0
 
-        file_bytes = b"".join(chunks)
-        return pd.read_csv(BytesIO(file_bytes))
+    with sqlite3.connect(append_app_data_path(DB_DATASETS)) as conn:
+        sample_df.head(0).astype(schema).to_sql(
+            staging_table_name, conn, if_exists="replace", index=False
+        )
+        try:
+            with open(csv_path, "rb") as f:
+                for chunk in pd.read_csv(f, chunksize=CSV_IMPORT_CHUNK_ROWS):
+                    apply_csv_dtype_schema(chunk, schema)
+                    chunk.to_sql(
+                        staging_table_name, conn, if_exists="append", index=False
+                    )
+                    row_count += len(chunk)
+                    if progress_callback is not None:
+                        progress_callback(f.tell() / max(file_size, 1), row_count)
+
+            conn.execute("BEGIN")
+            conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+            conn.execute(f"ALTER TABLE {staging_table_name} RENAME TO {table_name}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            conn.execute(f"DROP TABLE IF EXISTS {staging_table_name}")
+            conn.commit()
+            raise
+
+    DatasetQuery.bump_data_version(table_name)
+    return row_count, len(schema)
 
 
 class PythonCode:
@@ -123,6 +208,7 @@ def run_in_thread(fn, *args, **kwargs):
 
 def on_shutdown_cleanup():
     TrainJobQuery.on_shutdown_cleanup()
+    BacktestJobQuery.on_shutdown_cleanup()
 
 
 def to_dict(obj):
@@ -0,0 +1,119 @@
+import math
+from typing import Dict, List
+import numpy as np
+
+from backtest_pool import create_simulation_task, run_simulation_tasks
+from log import LogExceptionContext
+from manual_backtest import prepare_manual_backtest
+from request_types import BodyCreateWalkForwardBacktest
+
+
+WALK_FORWARD_METRICS = (
+    "result_perc",
+    "cagr",
+    "max_drawdown_perc",
+    "profit_factor",
+    "sharpe_ratio",
+    "sortino_ratio",
+    "trade_count",
+    "buy_and_hold_result_perc",
+)
+
+
+def get_walk_forward_windows(row_count: int, window_count: int, anchored: bool):
+    assert window_count > 0, "Window count must be positive"
+    assert (
+        row_count >= window_count
+    ), f"Can not split {row_count} rows into {window_count} windows"
+
+    boundaries = [
+        math.floor(row_count * i / window_count) for i in range(window_count + 1)
+    ]
+    return [
+        (0 if anchored else boundaries[i], boundaries[i + 1])
+        for i in range(window_count)
+    ]
+
+
+def get_metric_values(windows: List[Dict], metric: str):
+    return [
+        window[metric]
+        for window in windows
+        if window[metric] is not None and math.isfinite(window[metric])
+    ]
+
+
+def get_walk_forward_aggregate(windows: List[Dict], anchored: bool):
+    result_percs = get_metric_values(windows, "result_perc")
+    cagrs = get_metric_values(windows, "cagr")
+    max_drawdowns = get_metric_values(windows, "max_drawdown_perc")
+    profit_factors = get_metric_values(windows, "profit_factor")
+
+    return {
+        "window_count": len(windows),
+        "profitable_windows_perc": sum(1 for res in result_percs if res > 0)
+        / len(windows)
+        * 100,
+        "mean_result_perc": float(np.mean(result_percs)) if result_percs else None,
+        "compounded_result_perc": (
+            float(np.prod([1 + res / 100 for res in result_percs])) - 1
+        )
+        * 100
+        if result_percs and not anchored
+        else None,
+        "mean_cagr": float(np.mean(cagrs)) if cagrs else None,
+        "median_cagr": float(np.median(cagrs)) if cagrs else None,
+        "worst_max_drawdown_perc": min(max_drawdowns) if max_drawdowns else None,
+        "mean_profit_factor": float(np.mean(profit_factors))
+        if profit_factors
+        else None,
+        "trade_count": sum(window["trade_count"] for window in windows),
+    }
+
+
+def run_walk_forward_backtest(body: BodyCreateWalkForwardBacktest):
+    with LogExceptionContext():
+        prepared = prepare_manual_backtest(body.backtest)
+        prices = prepared.prices
+        kline_open_times = prepared.kline_open_times
+
+        windows = get_walk_forward_windows(
+            len(prices), body.window_count, body.anchored
+        )
+        window_results = run_simulation_tasks(
+            [
+                create_simulation_task(
+                    {},
+                    window_start,
+                    window_end,
+                    prices[window_start],
+                    prices[window_end - 1],
+                )
+                for window_start, window_end in windows
+            ],
+            prices,
+            kline_open_times,
+            prepared.signals,
+            prepared.backtest.get_simulation_config(),
+            prepared.high_prices,
+            prepared.low_prices,
+        )
+
+        windows_summary = [
+            {
+                "window_start_time": kline_open_times[window_start],
+                "window_end_time": kline_open_times[window_end - 1],
+                **{
+                    metric: window_result["summary"][metric]
+                    for metric in WALK_FORWARD_METRICS
+                },
+            }
+            for (window_start, window_end), window_result in zip(
+                windows, window_results
+            )
+        ]
+
+        return {
+            "windows": windows_summary,
+            "aggregate": get_walk_forward_aggregate(windows_summary, body.anchored),
+        }
@@ -255,10 +255,97 @@ class URL:
             train_job_id=train_job_id
         )
 
+    @classmethod
+    def run_epoch_backtests(cls, train_job_id: int):
+        return cls._models_route() + ModelRoutePaths.RUN_EPOCH_BACKTESTS.format(
+            train_job_id=train_job_id
+        )
+
     @classmethod
     def create_manual_backtest(cls):
         return cls._backtest_route() + BacktestRoutePaths.BACKTEST
 
+    @classmethod
+    def extend_manual_backtest(cls, backtest_id: int):
+        return cls._backtest_route() + BacktestRoutePaths.EXTEND_BACKTEST.format(
+            backtest_id=backtest_id
+        )
+
+    @classmethod
+    def create_backtest_sweep(cls):
+        return cls._backtest_route() + BacktestRoutePaths.SWEEP
+
+    @classmethod
+    def create_walk_forward_backtest(cls):
+        return cls._backtest_route() + BacktestRoutePaths.WALK_FORWARD
+
+    @classmethod
+    def submit_backtest_job(cls):
+        return cls._backtest_route() + BacktestRoutePaths.JOB
+
+    @classmethod
+    def get_backtest_job(cls, job_id: int):
+        return cls._backtest_route() + BacktestRoutePaths.JOB_BY_ID.format(
+            job_id=job_id
+        )
+
+    @classmethod
+    def cancel_backtest_job(cls, job_id: int):
+        return cls._backtest_route() + BacktestRoutePaths.CANCEL_JOB.format(
+            job_id=job_id
+        )
+
+    @classmethod
+    def create_portfolio_backtest(cls):
+        return cls._backtest_route() + BacktestRoutePaths.PORTFOLIO
+
+    @classmethod
+    def get_backtest_sweep(cls, sweep_id: int):
+        return cls._backtest_route() + BacktestRoutePaths.SWEEP_BY_ID.format(
+            sweep_id=sweep_id
+        )
+
+    @classmethod
+    def get_backtest_by_id(cls, backtest_id: int, columns: str):
+        return (
+            cls._backtest_route()
+            + BacktestRoutePaths.BACKTEST_BY_ID.format(backtest_id=backtest_id)
+            + f"?columns={columns}"
+        )
+
+    @classmethod
+    def get_monte_carlo_analysis(cls, backtest_id: int, iterations: int, method: str):
+        return (
+            cls._backtest_route()
+            + BacktestRoutePaths.MONTE_CARLO.format(backtest_id=backtest_id)
+            + f"?iterations={iterations}&method={method}"
+        )
+
+    @classmethod
+    def get_backtest_balance_history(cls, backtest_id: int, points: int):
+        return (
+            cls._backtest_route()
+            + BacktestRoutePaths.BALANCE_HISTORY.format(backtest_id=backtest_id)
+            + f"?points={points}"
+        )
+
+    @classmethod
+    def get_backtest_trades(cls, backtest_id: int, page_size: int, cursor: str = ""):
+        return (
+            cls._backtest_route()
+            + BacktestRoutePaths.TRADES.format(backtest_id=backtest_id)
+            + f"?page_size={page_size}"
+            + (f"&cursor={cursor}" if cursor else "")
+        )
+
+    @classmethod
+    def get_backtest_summaries(cls, dataset_id: int, sort_by: str):
+        return (
+            cls._backtest_route()
+            + BacktestRoutePaths.SUMMARY
+            + f"?dataset_id={dataset_id}&sort_by={sort_by}"
+        )
+
     @classmethod
     def add_columns_to_dataset(cls, dataset_name: str, null_fill_strategy: str):
         return (
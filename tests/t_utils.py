@@ -1,6 +1,9 @@
 from contextlib import contextmanager
+import json
 import os
+import sqlite3
 import sys
+import time
 from typing import List
 import pandas as pd
 from pandas.core.algorithms import mode
@@ -13,8 +16,7 @@ from tests.t_context import t_file
 sys.path.append(SERVER_SOURCE_DIR)
 
 from config import append_app_data_path
-from constants import BINANCE_DATA_COLS
-from utils import add_to_datasets_db
+from constants import BINANCE_DATA_COLS, AppConstants
 from query_dataset import DatasetQuery
 
 
@@ -46,7 +48,8 @@ def read_csv_to_df(path):
 def t_add_binance_dataset_to_db(dataset: DatasetMetadata):
     df = read_csv_to_df(dataset.path)
     df.columns = BINANCE_DATA_COLS
-    add_to_datasets_db(df, dataset.name)
+    with sqlite3.connect(AppConstants.DB_DATASETS) as conn:
+        df.to_sql(dataset.name, conn, if_exists="replace", index=False)
     DatasetQuery.create_dataset_entry(
         dataset.name, dataset.timeseries_col, dataset.target_col, dataset.price_col
     )
@@ -124,6 +127,16 @@ def create_backtest_body(
     }
 
 
+def wait_for_backtest_job(job_id: int, pending_statuses):
+    job = Fetch.get_backtest_job(job_id)
+    for _ in range(100):
+        if job["status"] not in pending_statuses:
+            break
+        time.sleep(0.1)
+        job = Fetch.get_backtest_job(job_id)
+    return job
+
+
 class Fetch:
     @staticmethod
     def get_tables():
@@ -176,6 +189,50 @@ class Fetch:
         with Req("get", URL.get_datasets_manual_backtests(dataset_id)) as res:
             return res.json()["data"]
 
+    @staticmethod
+    def get_backtest_by_id(backtest_id: int, columns: List[str]):
+        with Req(
+            "get", URL.get_backtest_by_id(backtest_id, json.dumps(columns))
+        ) as res:
+            return res.json()["data"]
+
+    @staticmethod
+    def get_monte_carlo_analysis(backtest_id: int, iterations: int, method: str):
+        with Req(
+            "get", URL.get_monte_carlo_analysis(backtest_id, iterations, method)
+        ) as res:
+            return res.json()["data"]
+
+    @staticmethod
+    def get_backtest_balance_history(backtest_id: int, points: int):
+        with Req("get", URL.get_backtest_balance_history(backtest_id, points)) as res:
+            return res.json()["data"]
+
+    @staticmethod
+    def get_backtest_trades(backtest_id: int, page_size: int, cursor=None):
+        with Req(
+            "get",
+            URL.get_backtest_trades(
+                backtest_id, page_size, json.dumps(cursor) if cursor else ""
+            ),
+        ) as res:
+            return res.json()
+
+    @staticmethod
+    def get_backtest_summaries(dataset_id: int, sort_by: str):
+        with Req("get", URL.get_backtest_summaries(dataset_id, sort_by)) as res:
+            return res.json()
+
+    @staticmethod
+    def get_backtest_job(job_id: int):
+        with Req("get", URL.get_backtest_job(job_id)) as res:
+            return res.json()["data"]
+
+    @staticmethod
+    def get_backtest_sweep(sweep_id: int):
+        with Req("get", URL.get_backtest_sweep(sweep_id)) as res:
+            return res.json()
+
     @staticmethod
     def get_preset_by_id(id: int):
         with Req("get", URL.get_preset_by_id(id)) as res:
@@ -229,11 +286,46 @@ class Post:
         with Req("post", URL.create_model_backtest(train_job_id), json=body) as res:
             return res
 
+    @staticmethod
+    def run_epoch_backtests(train_job_id, body):
+        with Req("post", URL.run_epoch_backtests(train_job_id), json=body) as res:
+            return res.json()["id"]
+
     @staticmethod
     def create_manual_backtest(body):
         with Req("post", URL.create_manual_backtest(), json=body) as res:
             return res
 
+    @staticmethod
+    def extend_manual_backtest(backtest_id: int):
+        with Req("post", URL.extend_manual_backtest(backtest_id)) as res:
+            return res.json()["data"]
+
+    @staticmethod
+    def create_backtest_sweep(body):
+        with Req("post", URL.create_backtest_sweep(), json=body) as res:
+            return res.json()["data"]
+
+    @staticmethod
+    def create_walk_forward_backtest(body):
+        with Req("post", URL.create_walk_forward_backtest(), json=body) as res:
+            return res.json()["data"]
+
+    @staticmethod
+    def submit_backtest_job(body):
+        with Req("post", URL.submit_backtest_job(), json=body) as res:
+            return res.json()["id"]
+
+    @staticmethod
+    def cancel_backtest_job(job_id: int):
+        with Req("post", URL.cancel_backtest_job(job_id)) as res:
+            return res.json()["data"]
+
+    @staticmethod
+    def create_portfolio_backtest(body):
+        with Req("post", URL.create_portfolio_backtest(), json=body) as res:
+            return res.json()["data"]
+
     @staticmethod
     def create_code_preset(body):
         with Req("post", URL.create_code_preset(), json=body) as res:
@@ -1,4 +1,8 @@
+import sqlite3
+import sys
+import time
 import pytest
+import requests
 
 from tests.fixtures import (
     close_long_trade_cond_basic,
@@ -7,7 +11,13 @@ from tests.fixtures import (
     open_long_trade_cond_basic,
     open_short_trade_cond_basic,
 )
-from tests.t_utils import Fetch, Post
+from tests.t_conf import SERVER_SOURCE_DIR
+from tests.t_utils import Fetch, Post, read_csv_to_df, wait_for_backtest_job
+
+sys.path.append(SERVER_SOURCE_DIR)
+
+from backtest_jobs import MAX_CONCURRENT_BACKTEST_JOBS
+from constants import BINANCE_DATA_COLS, AppConstants
 
 
 @pytest.mark.acceptance
@@ -33,3 +43,393 @@ def test_fetch_backtests(fixt_manual_backtest):
     dataset = Fetch.get_dataset_by_name(fixt_manual_backtest.name)
     backtests = Fetch.get_datasets_manual_backtests(dataset["id"])
     assert len(backtests) == 1, "Backtest wasnt created or fetches succesfully"
+
+
+@pytest.mark.acceptance
+def test_fetch_backtest_balance_history_columns(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    backtest = Post.create_manual_backtest(
+        create_full_manual_backtest(dataset["id"])
+    ).json()["data"]
+
+    balance_history = Fetch.get_backtest_by_id(
+        backtest["id"], ["portfolio_worth", "kline_open_time"]
+    )["data"]
+
+    assert len(balance_history) == len(backtest["data"])
+    assert set(balance_history[0].keys()) == {"portfolio_worth", "kline_open_time"}
+
+
+@pytest.mark.acceptance
+def test_fetch_downsampled_balance_history(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    backtest = Post.create_manual_backtest(
+        create_full_manual_backtest(dataset["id"])
+    ).json()["data"]
+
+    balance_history = Fetch.get_backtest_balance_history(backtest["id"], 100)
+    kline_open_times = [balance["kline_open_time"] for balance in balance_history]
+
+    assert len(balance_history) == min(100, len(backtest["data"]))
+    assert kline_open_times == sorted(kline_open_times)
+    assert kline_open_times[0] == backtest["data"][0]["kline_open_time"]
+    assert kline_open_times[-1] == backtest["data"][-1]["kline_open_time"]
+
+
+@pytest.mark.acceptance
+def test_fetch_backtest_trades_paginated(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    backtest = Post.create_manual_backtest(
+        create_full_manual_backtest(dataset["id"])
+    ).json()["data"]
+
+    trades = []
+    cursor = None
+    while True:
+        page = Fetch.get_backtest_trades(backtest["id"], 5, cursor)
+        trades += page["data"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    close_times = [trade["close_time"] for trade in trades]
+    assert len(trades) == backtest["trade_count"]
+    assert close_times == sorted(close_times)
+
+
+@pytest.mark.acceptance
+def test_fetch_backtest_summaries(fixt_manual_backtest):
+    dataset = Fetch.get_dataset_by_name(fixt_manual_backtest.name)
+    summaries = Fetch.get_backtest_summaries(dataset["id"], "cagr")
+
+    assert summaries["total_count"] == 1
+    assert "data" not in summaries["data"][0]
+
+
+@pytest.mark.acceptance
+def test_identical_backtest_is_served_from_cache(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    backtest_body = create_full_manual_backtest(dataset["id"])
+
+    first = Post.create_manual_backtest(backtest_body).json()["data"]
+    second = Post.create_manual_backtest(backtest_body).json()["data"]
+
+    assert first["id"] == second["id"]
+    assert len(Fetch.get_datasets_manual_backtests(dataset["id"])) == 1
+
+
+def create_full_manual_backtest(dataset_id: int):
+    backtest_body = create_manual_backtest(
+        dataset_id,
+        True,
+        open_long_trade_cond_basic(),
+        open_short_trade_cond_basic(),
+        close_long_trade_cond_basic(),
+        close_short_trade_cond_basic(),
+        False,
+        0.1,
+        0.01,
+    )
+    backtest_body.update(
+        {
+            "backtest_data_range": [0, 100],
+            "use_profit_based_close": True,
+            "use_stop_loss_based_close": True,
+            "short_fee_hourly": 0.0,
+            "take_profit_threshold_perc": 0.0,
+            "stop_loss_threshold_perc": 0.0,
+        }
+    )
+    return backtest_body
+
+
+def fetch_all_backtest_trades(backtest_id: int):
+    trades = []
+    cursor = None
+    while True:
+        page = Fetch.get_backtest_trades(backtest_id, 1000, cursor)
+        trades += page["data"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return [
+                {key: value for key, value in trade.items() if key != "id"}
+                for trade in trades
+            ]
+
+
+def assert_vectorized_conditions_match_row_conditions(backtest_body):
+    row_backtest = Post.create_manual_backtest(
+        {**backtest_body, "use_vectorized_conditions": False}
+    ).json()["data"]
+    vectorized_backtest = Post.create_manual_backtest(
+        {**backtest_body, "use_vectorized_conditions": True}
+    ).json()["data"]
+
+    row_trades = fetch_all_backtest_trades(row_backtest["id"])
+    assert row_trades == fetch_all_backtest_trades(vectorized_backtest["id"])
+    assert row_backtest["end_balance"] == vectorized_backtest["end_balance"]
+    assert row_backtest["data"] == vectorized_backtest["data"]
+    return row_trades
+
+
+@pytest.mark.acceptance
+def test_vectorized_conditions_match_row_conditions(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    backtest_body = create_full_manual_backtest(dataset["id"])
+    assert_vectorized_conditions_match_row_conditions(backtest_body)
+
+    # same conditions with thresholds the dataset crosses, so shorts are opened
+    backtest_body["open_short_trade_cond"] = open_short_trade_cond_basic().replace(
+        "20000", "26000"
+    )
+    backtest_body["close_short_trade_cond"] = close_short_trade_cond_basic().replace(
+        "18000", "25500"
+    )
+    trades = assert_vectorized_conditions_match_row_conditions(backtest_body)
+    assert any(trade["direction"] == "short" for trade in trades)
+
+
+def write_fixture_rows(dataset_name: str, df, if_exists: str):
+    with sqlite3.connect(AppConstants.DB_DATASETS) as conn:
+        df.to_sql(dataset_name, conn, if_exists=if_exists, index=False)
+
+
+def read_fixture_df(path: str):
+    df = read_csv_to_df(path)
+    df.columns = BINANCE_DATA_COLS
+    return df
+
+
+@pytest.mark.acceptance
+def test_extended_backtest_matches_full_backtest(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    df = read_fixture_df(fixt_btc_small_1h.path)
+    truncate_idx = len(df) // 2
+
+    write_fixture_rows(fixt_btc_small_1h.name, df.iloc[:truncate_idx], "replace")
+    backtest = Post.create_manual_backtest(
+        create_full_manual_backtest(dataset["id"])
+    ).json()["data"]
+
+    write_fixture_rows(fixt_btc_small_1h.name, df.iloc[truncate_idx:], "append")
+    extended_backtest = Post.extend_manual_backtest(backtest["id"])
+    full_backtest = Post.create_manual_backtest(
+        create_full_manual_backtest(dataset["id"])
+    ).json()["data"]
+
+    def strip_backtest_id(trades):
+        return [
+            {key: value for key, value in trade.items() if key != "backtest_id"}
+            for trade in trades
+        ]
+
+    assert full_backtest["id"] != backtest["id"]
+    assert len(extended_backtest["data"]) == len(df)
+    assert extended_backtest["trade_count"] == full_backtest["trade_count"]
+    assert extended_backtest["end_balance"] == full_backtest["end_balance"]
+    assert strip_backtest_id(
+        fetch_all_backtest_trades(backtest["id"])
+    ) == strip_backtest_id(fetch_all_backtest_trades(full_backtest["id"]))
+
+
+@pytest.mark.acceptance
+def test_extend_backtest_after_simulated_rows_are_edited(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    df = read_fixture_df(fixt_btc_small_1h.path)
+    truncate_idx = len(df) // 2
+
+    write_fixture_rows(fixt_btc_small_1h.name, df.iloc[:truncate_idx], "replace")
+    backtest = Post.create_manual_backtest(
+        create_full_manual_backtest(dataset["id"])
+    ).json()["data"]
+
+    Post.exec_python_on_dataset(
+        fixt_btc_small_1h.name,
+        body={"code": "dataset['open_price'] = dataset['open_price'] * 1.1\n"},
+    )
+    write_fixture_rows(fixt_btc_small_1h.name, df.iloc[truncate_idx:], "append")
+
+    with pytest.raises(requests.HTTPError):
+        Post.extend_manual_backtest(backtest["id"])
+
+
+@pytest.mark.acceptance
+def test_backtest_sweep(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+
+    sweep_id = Post.create_backtest_sweep(
+        {
+            "backtest": create_full_manual_backtest(dataset["id"]),
+            "take_profit_threshold_perc": {"start": 1, "end": 3, "step": 1},
+            "stop_loss_threshold_perc": {"start": 1, "end": 2, "step": 1},
+        }
+    )
+    sweep = Fetch.get_backtest_sweep(sweep_id)
+    result_percs = [backtest["result_perc"] for backtest in sweep["backtests"]]
+
+    assert len(result_percs) == 6, "Sweep did not run every parameter combination"
+    assert result_percs == sorted(result_percs, reverse=True)
+    assert len(Fetch.get_datasets_manual_backtests(dataset["id"])) == 0
+
+
+@pytest.mark.acceptance
+def test_intra_candle_thresholds(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    backtest_body = create_full_manual_backtest(dataset["id"])
+    backtest_body.update(
+        {"take_profit_threshold_perc": 2.0, "stop_loss_threshold_perc": 1.0}
+    )
+
+    close_only = Post.create_manual_backtest(backtest_body).json()["data"]
+    intra_candle = Post.create_manual_backtest(
+        {**backtest_body, "use_intra_candle_thresholds": True}
+    ).json()["data"]
+    trades = Fetch.get_backtest_trades(intra_candle["id"], 1000)["data"]
+
+    def closed_at_threshold(trade):
+        sign = 1 if trade["direction"] == "long" else -1
+        return any(
+            trade["close_price"]
+            == pytest.approx(trade["open_price"] * (1 + sign * threshold))
+            for threshold in (0.02, -0.01)
+        )
+
+    assert intra_candle["use_intra_candle_thresholds"] is True
+    assert close_only["use_intra_candle_thresholds"] is False
+    assert any(
+        closed_at_threshold(trade) for trade in trades
+    ), "No trade was closed at its take profit or stop loss price"
+    assert all(
+        trade["percent_result"] >= -1.5 for trade in trades
+    ), "Stop loss was not applied inside the candle"
+
+
+@pytest.mark.acceptance
+def test_walk_forward_backtest(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+
+    walk_forward = Post.create_walk_forward_backtest(
+        {
+            "backtest": create_full_manual_backtest(dataset["id"]),
+            "window_count": 4,
+        }
+    )
+
+    assert len(walk_forward["windows"]) == 4
+    assert walk_forward["aggregate"]["trade_count"] == sum(
+        window["trade_count"] for window in walk_forward["windows"]
+    )
+
+
+@pytest.mark.acceptance
+def test_monte_carlo_analysis(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    backtest = Post.create_manual_backtest(
+        create_full_manual_backtest(dataset["id"])
+    ).json()["data"]
+
+    bootstrap = Fetch.get_monte_carlo_analysis(backtest["id"], 2000, "bootstrap")
+    shuffle = Fetch.get_monte_carlo_analysis(backtest["id"], 2000, "shuffle")
+
+    assert bootstrap["trade_count"] == backtest["trade_count"]
+    assert bootstrap["end_balance"]["5"] <= bootstrap["end_balance"]["95"]
+    assert shuffle["end_balance"]["5"] == pytest.approx(shuffle["end_balance"]["95"])
+    assert all(value <= 0 for value in shuffle["max_drawdown_perc"].values())
+
+
+@pytest.mark.acceptance
+def test_backtest_job(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    job_id = Post.submit_backtest_job(create_full_manual_backtest(dataset["id"]))
+
+    job = Fetch.get_backtest_job(job_id)
+    for _ in range(100):
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.1)
+        job = Fetch.get_backtest_job(job_id)
+
+    assert job["status"] == "completed", job["error"]
+    assert job["progress_perc"] == 100
+    assert Fetch.get_backtest_by_id(job["backtest_id"], None)["data"] is not None
+
+
+def create_slow_manual_backtest(dataset_id: int):
+    backtest_body = create_full_manual_backtest(dataset_id)
+    backtest_body["use_vectorized_conditions"] = False
+    backtest_body["open_long_trade_cond"] = (
+        "def open_long_trade(tick):\n"
+        "    import time\n"
+        "    time.sleep(0.01)\n"
+        "    return tick['open_price'] > 25000"
+    )
+    return backtest_body
+
+
+@pytest.mark.acceptance
+def test_cancel_backtest_job(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    job_id = Post.submit_backtest_job(create_slow_manual_backtest(dataset["id"]))
+
+    assert wait_for_backtest_job(job_id, ("queued",))["status"] == "running"
+    Post.cancel_backtest_job(job_id)
+
+    # the row-wise signals take seconds, so the job is stopped before its simulation
+    job = wait_for_backtest_job(job_id, ("running",))
+    assert job["status"] == "cancelled"
+    assert job["backtest_id"] is None
+    assert job["progress_perc"] < 50
+
+
+@pytest.mark.acceptance
+def test_backtest_job_concurrency_limit(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    job_ids = [
+        Post.submit_backtest_job(create_slow_manual_backtest(dataset["id"]))
+        for _ in range(MAX_CONCURRENT_BACKTEST_JOBS + 1)
+    ]
+
+    jobs = [
+        wait_for_backtest_job(job_id, ("queued",))
+        for job_id in job_ids[:MAX_CONCURRENT_BACKTEST_JOBS]
+    ]
+    assert all(job["status"] == "running" for job in jobs)
+    assert Fetch.get_backtest_job(job_ids[-1])["status"] == "queued"
+
+    for job_id in reversed(job_ids):
+        Post.cancel_backtest_job(job_id)
+    jobs = [wait_for_backtest_job(job_id, ("queued", "running")) for job_id in job_ids]
+    assert all(job["status"] == "cancelled" for job in jobs)
+
+
+@pytest.mark.acceptance
+def test_portfolio_backtest(cleanup_db, fixt_btc_small_1h):
+    dataset = Fetch.get_dataset_by_name(fixt_btc_small_1h.name)
+    asset = {
+        "dataset_id": dataset["id"],
+        "open_long_trade_cond": open_long_trade_cond_basic(),
+        "close_long_trade_cond": close_long_trade_cond_basic(),
+        "open_short_trade_cond": open_short_trade_cond_basic(),
+        "close_short_trade_cond": close_short_trade_cond_basic(),
+    }
+
+    backtest = Post.create_portfolio_backtest(
+        {
+            "name": "portfolio",
+            "assets": [asset, {**asset, "weight": 3}],
+            "use_short_selling": True,
+            "trading_fees_perc": 0.1,
+            "slippage_perc": 0.01,
+            "short_fee_hourly": 0.001,
+            "rebalance_interval": 24,
+        }
+    )
+    trades = Fetch.get_backtest_trades(backtest["id"], 1000)["data"]
+
+    assert backtest["start_balance"] == 10000
+    assert len(backtest["data"]) > 0
+    assert backtest["trade_count"] == len(trades)
+    assert all(trade["dataset_id"] == dataset["id"] for trade in trades)
+
+    with pytest.raises(requests.HTTPError):
+        Fetch.get_monte_carlo_analysis(backtest["id"], 2000, "bootstrap")
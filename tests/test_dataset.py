@@ -1,5 +1,10 @@
+import asyncio
+from contextlib import closing
 from typing import List
+import pandas as pd
 import pytest
+import requests
+import sqlite3
 import sys
 
 from decimal import Decimal
@@ -19,8 +24,10 @@ from tests.t_utils import (
 
 sys.path.append(SERVER_SOURCE_DIR)
 
+import api_binance
+from dataset import get_col_prefix
 from utils import PythonCode
-from constants import NullFillStrategy
+from constants import BINANCE_DATA_COLS, AppConstants, NullFillStrategy
 
 
 @pytest.mark.acceptance
@@ -200,6 +207,26 @@ def test_route_dataset_add_cols_fill_closest(
         assert value == 0
 
 
+@pytest.mark.acceptance
+def test_route_dataset_add_existing_cols(
+    cleanup_db, fixt_btc_small_1h: DatasetMetadata
+):
+    dataset_name = fixt_btc_small_1h.name
+    payload = []
+    add_object_to_add_cols_payload(payload, dataset_name, [BinanceCols.CLOSE_PRICE])
+    Post.add_columns(dataset_name, body=payload)
+    columns = Fetch.get_dataset_by_name(dataset_name)["columns"]
+
+    payload = []
+    add_object_to_add_cols_payload(
+        payload, dataset_name, [BinanceCols.HIGH_PRICE, BinanceCols.CLOSE_PRICE]
+    )
+    with pytest.raises(requests.HTTPError):
+        Post.add_columns(dataset_name, body=payload)
+
+    assert Fetch.get_dataset_by_name(dataset_name)["columns"] == columns
+
+
 @pytest.mark.acceptance
 def test_route_exec_python(cleanup_db, fixt_btc_small_1h: DatasetMetadata):
     res_open_price = Fetch.get_dataset_col_info(
@@ -287,6 +314,48 @@ def test_route_exec_python_on_dataset(cleanup_db, fixt_btc_small_1h: DatasetMeta
             )
 
 
+@pytest.mark.acceptance
+def test_dataset_reads_are_not_stale(cleanup_db, fixt_btc_small_1h: DatasetMetadata):
+    dataset_name = fixt_btc_small_1h.name
+    open_prices = Fetch.get_dataset_col_info(dataset_name, BinanceCols.OPEN_PRICE)[0][
+        "rows"
+    ]
+
+    Post.exec_python_on_col(
+        dataset_name,
+        BinanceCols.OPEN_PRICE,
+        body={
+            "code": f"dataset[{PythonCode.COLUMN_SYMBOL}] = dataset[{PythonCode.COLUMN_SYMBOL}] * 3\n",
+        },
+    )
+    tripled_open_prices = Fetch.get_dataset_col_info(
+        dataset_name, BinanceCols.OPEN_PRICE
+    )[0]["rows"]
+    assert tripled_open_prices == [price * 3 for price in open_prices]
+
+    close_prices = Fetch.get_dataset_col_info(dataset_name, BinanceCols.CLOSE_PRICE)[0][
+        "rows"
+    ]
+    payload = []
+    add_object_to_add_cols_payload(payload, dataset_name, [BinanceCols.CLOSE_PRICE])
+    Post.add_columns(dataset_name, body=payload)
+    added_col_name = get_col_prefix(dataset_name) + BinanceCols.CLOSE_PRICE
+    assert (
+        Fetch.get_dataset_col_info(dataset_name, added_col_name)[0]["rows"]
+        == close_prices
+    )
+
+    RENAMED_COL_NAME = "renamed_close_price"
+    Post.rename_column(
+        dataset_name,
+        {"old_col_name": BinanceCols.CLOSE_PRICE, "new_col_name": RENAMED_COL_NAME},
+    )
+    assert (
+        Fetch.get_dataset_col_info(dataset_name, RENAMED_COL_NAME)[0]["rows"]
+        == close_prices
+    )
+
+
 @pytest.mark.acceptance
 def test_route_create_model(cleanup_db, fixt_btc_small_1h: DatasetMetadata):
     body = create_model_body(
@@ -330,3 +399,50 @@ def test_dataset_pagination(cleanup_db, fixt_btc_small_1h: DatasetMetadata):
 def test_delete_datasets(cleanup_db, fixt_add_all_downloaded_datasets):
     datasets = [item.name for item in fixt_add_all_downloaded_datasets]
     Delete.datasets({"dataset_names": datasets})
+
+
+@pytest.mark.acceptance
+def test_append_new_klines_keeps_user_columns(
+    cleanup_db, fixt_btc_small_1h: DatasetMetadata, monkeypatch
+):
+    table_name = fixt_btc_small_1h.name
+    with sqlite3.connect(AppConstants.DB_DATASETS) as conn:
+        conn.execute(f"ALTER TABLE {table_name} ADD COLUMN user_col REAL")
+        conn.execute(f"UPDATE {table_name} SET user_col = open_price * 2")
+        stored_df = pd.read_sql_query(
+            f"SELECT * FROM {table_name} ORDER BY kline_open_time", conn
+        )
+
+    last_open_time = int(stored_df[BinanceCols.KLINE_OPEN_TIME].iloc[-1])
+    candle_size = last_open_time - int(stored_df[BinanceCols.KLINE_OPEN_TIME].iloc[-2])
+    kline_cols = [
+        col for col in BINANCE_DATA_COLS if col not in ("ignore", "kline_close_time")
+    ]
+    fetched_klines = pd.concat([stored_df.tail(1)] * 3, ignore_index=True)[kline_cols]
+    fetched_klines[BinanceCols.KLINE_OPEN_TIME] = [
+        last_open_time + i * candle_size for i in range(3)
+    ]
+    fetched_klines[BinanceCols.CLOSE_PRICE] = [1.0, 2.0, 3.0]
+
+    async def get_historical_klines(symbol, interval, start_time):
+        assert start_time == last_open_time
+        return fetched_klines
+
+    monkeypatch.setattr(api_binance, "get_historical_klines", get_historical_klines)
+    with closing(sqlite3.connect(AppConstants.DB_DATASETS)) as conn:
+        new_kline_count = asyncio.run(
+            api_binance.append_new_klines("BTCUSDT", "1h", table_name, conn)
+        )
+        updated_df = pd.read_sql_query(
+            f"SELECT * FROM {table_name} ORDER BY kline_open_time", conn
+        )
+
+    assert new_kline_count == 2
+    assert len(updated_df) == len(stored_df) + 2
+    assert updated_df[BinanceCols.CLOSE_PRICE].tolist()[-3:] == [1.0, 2.0, 3.0]
+    pd.testing.assert_frame_equal(
+        updated_df.drop(columns=[BinanceCols.CLOSE_PRICE]).iloc[: len(stored_df)],
+        stored_df.drop(columns=[BinanceCols.CLOSE_PRICE]),
+        check_dtype=False,
+    )
+    assert updated_df["user_col"].iloc[-2:].isna().all()
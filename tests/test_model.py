@@ -1,9 +1,10 @@
+import json
 import pytest
 from tests.fixtures import NUM_EPOCHS_DEFAULT, create_backtest, create_train_job_basic
 from tests.t_conf import SERVER_SOURCE_DIR
 from tests.t_constants import Constants, DatasetMetadata
 
-from tests.t_utils import Fetch, Post
+from tests.t_utils import Fetch, Post, wait_for_backtest_job
 
 import sys
 
@@ -62,3 +63,22 @@ def test_route_fetch_all_metadata_by_name(cleanup_db, create_train_job):
 def test_route_create_backtest(cleanup_db, create_train_job):
     train_job = create_train_job[2]
     Post.create_model_backtest(train_job.id, create_backtest(create_train_job[0].name))
+
+
+@pytest.mark.acceptance
+def test_route_run_epoch_backtests(cleanup_db, create_train_job):
+    train_job = create_train_job[2]
+    body = create_backtest(create_train_job[0].name)
+    del body["epoch_nr"]
+
+    job = wait_for_backtest_job(
+        Post.run_epoch_backtests(train_job.id, body), ("queued", "running")
+    )
+    assert job["status"] == "completed", job["error"]
+    epoch_backtests = json.loads(job["result"])
+
+    epochs = [backtest["epoch"] for backtest in epoch_backtests]
+
+    assert len(epochs) > 0
+    assert epochs == sorted(epochs)
+    assert all(backtest["end_balance"] is not None for backtest in epoch_backtests)
@@ -0,0 +1,35 @@
+import sys
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from tests.t_conf import SERVER_SOURCE_DIR
+
+sys.path.append(SERVER_SOURCE_DIR)
+
+from orm import Base, Session, create_tables
+from query_dataset import Dataset
+
+
+@pytest.mark.acceptance
+def test_create_tables_adds_missing_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'datasets_util.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE dataset (id INTEGER NOT NULL, dataset_name VARCHAR, PRIMARY KEY (id))"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO dataset (id, dataset_name) VALUES (1, 'old_dataset')"
+        )
+
+    create_tables(engine)
+    create_tables(engine)
+
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        assert columns == {column.name for column in table.columns}
+
+    with Session(bind=engine) as session:
+        dataset = session.query(Dataset).one()
+        assert dataset.dataset_name == "old_dataset"
+        assert dataset.data_version is None